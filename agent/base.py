@@ -1,8 +1,16 @@
 from environment import GameState, GameAction
 from abc import ABC, abstractmethod
+from typing import Sequence
+import numpy as np
 
 
 class Agent(ABC):
     @abstractmethod
     def decide(self, state: GameState) -> GameAction:
         pass
+
+    def decide_many(self, states: np.ndarray | Sequence[GameState]) -> np.ndarray:
+        # Array of GameAction by states, agents with vectorized decisions override it
+        actions = np.empty(len(states), dtype=object)
+        actions[:] = [self.decide(state) for state in states]
+        return actions
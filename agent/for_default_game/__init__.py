@@ -1,2 +1,3 @@
 from .by_basic_strategy import AgentForDefaultGameByBasicStrategy
-from .by_q_table import AgentForDefaultGameByQTable, QTableStatesParser4DefaultGame
+from .by_q_table import AgentForDefaultGameByQTable, AgentForDefaultGameByCompiledPolicy, QTableStatesParser4DefaultGame
+from .by_exact_ev import AgentForDefaultGameByExactEV
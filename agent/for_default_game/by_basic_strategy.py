@@ -1,11 +1,23 @@
 from ..base import Agent
 from environment import GameAction
 from environment.default_game import DefaultGameState
+from typing import Sequence
+import numpy as np
 
 
 class AgentForDefaultGameByBasicStrategy(Agent):
+    __ACTIONS = (GameAction.STAND, GameAction.HIT)
+
     def __init__(self, ignore_probabilities: bool = False):
         self.__ignore_probabilities = ignore_probabilities
+        # Action indices of the strategies by (soft hand, player cards sum, dealer open card) for 'decide_many'
+        self.__STRATEGIES = np.array([
+            [
+                [self.__ACTIONS.index(strategy(player=player, dealer=dealer)) for dealer in range(16)]
+                for player in range(32)
+            ]
+            for strategy in (self.hard_hand_strategy, self.soft_hand_strategy)
+        ], dtype=np.uint8)
 
     @staticmethod
     def soft_hand_strategy(player: int, dealer: int) -> GameAction:
@@ -47,3 +59,18 @@ class AgentForDefaultGameByBasicStrategy(Agent):
             return GameAction.HIT
 
         return base_strategy(player=player, dealer=dealer)
+
+    def decide_many(self, states: np.ndarray | Sequence[DefaultGameState]) -> np.ndarray:
+        keys = DefaultGameState.pack_many(states)
+        player = keys >> 5 & 0x1F
+        actions = self.__STRATEGIES[keys >> 10 & 0x1, player, keys >> 18 & 0xF]
+
+        if not self.__ignore_probabilities:  # As 'decide' checks them, the first passed check decides
+            player_busting = (keys >> 11 & 0x7F) / 100
+            dealer_less_than_17 = (keys >> 22 & 0x7F) / 100
+            dealer_busting = (keys >> 29 & 0x7F) / 100
+            is_hit = (dealer_busting > 0.8) & (player < 16) & (player_busting < 0.3)
+            is_stand = (player_busting > 0.7) | ((player_busting > 0.35) & (dealer_less_than_17 < 0.6))
+            actions[is_hit] = 1
+            actions[is_stand] = 0
+        return np.array(self.__ACTIONS, dtype=object)[actions]
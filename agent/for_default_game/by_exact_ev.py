@@ -0,0 +1,21 @@
+from ..base import Agent
+from environment import GameAction
+from environment.base import CardDeck, Card, AceCard
+from environment.default_game import DefaultGame, DefaultGameState
+from environment.expected_value_tools import calculate_expected_values, is_hit_dominant
+
+
+class AgentForDefaultGameByExactEV(Agent):
+    # Needs the game itself: the state has no rank composition. States must be taken from this game just before
+    def __init__(self, game: DefaultGame):
+        self.__GAME = game
+
+    def decide(self, state: DefaultGameState) -> GameAction:
+        if is_hit_dominant(state.player_cards_sum, bool(state.player_has_soft_hand)):
+            return GameAction.HIT
+        expected_values = calculate_expected_values(
+            self.__GAME.unseen_rank_counts, state.player_cards_sum, bool(state.player_has_soft_hand),
+            CardDeck.get_rank_index(AceCard() if state.dealer_open_card in (1, 11) else Card(state.dealer_open_card)),
+            hit_on_soft_17=self.__GAME.dealer_hit_on_soft_17,
+        )
+        return GameAction.HIT if expected_values.hit > expected_values.stand else GameAction.STAND
@@ -3,6 +3,8 @@ from environment import GameState, GameAction
 from environment.default_game import DefaultGameState
 from learning_engine.q_learning import QTable
 from learning_engine.q_learning.misc_tools import QTableStatesParser
+from typing import Sequence
+import numpy as np
 
 
 class QTableStatesParser4DefaultGame(QTableStatesParser):
@@ -12,49 +14,206 @@ class QTableStatesParser4DefaultGame(QTableStatesParser):
         player_has_soft_hand: int
         dealer_open_card: int
 
-    def __init__(self, q_table: QTable):
-        super().__init__(q_table)
-        self.__NEW_TO_OLD: dict[QTableStatesParser4DefaultGame._ShortDefaultGameState, list[DefaultGameState]] = {}
-
-    def __compute_new_to_old_if_clean(self):
-        if self.__NEW_TO_OLD:
-            return
-        for full_old_state in self._ORIGIN_STATES:
-            self.__NEW_TO_OLD.setdefault(self._ShortDefaultGameState(
-                player_cards_qty=full_old_state.player_cards_qty,
-                player_cards_sum=full_old_state.player_cards_sum,
-                player_has_soft_hand=full_old_state.player_has_soft_hand,
-                dealer_open_card=full_old_state.dealer_open_card,
-            ), list()).append(full_old_state)
-
-    def _calculate_distances(self, target_state: DefaultGameState) -> dict[DefaultGameState, float]:
-        self.__compute_new_to_old_if_clean()
-
-        target_short_state = self._ShortDefaultGameState(
-            player_cards_qty=target_state.player_cards_qty,
-            player_cards_sum=target_state.player_cards_sum,
-            player_has_soft_hand=target_state.player_has_soft_hand,
-            dealer_open_card=target_state.dealer_open_card,
+    def _get_bucket(self, state: DefaultGameState) -> _ShortDefaultGameState:
+        return self._ShortDefaultGameState(
+            player_cards_qty=state.player_cards_qty,
+            player_cards_sum=state.player_cards_sum,
+            player_has_soft_hand=state.player_has_soft_hand,
+            dealer_open_card=state.dealer_open_card,
         )
 
-        return {
-            state: abs(
-                state.player_busting_probability - target_state.player_busting_probability
-            ) + abs(
-                state.dealer_cards_sum_less_than_17_probability - target_state.dealer_cards_sum_less_than_17_probability
-            ) + abs(
-                state.dealer_busting_probability - target_state.dealer_busting_probability
-            )
-            for state in self.__NEW_TO_OLD[target_short_state]
-        }
+    def _get_coordinates(self, state: DefaultGameState) -> tuple[float, float, float]:
+        return (
+            state.player_busting_probability,
+            state.dealer_cards_sum_less_than_17_probability,
+            state.dealer_busting_probability,
+        )
 
 
 class AgentForDefaultGameByQTable(Agent):
-    def __init__(self, q_table: QTable):
+    def __init__(self, q_table: QTable, packed_states=False):
+        # With 'packed_states' both the Q-Table and decided states are 'DefaultGameState.pack' keys.
+        # The Q-Table may be trained meanwhile: values are read from it on every decision, states lookups are rebuilt
+        # when its states qty changes
         self.__Q_TABLE = q_table
-        self.__PARSER = QTableStatesParser4DefaultGame(q_table)
+        self.__PACKED_STATES = packed_states
+        self.__parser: QTableStatesParser4DefaultGame | None = None  # Built by the first unknown state
+        self.__keys_index: tuple[np.ndarray, np.ndarray] | None = None  # Built by the first 'decide_many'
+        self.__indexed_states_qty = len(q_table)
+
+    def __drop_outdated_indices(self):
+        if len(self.__Q_TABLE) != self.__indexed_states_qty:
+            self.__indexed_states_qty = len(self.__Q_TABLE)
+            self.__parser = None
+            self.__keys_index = None
+
+    def __get_parser(self) -> QTableStatesParser4DefaultGame:
+        self.__drop_outdated_indices()
+        if self.__parser is None:
+            self.__parser = QTableStatesParser4DefaultGame(
+                self.__Q_TABLE.map_states(DefaultGameState.unpack) if self.__PACKED_STATES else self.__Q_TABLE
+            )
+        return self.__parser
 
     def decide(self, state: GameState) -> GameAction:
         if state not in self.__Q_TABLE:
-            state = self.__PARSER.find_closest_state(state)
+            if self.__PACKED_STATES:
+                state = self.__get_parser().find_closest_state(DefaultGameState.unpack(state)).pack()
+            else:
+                state = self.__get_parser().find_closest_state(state)
         return self.__Q_TABLE.get_best_action(state)
+
+    def __get_keys_index(self) -> tuple[np.ndarray, np.ndarray]:
+        # Sorted 'pack' keys of the Q-Table states and their rows. States with probabilities not kept by 'pack' exactly
+        # are left out, states quantized to them are decided as unseen ones
+        self.__drop_outdated_indices()
+        if self.__keys_index is None:
+            states = list(self.__Q_TABLE.to_dict())
+            keys = DefaultGameState.pack_many(states) if states else np.empty(0, dtype=np.int64)
+            rows = np.array(list(map(self.__Q_TABLE.get_row, states)), dtype=np.int64)
+            if not self.__PACKED_STATES and states:
+                probabilities = np.array(states, dtype=np.float64)[:, [3, 5, 6]]
+                is_exact = (np.rint(probabilities * 100) / 100 == probabilities).all(axis=1)
+                keys, rows = keys[is_exact], rows[is_exact]
+            order = np.argsort(keys)
+            self.__keys_index = keys[order], rows[order]
+        return self.__keys_index
+
+    def decide_many(self, states: np.ndarray | Sequence[GameState]) -> np.ndarray:
+        # States are quantized by 'DefaultGameState.pack_many', values of the Q-Table states are gathered at once
+        keys = DefaultGameState.pack_many(states)
+        index_keys, index_rows = self.__get_keys_index()
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        if len(index_keys) > 0:
+            positions = np.minimum(np.searchsorted(index_keys, keys), len(index_keys) - 1)
+            rows = np.where(index_keys[positions] == keys, index_rows[positions], -1)
+        actions = np.array(self.__Q_TABLE.available_actions, dtype=object)[
+            self.__Q_TABLE.get_rows_values(rows).argmax(axis=1)
+        ]
+        for index in np.flatnonzero(rows < 0).tolist():
+            key = int(keys[index])
+            actions[index] = self.decide(key if self.__PACKED_STATES else DefaultGameState.unpack(key))
+        return actions
+
+    def compile(self, max_bytes: int = 2 ** 28) -> 'AgentForDefaultGameByCompiledPolicy':
+        return AgentForDefaultGameByCompiledPolicy(self.__Q_TABLE, self.__PACKED_STATES, max_bytes)
+
+
+class AgentForDefaultGameByCompiledPolicy(Agent):
+    # Frozen policy of a Q-Table: a byte of the best action index for every state of boxes of probabilities (in centi
+    # units) around the Q-Table states with the same cards qty, cards sum, soft hand and dealer open card. Unseen states
+    # take the action of the closest state by L1 distance (the first one by the Q-Table order of equally close), as
+    # 'AgentForDefaultGameByQTable' does, states out of the boxes are as the closest states of the boxes
+    __BUCKETS_QTY = 2 ** 15  # By cards qty 5 bits, cards sum 5, soft hand 1, dealer open card 4 (as 'pack' places them)
+
+    def __init__(self, q_table: QTable, packed_states=False, max_bytes: int = 2 ** 28):
+        self.__ACTIONS = q_table.available_actions
+        self.__PACKED_STATES = packed_states
+        states = list(q_table.to_dict())
+        rows = np.array(list(map(q_table.get_row, states)), dtype=np.int64)
+        best_actions = q_table.get_rows_values(rows).argmax(axis=1)
+        keys = np.array(states if packed_states else [state.pack() for state in states], dtype=np.int64)
+        buckets = keys & 0x7FF | keys >> 7 & 0x7800
+        coordinates = np.stack((keys >> 11 & 0x7F, keys >> 22 & 0x7F, keys >> 29 & 0x7F), axis=1)
+
+        bucket_ids, states_buckets = np.unique(buckets, return_inverse=True)
+        lows = np.full((len(bucket_ids), 3), 0x7F, dtype=np.int64)
+        highs = np.zeros((len(bucket_ids), 3), dtype=np.int64)
+        np.minimum.at(lows, states_buckets, coordinates)
+        np.maximum.at(highs, states_buckets, coordinates)
+        shapes = highs - lows + 1
+        volumes = shapes.prod(axis=1)
+        if volumes.sum() > max_bytes:
+            raise ValueError(f"Compiled policy takes {volumes.sum()} bytes, more than {max_bytes}")
+        offsets = np.cumsum(volumes) - volumes
+        strides = np.stack((shapes[:, 1] * shapes[:, 2], shapes[:, 2], np.ones(len(shapes), dtype=np.int64)), axis=1)
+
+        closest = self.__find_closest(
+            offsets[states_buckets] + ((coordinates - lows[states_buckets]) * strides[states_buckets]).sum(axis=1),
+            shapes, strides, offsets,
+        )
+        self.__POLICY = best_actions.astype(np.uint8)[closest].tobytes()
+        self.__BUCKETS: list[tuple[int, ...] | None] = [None] * self.__BUCKETS_QTY
+        for bucket, offset, low, high, stride in zip(
+                bucket_ids.tolist(), offsets.tolist(), lows.tolist(), highs.tolist(), strides.tolist()
+        ):
+            self.__BUCKETS[bucket] = (
+                offset - low[0] * stride[0] - low[1] * stride[1] - low[2],
+                low[0], high[0], low[1], high[1], low[2], high[2], stride[0], stride[1],
+            )
+        self.__IS_KNOWN_BUCKET = np.zeros(self.__BUCKETS_QTY, dtype=bool)  # The same buckets for 'decide_many'
+        self.__IS_KNOWN_BUCKET[bucket_ids] = True
+        self.__BUCKETS_ARRAY = np.zeros((self.__BUCKETS_QTY, 9), dtype=np.int64)
+        self.__BUCKETS_ARRAY[bucket_ids] = [self.__BUCKETS[bucket] for bucket in bucket_ids.tolist()]
+
+    @staticmethod
+    def __find_closest(states_cells: np.ndarray, shapes: np.ndarray, strides: np.ndarray,
+                       offsets: np.ndarray) -> np.ndarray:
+        # Index of the closest state of every cell: L1 distance transform by forward and backward sweeps along each
+        # axis, cells of all buckets are swept at once. Ties are taken by the lower state index
+        shapes, strides, offsets = shapes.astype(np.int32), strides.astype(np.int32), offsets.astype(np.int32)
+        cells_buckets = np.repeat(np.arange(len(shapes), dtype=np.int32), shapes.prod(axis=1))
+        local_cells = np.arange(len(cells_buckets), dtype=np.int32) - offsets[cells_buckets]
+        distances = np.full(len(cells_buckets), np.iinfo(np.int32).max // 2, dtype=np.int32)
+        closest = np.full(len(cells_buckets), np.iinfo(np.int32).max, dtype=np.int32)
+        np.minimum.at(closest, states_cells, np.arange(len(states_cells), dtype=np.int32))
+        distances[states_cells] = 0
+        for axis in range(3):
+            axis_strides = strides[cells_buckets, axis]
+            axis_shapes = shapes[cells_buckets, axis]
+            axis_coordinates = local_cells // axis_strides % axis_shapes
+            has_next = axis_coordinates + 1 < axis_shapes
+            del axis_shapes
+            order = np.argsort(axis_coordinates, kind="stable").astype(np.int32)
+            bounds = np.searchsorted(axis_coordinates[order], np.arange(shapes[:, axis].max() + 1)).tolist()
+            del axis_coordinates
+            for step, coordinates in ((1, range(1, len(bounds) - 1)), (-1, range(len(bounds) - 3, -1, -1))):
+                for coordinate in coordinates:
+                    cells = order[bounds[coordinate]:bounds[coordinate + 1]]
+                    if step == -1:
+                        cells = cells[has_next[cells]]
+                    neighbours = cells - step * axis_strides[cells]
+                    new_distances = distances[neighbours] + 1
+                    new_closest = closest[neighbours]
+                    cells_distances = distances[cells]
+                    is_closer = (new_distances < cells_distances) | (
+                            (new_distances == cells_distances) & (new_closest < closest[cells])
+                    )
+                    cells = cells[is_closer]
+                    distances[cells] = new_distances[is_closer]
+                    closest[cells] = new_closest[is_closer]
+        return closest
+
+    def decide(self, state: GameState) -> GameAction:
+        if self.__PACKED_STATES:
+            bucket = self.__BUCKETS[state & 0x7FF | state >> 7 & 0x7800]
+            coordinate_0, coordinate_1, coordinate_2 = state >> 11 & 0x7F, state >> 22 & 0x7F, state >> 29 & 0x7F
+        else:
+            bucket = self.__BUCKETS[
+                state.player_cards_qty | state.player_cards_sum << 5 | state.player_has_soft_hand << 10
+                | state.dealer_open_card << 11
+            ]
+            coordinate_0 = round(state.player_busting_probability * 100)
+            coordinate_1 = round(state.dealer_cards_sum_less_than_17_probability * 100)
+            coordinate_2 = round(state.dealer_busting_probability * 100)
+        if bucket is None:
+            raise KeyError(state)
+        base, low_0, high_0, low_1, high_1, low_2, high_2, stride_0, stride_1 = bucket
+        # Not by 'min' and 'max': their calls take most of the time
+        coordinate_0 = low_0 if coordinate_0 < low_0 else high_0 if coordinate_0 > high_0 else coordinate_0
+        coordinate_1 = low_1 if coordinate_1 < low_1 else high_1 if coordinate_1 > high_1 else coordinate_1
+        coordinate_2 = low_2 if coordinate_2 < low_2 else high_2 if coordinate_2 > high_2 else coordinate_2
+        return self.__ACTIONS[self.__POLICY[base + coordinate_0 * stride_0 + coordinate_1 * stride_1 + coordinate_2]]
+
+    def decide_many(self, states: np.ndarray | Sequence[GameState]) -> np.ndarray:
+        keys = DefaultGameState.pack_many(states)
+        buckets = keys & 0x7FF | keys >> 7 & 0x7800
+        is_known = self.__IS_KNOWN_BUCKET[buckets]
+        if not is_known.all():
+            raise KeyError(states[int(np.argmin(is_known))])
+        base, low_0, high_0, low_1, high_1, low_2, high_2, stride_0, stride_1 = self.__BUCKETS_ARRAY[buckets].T
+        cells = (
+            base + np.clip(keys >> 11 & 0x7F, low_0, high_0) * stride_0
+            + np.clip(keys >> 22 & 0x7F, low_1, high_1) * stride_1 + np.clip(keys >> 29 & 0x7F, low_2, high_2)
+        )
+        return np.array(self.__ACTIONS, dtype=object)[np.frombuffer(self.__POLICY, dtype=np.uint8)[cells]]
@@ -1,4 +1,4 @@
-from . import default_game, probability_tools
+from . import default_game, probability_tools, probability_atlas, cache_tools, expected_value_tools
 from .base import (
-    GameAction, GameActionResult, GameState, GameEnvironment,
+    GameAction, GameActionResult, GameState, GameEnvironment, VectorizedGameEnvironment, HitSuccessor,
 )
@@ -2,24 +2,46 @@ import random
 from abc import ABC, abstractmethod
 from enum import Enum, auto
 from functools import lru_cache
-from typing import NamedTuple, Generator
+from typing import NamedTuple, Generator, Iterator, Sequence
 import numpy as np
-from sortedcontainers import SortedList
 
 
 class Card:
-    def __init__(self, rank: int):
+    __slots__ = ('_rank', '_hash')
+    __INSTANCES: dict[int, 'Card'] = {}
+
+    def __new__(cls, rank: int):
         if not 2 <= rank <= 10:
             raise ValueError(f"Invalid rank. Available only [2-10]")
-        self._rank = rank
-        self._hash = None
+        if rank not in Card.__INSTANCES:
+            Card.__INSTANCES[rank] = cls._create(rank)
+        return Card.__INSTANCES[rank]
+
+    def __init__(self, rank: int):  # Cards are interned and immutable, everything is done in '__new__'
+        pass
+
+    @classmethod
+    def _create(cls, rank: int) -> 'Card':
+        obj = object.__new__(cls)
+        object.__setattr__(obj, '_rank', rank)
+        object.__setattr__(obj, '_hash', hash(rank))
+        return obj
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        return Card, (self._rank,)
 
     @property
     def rank(self) -> int:
         return self._rank
 
     def copy(self) -> 'Card':
-        return Card(self._rank)
+        return self
 
     def __add__(self, other):
         if isinstance(other, Card):
@@ -59,8 +81,6 @@ class Card:
         return NotImplemented
 
     def __hash__(self):
-        if self._hash is None:
-            self._hash = hash(self._rank)
         return self._hash
 
     def __str__(self):
@@ -68,71 +88,125 @@ class Card:
 
 
 class AceCard(Card):
+    __slots__ = ()
+    __SOFT: 'AceCard'
+    __HARD: 'AceCard'
+
+    def __new__(cls, is_soft: bool | None = True):
+        return AceCard.__SOFT if is_soft else AceCard.__HARD
+
     def __init__(self, is_soft: bool | None = True):
-        super().__init__(7)
-        self._rank = 11 if is_soft else 1
+        pass
+
+    def __reduce__(self):
+        return AceCard, (self.is_soft,)
 
     @property
     def is_soft(self) -> bool:
         return self._rank == 11
 
-    def set_hard(self):
-        if self.is_soft:
-            self._rank = 1
-            self._hash = None
-
-    def copy(self) -> 'AceCard':
-        return AceCard(self.is_soft)
+    def to_hard(self) -> 'AceCard':
+        return AceCard.__HARD
 
     def __str__(self):
         return f"AceCard(is_soft={self.is_soft})"
 
 
+AceCard._AceCard__SOFT = AceCard._create(11)
+AceCard._AceCard__HARD = AceCard._create(1)
+
+
 class CardDeck:
+    __RANKS_QTY = 10  # [2, 3, 4, 5, 6, 7, 8, 9, 10, Ace]
+    __ACE_INDEX = 9
+    __CARDS: tuple[Card, ...] = tuple(Card(__rank) for __rank in range(2, 11)) + (AceCard(),)
+
+    @staticmethod
+    @lru_cache
+    def __get_default_rank_counts(qty: int) -> tuple[int, ...]:
+        return (4 * qty,) * 8 + (16 * qty, 4 * qty)
+
     @staticmethod
     @lru_cache
-    def __get_default_deck(qty: int) -> list[Card]:
-        return sorted(np.repeat(
-            [Card(__rank) for __rank in range(2, 11)] + [Card(10) for _ in range(3)] + [AceCard()], 4 * qty
-        ))
+    def __get_key_weights(qty: int) -> tuple[int, ...]:
+        return tuple((16 * qty + 1) ** index for index in range(10))
 
-    def __new__(cls, qty: int | None = 1):
+    @classmethod
+    def get_rank_index(cls, card: Card) -> int:
+        return cls.__ACE_INDEX if isinstance(card, AceCard) else card.rank - 2
+
+    @classmethod
+    def get_card_by_rank_index(cls, rank_index: int) -> Card:
+        return cls.__CARDS[rank_index]
+
+    def __new__(cls, qty: int | None = 1, seed: int | np.random.Generator | None = None):
         if qty < 1:
             raise ValueError("QTY of decks must be greater than 0")
         __obj = super().__new__(cls)
         __obj.__init_decks_qty = qty
         __obj.__min_cards_qty = 52 * qty * 0.25
+        __obj.__KEY_WEIGHTS = cls.__get_key_weights(qty)
+        __obj.__seed = seed
+        __obj.__rng = None  # Created by the first shuffle: most decks are never drawn from
         return __obj
 
-    def __init__(self, qty: int | None = 1):
-        self.__deck: SortedList[Card] = SortedList(self.__get_default_deck(qty))
+    def __init__(self, qty: int | None = 1, seed: int | np.random.Generator | None = None):
+        self.__set_rank_counts(self.__get_default_rank_counts(qty))
+
+    def __set_rank_counts(self, rank_counts):
+        self.__rank_counts: list[int] = list(rank_counts)
+        self.__cards_qty: int = sum(self.__rank_counts)
+        self.__key: int = sum(count * weight for count, weight in zip(self.__rank_counts, self.__KEY_WEIGHTS))
+        self.__shoe: list[int] | None = None  # Shuffled rank indices, dealt from cursor
+        self.__shoe_cursor: int = 0
+
+    def __shuffle(self):
+        if self.__rng is None:
+            self.__rng = np.random.default_rng(self.__seed)
+        self.__shoe = self.__rng.permutation(np.repeat(np.arange(self.__RANKS_QTY), self.__rank_counts)).tolist()
+        self.__shoe_cursor = 0
 
     def reset(self):
-        self.__deck.clear()
-        self.__deck.update(self.__get_default_deck(self.__init_decks_qty))
+        self.__set_rank_counts(self.__get_default_rank_counts(self.__init_decks_qty))
+        self.__shuffle()
 
     def draw(self) -> Card:
-        cards_remain = self.__len__()
-        if cards_remain == 0:
+        if self.__cards_qty == 0:
             raise IndexError("All cards in the deck have already been used.")
-        return self.__deck.pop(random.randint(0, cards_remain - 1)).copy()
+        if self.__shoe is None:
+            self.__shuffle()
+        rank_index = self.__shoe[self.__shoe_cursor]
+        self.__shoe_cursor += 1
+        self.__rank_counts[rank_index] -= 1
+        self.__cards_qty -= 1
+        self.__key -= self.__KEY_WEIGHTS[rank_index]
+        return self.__CARDS[rank_index]
 
     def __contains__(self, item) -> bool:
         if isinstance(item, Card):
-            return item in self.__deck
+            return self.count(item) > 0
         return NotImplemented
 
     def __len__(self):
-        return len(self.__deck)
+        return self.__cards_qty
+
+    def __eq__(self, other):
+        if isinstance(other, CardDeck):
+            return self.__key == other.__key and self.__rank_counts == other.__rank_counts
+        return NotImplemented
 
     def __hash__(self):
-        return hash(tuple(self.__deck))
+        return hash(self.__key)
 
     def __iter__(self) -> Generator[Card, None, None]:
-        return (card.copy() for card in self.__deck)
+        return (
+            card
+            for card, count in zip(self.__CARDS, self.__rank_counts)
+            for _ in range(count)
+        )
 
     def count(self, card: Card) -> int:
-        return self.__deck.count(AceCard() if isinstance(card, AceCard) else card)
+        return self.__rank_counts[self.get_rank_index(card)]
 
     @property
     def init_decks_qty(self) -> int:
@@ -140,80 +214,114 @@ class CardDeck:
 
     @property
     def is_playable(self) -> bool:
-        return self.__len__() >= self.__min_cards_qty
+        return self.__cards_qty >= self.__min_cards_qty
+
+    @property
+    def rank_counts(self) -> tuple[int, ...]:  # [2, 3, 4, 5, 6, 7, 8, 9, 10, Ace]
+        return tuple(self.__rank_counts)
 
     @property
     def remaining_cards(self) -> list[Card]:
         return list(self)
 
     @classmethod
-    def of(cls, init_decks_qty: int, remaining_cards: list[Card]) -> 'CardDeck':
-        obj = cls.__new__(cls, init_decks_qty)
-        obj.__deck = SortedList(AceCard() if isinstance(card, AceCard) else card.copy() for card in remaining_cards)
+    def of(cls, init_decks_qty: int, remaining_cards: list[Card],
+           seed: int | np.random.Generator | None = None) -> 'CardDeck':
+        rank_counts = [0] * cls.__RANKS_QTY
+        for card in remaining_cards:
+            rank_counts[cls.get_rank_index(card)] += 1
+        return cls.of_rank_counts(init_decks_qty, rank_counts, seed=seed)
+
+    @classmethod
+    def of_rank_counts(cls, init_decks_qty: int, rank_counts: list[int] | tuple[int, ...],
+                       seed: int | np.random.Generator | None = None) -> 'CardDeck':
+        if len(rank_counts) != cls.__RANKS_QTY or any(count < 0 for count in rank_counts):
+            raise ValueError(f"Rank counts must be {cls.__RANKS_QTY} non-negative numbers")
+        obj = cls.__new__(cls, init_decks_qty, seed)
+        obj.__set_rank_counts(rank_counts)
         return obj
 
 
 class CardHand:
-    __SOFT_ACE = AceCard(is_soft=True)
-
     def __init__(self, *cards: Card):
         self.__cards: list[Card] = []
+        self.__hard_sum: int = 0
+        self.__soft_aces_positions: list[int] = []
         self.add(*cards)
 
     def __len__(self):
         return len(self.__cards)
 
     def __getitem__(self, index) -> Card:
-        return self.__cards[index].copy()
+        return self.__cards[index]
 
-    def __iter__(self) -> Generator[Card, None, None]:
-        return (card.copy() for card in self.__cards)
+    def __iter__(self) -> Iterator[Card]:
+        return iter(self.__cards)
 
     def __hash__(self):
         return hash(tuple(sorted(self.__cards)))
 
     def __eq__(self, other):
         if isinstance(other, CardHand):
-            return sum(self) == sum(other)
+            return self.best_sum == other.best_sum
         return NotImplemented
 
     def __lt__(self, other):
         if isinstance(other, CardHand):
-            return sum(self) < sum(other)
+            return self.best_sum < other.best_sum
         return NotImplemented
 
     def __le__(self, other):
         if isinstance(other, CardHand):
-            return sum(self) <= sum(other)
+            return self.best_sum <= other.best_sum
         return NotImplemented
 
     def __gt__(self, other):
         if isinstance(other, CardHand):
-            return sum(self) > sum(other)
+            return self.best_sum > other.best_sum
         return NotImplemented
 
     def __ge__(self, other):
         if isinstance(other, CardHand):
-            return sum(self) >= sum(other)
+            return self.best_sum >= other.best_sum
         return NotImplemented
 
+    @property
+    def hard_sum(self) -> int:  # All aces counted as 1
+        return self.__hard_sum
+
+    @property
+    def soft_aces_qty(self) -> int:
+        return len(self.__soft_aces_positions)
+
+    @property
+    def best_sum(self) -> int:  # Same as 'sum(hand)'
+        return self.__hard_sum + 10 * len(self.__soft_aces_positions)
+
     @property
     def is_soft(self) -> bool:
-        return any(card == self.__SOFT_ACE for card in self.__cards)
+        return len(self.__soft_aces_positions) > 0
 
     def __migrate_to_hard_if_needed(self):
-        if not self.is_soft:
-            return
-        for card in self.__cards:
-            if isinstance(card, AceCard) and sum(self) > 21:
-                card.set_hard()
+        while self.__soft_aces_positions and self.best_sum > 21:
+            position = self.__soft_aces_positions.pop(0)
+            self.__cards[position] = self.__cards[position].to_hard()
 
     def add(self, *cards: Card):
-        self.__cards.extend(AceCard() if isinstance(card, AceCard) else card.copy() for card in cards)
+        for card in cards:
+            if isinstance(card, AceCard):
+                self.__soft_aces_positions.append(len(self.__cards))
+                self.__cards.append(AceCard())
+                self.__hard_sum += 1
+            else:
+                self.__cards.append(card)
+                self.__hard_sum += card.rank
         self.__migrate_to_hard_if_needed()
 
     def clean(self):
         self.__cards.clear()
+        self.__hard_sum = 0
+        self.__soft_aces_positions.clear()
 
 
 class GameAction(Enum):
@@ -225,8 +333,10 @@ class GameAction(Enum):
     SURRENDER = auto()
 
     @classmethod
-    def get_by_random(cls, *actions: 'GameAction') -> 'GameAction':
-        return random.choice(actions)
+    def get_by_random(cls, *actions: 'GameAction', rng: np.random.Generator | None = None) -> 'GameAction':
+        if rng is None:
+            return random.choice(actions)
+        return actions[rng.integers(len(actions))]
 
 
 class GameActionResult(Enum):
@@ -241,6 +351,12 @@ class GameActionResult(Enum):
 GameState = NamedTuple
 
 
+class HitSuccessor(NamedTuple):
+    probability: float
+    result: GameActionResult
+    state: 'GameState | None'  # None if the round is over
+
+
 class GameEnvironment(ABC):
     @property
     @abstractmethod
@@ -264,3 +380,48 @@ class GameEnvironment(ABC):
     @abstractmethod
     def state(self) -> GameState:
         pass
+
+    @property
+    def supports_hit_successors(self) -> bool:  # Environments knowing outcomes of HIT override both
+        return False
+
+    def get_hit_successors(self) -> list[HitSuccessor] | None:
+        # Every possible outcome of HIT by the next card (called before 'play'), None unless 'supports_hit_successors'
+        return None
+
+
+class VectorizedGameEnvironment(ABC):
+    @property
+    @abstractmethod
+    def available_actions(self) -> tuple[GameAction, ...]:
+        pass
+
+    @property
+    @abstractmethod
+    def tables_qty(self) -> int:
+        pass
+
+    @abstractmethod
+    def reset(self, tables: np.ndarray | None = None):
+        pass
+
+    @abstractmethod
+    def play(self, game_actions: Sequence[GameAction], tables: np.ndarray | None = None) -> np.ndarray:
+        pass
+
+    @property
+    @abstractmethod
+    def is_terminated(self) -> np.ndarray:
+        pass
+
+    @abstractmethod
+    def get_states(self, tables: np.ndarray | None = None) -> list[GameState]:
+        pass
+
+    @property
+    def supports_hit_successors(self) -> bool:  # Environments knowing outcomes of HIT override both
+        return False
+
+    def get_hit_successors(self, tables: np.ndarray | None = None) -> list[list[HitSuccessor]] | None:
+        # Every possible outcome of HIT by the next card (called before 'play'), None unless 'supports_hit_successors'
+        return None
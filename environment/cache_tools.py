@@ -0,0 +1,155 @@
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+from typing import Callable, Hashable, NamedTuple, Any
+import sys
+
+
+class CacheStats(NamedTuple):
+    name: str
+    size: int
+    bytes: int
+    hits: int
+    misses: int
+    evictions: int
+
+    def __str__(self):
+        return (
+            f"{self.name}: size={self.size} bytes={self.bytes} "
+            f"hits={self.hits} misses={self.misses} evictions={self.evictions}"
+        )
+
+
+class BoundedCache:
+    def __init__(self, name: str, max_size: int | None = None, max_bytes: int | None = None):
+        if max_size is not None and max_size < 1:
+            raise ValueError("Max size of cache must be positive")
+        if max_bytes is not None and max_bytes < 1:
+            raise ValueError("Max bytes of cache must be positive")
+        self.__NAME = name
+        self.__max_size = max_size
+        self.__max_bytes = max_bytes
+
+        self.__LOCK = Lock()
+        self.__entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self.__bytes = 0
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    @staticmethod
+    def __estimate_bytes(obj) -> int:  # Only one level deep: nested small ints are shared by interpreter
+        if type(obj) is tuple:
+            return sys.getsizeof(obj) + sum(map(sys.getsizeof, obj))
+        return sys.getsizeof(obj)
+
+    @property
+    def name(self) -> str:
+        return self.__NAME
+
+    def configure(self, max_size: int | None = None, max_bytes: int | None = None):
+        if max_size is not None and max_size < 1:
+            raise ValueError("Max size of cache must be positive")
+        if max_bytes is not None and max_bytes < 1:
+            raise ValueError("Max bytes of cache must be positive")
+        with self.__LOCK:
+            self.__max_size = max_size
+            self.__max_bytes = max_bytes
+            self.__evict_if_needed()
+
+    def __evict_if_needed(self):
+        while self.__entries and (
+                (self.__max_size is not None and len(self.__entries) > self.__max_size)
+                or (self.__max_bytes is not None and self.__bytes > self.__max_bytes)
+        ):
+            _, (_, entry_bytes) = self.__entries.popitem(last=False)
+            self.__bytes -= entry_bytes
+            self.__evictions += 1
+
+    def get(self, key: Hashable, default=None):
+        with self.__LOCK:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.__misses += 1
+                return default
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value):
+        entry_bytes = self.__estimate_bytes(key) + self.__estimate_bytes(value)
+        with self.__LOCK:
+            old_entry = self.__entries.pop(key, None)
+            if old_entry is not None:
+                self.__bytes -= old_entry[1]
+            self.__entries[key] = (value, entry_bytes)
+            self.__bytes += entry_bytes
+            if (self.__max_size is not None and len(self.__entries) > self.__max_size) or (
+                    self.__max_bytes is not None and self.__bytes > self.__max_bytes
+            ):
+                self.__evict_if_needed()
+
+    def clear(self):
+        with self.__LOCK:
+            self.__entries.clear()
+            self.__bytes = 0
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    @property
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            name=self.__NAME, size=len(self.__entries), bytes=self.__bytes,
+            hits=self.__hits, misses=self.__misses, evictions=self.__evictions,
+        )
+
+
+__CACHES: dict[str, BoundedCache] = {}
+__MISSING = object()
+
+
+def get_cache(name: str) -> BoundedCache:
+    try:
+        return __CACHES[name]
+    except KeyError:
+        raise ValueError(f"Unknown cache: '{name}'")
+
+
+def create_cache(name: str, max_size: int | None = 2 ** 17, max_bytes: int | None = 64 * 2 ** 20) -> BoundedCache:
+    if name in __CACHES:
+        raise ValueError(f"Cache '{name}' already exists")
+    cache = __CACHES[name] = BoundedCache(name, max_size=max_size, max_bytes=max_bytes)
+    return cache
+
+
+def bounded_cache(name: str, max_size: int | None = 2 ** 17, max_bytes: int | None = 64 * 2 ** 20):
+    cache = create_cache(name, max_size=max_size, max_bytes=max_bytes)
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args):
+            result = cache.get(args, __MISSING)
+            if result is __MISSING:
+                result = func(*args)
+                cache.put(args, result)
+            return result
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+def configure_caches(max_size: int | None = None, max_bytes: int | None = None):
+    for cache in __CACHES.values():
+        cache.configure(max_size=max_size, max_bytes=max_bytes)
+
+
+def clear_caches():
+    for cache in __CACHES.values():
+        cache.clear()
+
+
+def get_caches_stats() -> list[CacheStats]:
+    return [cache.stats for cache in __CACHES.values()]
@@ -1,8 +1,14 @@
-from .base import GameEnvironment, GameState, GameAction, GameActionResult, CardDeck, CardHand
+from .base import (
+    GameEnvironment, VectorizedGameEnvironment, GameState, GameAction, GameActionResult, HitSuccessor, Card, AceCard,
+    CardDeck, CardHand,
+)
 from .probability_tools import (
-    calculate_player_busting_probability, calculate_dealer_busting_probability, calculate_dealer_will_take_cards_probability
+    calculate_player_busting_probability, calculate_dealer_busting_probability, calculate_dealer_will_take_cards_probability,
+    calculate_dealer_busting_probabilities,
 )
-from functools import lru_cache
+from .probability_atlas import get_active_atlas
+from typing import Callable, Sequence
+import numpy as np
 
 
 class DefaultGameState(GameState):
@@ -14,48 +20,236 @@ class DefaultGameState(GameState):
     dealer_cards_sum_less_than_17_probability: float  # [0-1]
     dealer_busting_probability: float  # [0-1]
 
+    DTYPE = np.dtype([  # Of structured arrays of states
+        ("player_cards_qty", np.int8), ("player_cards_sum", np.int8), ("player_has_soft_hand", np.int8),
+        ("player_busting_probability", np.float64), ("dealer_open_card", np.int8),
+        ("dealer_cards_sum_less_than_17_probability", np.float64), ("dealer_busting_probability", np.float64),
+    ])
+
     @staticmethod
     def round_probability(probability: float) -> float:
         return round(probability, 2)
 
+    # Reversible int key of a state (bits from the lowest): cards qty 5, cards sum 5, soft hand 1,
+    # player busting probability 7, dealer open card 4, dealer probabilities 7 + 7; probabilities are in centi-units
+    @staticmethod
+    def pack_fields(player_cards_qty: int, player_cards_sum: int, player_has_soft_hand: int,
+                    player_busting_probability: float, dealer_open_card: int,
+                    dealer_cards_sum_less_than_17_probability: float, dealer_busting_probability: float) -> int:
+        if not (0 <= player_cards_qty < 32 and 0 <= player_cards_sum < 32):
+            raise ValueError("Player cards are out of DefaultGameState packing range")
+        return (
+            player_cards_qty
+            | player_cards_sum << 5
+            | player_has_soft_hand << 10
+            | round(player_busting_probability * 100) << 11
+            | dealer_open_card << 18
+            | round(dealer_cards_sum_less_than_17_probability * 100) << 22
+            | round(dealer_busting_probability * 100) << 29
+        )
+
+    def pack(self) -> int:
+        return self.pack_fields(*self)
+
+    @staticmethod
+    def pack_many(states: np.ndarray | Sequence['DefaultGameState'] | Sequence[int]) -> np.ndarray:
+        # Keys of 'pack' by a structured array (fields by 'DefaultGameState.DTYPE' names), states or keys themselves
+        if isinstance(states, np.ndarray) and states.dtype.names is not None:
+            fields = [states[name] for name in DefaultGameState._fields]
+        else:
+            array = np.asarray(states)
+            if array.ndim == 1:
+                return array.astype(np.int64)
+            fields = array.reshape(-1, len(DefaultGameState._fields)).T
+        player_cards_qty, player_cards_sum = np.asarray(fields[0], np.int64), np.asarray(fields[1], np.int64)
+        player_cards = player_cards_qty | player_cards_sum  # Negative if any is negative
+        if player_cards.min(initial=0) < 0 or player_cards.max(initial=0) >= 32:
+            raise ValueError("Player cards are out of DefaultGameState packing range")
+        return (
+            player_cards_qty
+            | player_cards_sum << 5
+            | np.asarray(fields[2], np.int64) << 10
+            | np.rint(np.asarray(fields[3], np.float64) * 100).astype(np.int64) << 11
+            | np.asarray(fields[4], np.int64) << 18
+            | np.rint(np.asarray(fields[5], np.float64) * 100).astype(np.int64) << 22
+            | np.rint(np.asarray(fields[6], np.float64) * 100).astype(np.int64) << 29
+        )
+
+    @classmethod
+    def unpack(cls, key: int) -> 'DefaultGameState':
+        return cls(
+            player_cards_qty=key & 0x1F,
+            player_cards_sum=key >> 5 & 0x1F,
+            player_has_soft_hand=key >> 10 & 0x1,
+            player_busting_probability=(key >> 11 & 0x7F) / 100,
+            dealer_open_card=key >> 18 & 0xF,
+            dealer_cards_sum_less_than_17_probability=(key >> 22 & 0x7F) / 100,
+            dealer_busting_probability=(key >> 29 & 0x7F) / 100,
+        )
+
+
+_ACE_INDEX = 9
+_HARD_VALUES = np.array(list(range(2, 11)) + [1], dtype=np.int64)
+_SOFT_VALUES = np.array(list(range(2, 11)) + [11], dtype=np.int64)
+
+
+def _get_deck_with_hidden_card(deck: CardDeck, dealer: CardHand) -> CardDeck:
+    rank_counts = list(deck.rank_counts)
+    rank_counts[CardDeck.get_rank_index(dealer[1])] += 1
+    return CardDeck.of_rank_counts(deck.init_decks_qty, rank_counts)
+
 
-@lru_cache
 def _calculate_player_busting_probability(deck: CardDeck, player: CardHand, dealer: CardHand) -> float:
     return DefaultGameState.round_probability(calculate_player_busting_probability(
-        CardDeck.of(deck.init_decks_qty, deck.remaining_cards + [dealer[1]]), player
+        _get_deck_with_hidden_card(deck, dealer), player,
     ))
 
 
-@lru_cache
-def _calculate_dealer_cards_sum_less_than_17_probability(deck: CardDeck, dealer: CardHand, hit_on_soft_17: bool) -> float:
-    return DefaultGameState.round_probability(calculate_dealer_will_take_cards_probability(
-        CardDeck.of(deck.init_decks_qty, deck.remaining_cards + [dealer[1]]), dealer[0], hit_on_soft_17=hit_on_soft_17,
+def calculate_rounded_dealer_busting_probability(deck: CardDeck, open_card: Card, hit_on_soft_17: bool) -> float:
+    atlas = get_active_atlas()
+    if atlas is not None:
+        probability = atlas.get_dealer_busting_probability(
+            deck.rank_counts, CardDeck.get_rank_index(open_card), hit_on_soft_17,
+        )
+        if probability is not None:
+            return probability
+    return DefaultGameState.round_probability(calculate_dealer_busting_probability(
+        deck, open_card, hit_on_soft_17=hit_on_soft_17,
     ))
 
 
-@lru_cache
-def _calculate_dealer_busting_probability(deck: CardDeck, dealer: CardHand, hit_on_soft_17: bool) -> float:
-    return DefaultGameState.round_probability(calculate_dealer_busting_probability(
-        CardDeck.of(deck.init_decks_qty, deck.remaining_cards + [dealer[1]]), dealer[0], hit_on_soft_17=hit_on_soft_17,
-    ))
+def calculate_rounded_dealer_busting_probabilities(rank_counts: np.ndarray, open_index: np.ndarray,
+                                                   hit_on_soft_17: bool) -> list[float]:
+    # Live values of many compositions, as 'calculate_rounded_dealer_busting_probability' rounds them
+    probabilities = calculate_dealer_busting_probabilities(rank_counts, open_index, hit_on_soft_17=hit_on_soft_17)
+    scaled_probabilities = probabilities * 100
+    is_on_rounding_border = np.abs(scaled_probabilities - np.floor(scaled_probabilities) - 0.5) < 1e-9
+    for index in np.flatnonzero(is_on_rounding_border).tolist():  # Float sum may be on wrong side
+        probabilities[index] = calculate_dealer_busting_probability(
+            CardDeck.of_rank_counts(1, rank_counts[index].tolist()),  # Decks qty doesn't matter for probabilities
+            CardDeck.get_card_by_rank_index(int(open_index[index])), hit_on_soft_17=hit_on_soft_17,
+        )
+    return [DefaultGameState.round_probability(probability) for probability in probabilities.tolist()]
+
+
+def _calculate_dealer_probabilities(deck: CardDeck, dealer: CardHand, hit_on_soft_17: bool) -> tuple[float, float]:
+    # Cards sum less than 17 and busting probabilities by one dealer computation
+    deck = _get_deck_with_hidden_card(deck, dealer)
+    return DefaultGameState.round_probability(calculate_dealer_will_take_cards_probability(
+        deck, dealer[0], hit_on_soft_17=hit_on_soft_17,
+    )), calculate_rounded_dealer_busting_probability(deck, dealer[0], hit_on_soft_17)
+
+
+def _calculate_states(rank_counts: np.ndarray, player_hard_sum: np.ndarray, player_has_ace: np.ndarray,
+                      player_cards_qty: np.ndarray, open_index: np.ndarray, open_rank: np.ndarray, hit_on_soft_17: bool,
+                      make_state: Callable[..., DefaultGameState | int]) -> list:
+    # States of many situations by one batched pass; 'rank_counts' are the cards the player doesn't see
+    cards_qty = rank_counts.sum(axis=1)
+    player_is_soft = player_has_ace & (player_hard_sum <= 11)
+    player_busting_probability = (
+        rank_counts * (_HARD_VALUES > (21 - player_hard_sum)[:, None])
+    ).sum(axis=1) / cards_qty
+
+    if hit_on_soft_17:
+        dealer_cards_sum_less_than_17_probability = 1 - (
+            rank_counts * (_HARD_VALUES > (17 - _HARD_VALUES[open_index])[:, None])
+        ).sum(axis=1) / cards_qty
+    else:
+        dealer_cards_sum_less_than_17_probability = (
+            rank_counts * (_SOFT_VALUES < (17 - open_rank)[:, None])
+        ).sum(axis=1) / cards_qty
+
+    atlas = get_active_atlas()
+    if atlas is None:
+        dealer_busting_probability = np.full(len(rank_counts), np.nan)
+    else:
+        dealer_busting_probability = atlas.get_dealer_busting_probabilities(
+            rank_counts, open_index, hit_on_soft_17=hit_on_soft_17,
+        )
+    is_missing = np.isnan(dealer_busting_probability)
+    if np.any(is_missing):
+        dealer_busting_probability[is_missing] = calculate_rounded_dealer_busting_probabilities(
+            rank_counts[is_missing], open_index[is_missing], hit_on_soft_17=hit_on_soft_17,
+        )
+
+    return [
+        make_state(
+            player_cards_qty=int(player_cards_qty[index]),
+            player_cards_sum=int(player_hard_sum[index] + 10 * player_is_soft[index]),
+            player_has_soft_hand=int(player_is_soft[index]),
+            player_busting_probability=DefaultGameState.round_probability(float(player_busting_probability[index])),
+            dealer_open_card=int(open_rank[index]),
+            dealer_cards_sum_less_than_17_probability=DefaultGameState.round_probability(
+                float(dealer_cards_sum_less_than_17_probability[index])
+            ),
+            dealer_busting_probability=DefaultGameState.round_probability(float(dealer_busting_probability[index])),
+        )
+        for index in range(len(rank_counts))
+    ]
+
+
+def _calculate_hit_successors(rank_counts: np.ndarray, player_hard_sum: np.ndarray, player_has_ace: np.ndarray,
+                              player_cards_qty: np.ndarray, open_index: np.ndarray, open_rank: np.ndarray,
+                              hit_on_soft_17: bool,
+                              make_state: Callable[..., DefaultGameState | int]) -> list[dict[int, HitSuccessor]]:
+    # Rank index of the next card -> HIT outcome for every situation; states of all of them by one batched pass.
+    # The dealer hidden card is one of the cards the player doesn't see, so is the next card for the player
+    rows, ranks = np.nonzero(rank_counts)
+    probabilities = rank_counts[rows, ranks] / rank_counts.sum(axis=1)[rows]
+    hard_sum = player_hard_sum[rows] + _HARD_VALUES[ranks]
+    has_ace = player_has_ace[rows] | (ranks == _ACE_INDEX)
+    best_sum = hard_sum + 10 * (has_ace & (hard_sum <= 11))
+    next_rank_counts = rank_counts[rows]
+    next_rank_counts[np.arange(len(rows)), ranks] -= 1
+
+    playing = np.flatnonzero(best_sum < 21)
+    playing_rows = rows[playing]
+    states = dict(zip(playing.tolist(), _calculate_states(
+        next_rank_counts[playing], hard_sum[playing], has_ace[playing], player_cards_qty[playing_rows] + 1,
+        open_index[playing_rows], open_rank[playing_rows], hit_on_soft_17, make_state,
+    )))
+    successors: list[dict[int, HitSuccessor]] = [{} for _ in range(len(rank_counts))]
+    for index, (row, rank, probability, player_sum) in enumerate(zip(
+            rows.tolist(), ranks.tolist(), probabilities.tolist(), best_sum.tolist())):
+        if player_sum > 21:
+            successors[row][rank] = HitSuccessor(probability, GameActionResult.BUST, None)
+        elif player_sum == 21:
+            successors[row][rank] = HitSuccessor(probability, GameActionResult.BLACKJACK, None)
+        else:
+            successors[row][rank] = HitSuccessor(probability, GameActionResult.WAIT_ACTION, states[index])
+    return successors
 
 
 class DefaultGame(GameEnvironment):
-    def __init__(self, card_decks_qty: int, dealer_hit_on_soft_17: bool | None = False):
+    def __init__(self, card_decks_qty: int, dealer_hit_on_soft_17: bool | None = False,
+                 seed: int | np.random.Generator | None = None, packed_states=False):
         self.__AVAILABLE_ACTIONS = (GameAction.STAND, GameAction.HIT)
 
-        self.__CARD_DECK: CardDeck = CardDeck(card_decks_qty)
+        self.__CARD_DECK: CardDeck = CardDeck(card_decks_qty, seed=seed)
         self.__PLAYER_HAND: CardHand = CardHand()
         self.__DEALER_HAND: CardHand = CardHand()
 
         self.__DEALER_HIT_ON_SOFT_17: bool = dealer_hit_on_soft_17
+        self.__PACKED_STATES: bool = packed_states  # States are 'DefaultGameState.pack' keys
         self.__is_round_playing: bool = False
+        self.__hit_successor_states: dict[int, DefaultGameState | int | None] | None = None  # By next card rank index
+        self.__next_state: DefaultGameState | int | None = None  # Taken from HIT successors, not computed again
 
     @property
     def available_actions(self) -> tuple[GameAction, ...]:
         return self.__AVAILABLE_ACTIONS
 
+    @property
+    def dealer_hit_on_soft_17(self) -> bool:
+        return self.__DEALER_HIT_ON_SOFT_17
+
+    @property
+    def unseen_rank_counts(self) -> tuple[int, ...]:  # Remaining deck with dealer hidden card
+        return _get_deck_with_hidden_card(self.__CARD_DECK, self.__DEALER_HAND).rank_counts
+
     def reset(self):
+        self.__hit_successor_states = None
+        self.__next_state = None
         self.__CARD_DECK.reset()
         self.__start_new_round()
 
@@ -66,19 +260,25 @@ class DefaultGame(GameEnvironment):
         self.__DEALER_HAND.clean()
         self.__DEALER_HAND.add(self.__CARD_DECK.draw(), self.__CARD_DECK.draw())
 
-    def __play_hit(self) -> tuple[GameActionResult, bool]:
-        self.__PLAYER_HAND.add(self.__CARD_DECK.draw())
-        player_sum = sum(self.__PLAYER_HAND)
+    def __play_hit(self, hit_successor_states: dict[int, DefaultGameState | int | None] | None
+                   ) -> tuple[GameActionResult, bool]:
+        card = self.__CARD_DECK.draw()
+        self.__PLAYER_HAND.add(card)
+        player_sum = self.__PLAYER_HAND.best_sum
         if player_sum > 21:
             return GameActionResult.BUST, True
         elif player_sum == 21:
             return GameActionResult.BLACKJACK, True
+        if hit_successor_states is not None:
+            self.__next_state = hit_successor_states[CardDeck.get_rank_index(card)]
         return GameActionResult.WAIT_ACTION, False
 
     def __play_stand(self) -> GameActionResult:
-        while sum(self.__DEALER_HAND) < 17 or (self.__DEALER_HIT_ON_SOFT_17 and sum(self.__DEALER_HAND) == 17 and self.__DEALER_HAND.is_soft):
+        while self.__DEALER_HAND.best_sum < 17 or (
+                self.__DEALER_HIT_ON_SOFT_17 and self.__DEALER_HAND.best_sum == 17 and self.__DEALER_HAND.is_soft
+        ):
             self.__DEALER_HAND.add(self.__CARD_DECK.draw())
-        if sum(self.__DEALER_HAND) > 21 or self.__DEALER_HAND < self.__PLAYER_HAND:
+        if self.__DEALER_HAND.best_sum > 21 or self.__DEALER_HAND < self.__PLAYER_HAND:
             return GameActionResult.WINS
         elif self.__DEALER_HAND == self.__PLAYER_HAND:
             return GameActionResult.PUSH
@@ -86,8 +286,11 @@ class DefaultGame(GameEnvironment):
             return GameActionResult.LOSS
 
     def play(self, game_action: GameAction) -> GameActionResult:
+        hit_successor_states = self.__hit_successor_states
+        self.__hit_successor_states = None
+        self.__next_state = None
         if game_action == GameAction.HIT:
-            result, is_round_over = self.__play_hit()
+            result, is_round_over = self.__play_hit(hit_successor_states)
         elif game_action == GameAction.STAND:
             result = self.__play_stand()
             is_round_over = True
@@ -104,19 +307,253 @@ class DefaultGame(GameEnvironment):
         return not self.__is_round_playing and not self.__CARD_DECK.is_playable
 
     @property
-    def state(self) -> DefaultGameState:
-        return DefaultGameState(
+    def supports_hit_successors(self) -> bool:
+        return True
+
+    def get_hit_successors(self) -> list[HitSuccessor]:
+        open_card = self.__DEALER_HAND[0]
+        successors = _calculate_hit_successors(
+            np.array([self.unseen_rank_counts], dtype=np.int64), np.array([self.__PLAYER_HAND.hard_sum]),
+            np.array([any(isinstance(card, AceCard) for card in self.__PLAYER_HAND)]),
+            np.array([len(self.__PLAYER_HAND)]), np.array([CardDeck.get_rank_index(open_card)]),
+            np.array([open_card.rank]), self.__DEALER_HIT_ON_SOFT_17,
+            DefaultGameState.pack_fields if self.__PACKED_STATES else DefaultGameState,
+        )[0]
+        self.__hit_successor_states = {rank_index: successor.state for rank_index, successor in successors.items()}
+        return list(successors.values())
+
+    @property
+    def state(self) -> DefaultGameState | int:
+        if self.__next_state is not None:
+            return self.__next_state
+        dealer_cards_sum_less_than_17_probability, dealer_busting_probability = _calculate_dealer_probabilities(
+            deck=self.__CARD_DECK, dealer=self.__DEALER_HAND, hit_on_soft_17=self.__DEALER_HIT_ON_SOFT_17,
+        )
+        make_state = DefaultGameState.pack_fields if self.__PACKED_STATES else DefaultGameState
+        return make_state(
             player_cards_qty=len(self.__PLAYER_HAND),
-            player_cards_sum=sum(self.__PLAYER_HAND),
+            player_cards_sum=self.__PLAYER_HAND.best_sum,
             player_has_soft_hand=int(self.__PLAYER_HAND.is_soft),
             player_busting_probability=_calculate_player_busting_probability(
                 deck=self.__CARD_DECK, player=self.__PLAYER_HAND, dealer=self.__DEALER_HAND,
             ),
             dealer_open_card=self.__DEALER_HAND[0].rank,
-            dealer_cards_sum_less_than_17_probability=_calculate_dealer_cards_sum_less_than_17_probability(
-                deck=self.__CARD_DECK, dealer=self.__DEALER_HAND, hit_on_soft_17=self.__DEALER_HIT_ON_SOFT_17,
-            ),
-            dealer_busting_probability=_calculate_dealer_busting_probability(
-                deck=self.__CARD_DECK, dealer=self.__DEALER_HAND, hit_on_soft_17=self.__DEALER_HIT_ON_SOFT_17,
-            ),
+            dealer_cards_sum_less_than_17_probability=dealer_cards_sum_less_than_17_probability,
+            dealer_busting_probability=dealer_busting_probability,
+        )
+
+
+class VectorizedDefaultGame(VectorizedGameEnvironment):
+    __ACE_INDEX = _ACE_INDEX
+    __HARD_VALUES = _HARD_VALUES
+    __SOFT_VALUES = _SOFT_VALUES
+
+    def __init__(self, tables_qty: int, card_decks_qty: int, dealer_hit_on_soft_17: bool | None = False,
+                 seed: int | np.random.Generator | None = None, packed_states=False):
+        if tables_qty < 1:
+            raise ValueError("QTY of tables must be greater than 0")
+        if card_decks_qty < 1:
+            raise ValueError("QTY of decks must be greater than 0")
+        self.__AVAILABLE_ACTIONS = (GameAction.STAND, GameAction.HIT)
+        self.__TABLES_QTY = tables_qty
+        self.__DEALER_HIT_ON_SOFT_17: bool = dealer_hit_on_soft_17
+        self.__PACKED_STATES: bool = packed_states  # States are 'DefaultGameState.pack' keys
+        self.__RNG = np.random.default_rng(seed)
+
+        self.__DEFAULT_RANK_COUNTS = np.array(CardDeck(card_decks_qty).rank_counts, dtype=np.int64)
+        self.__MIN_CARDS_QTY = 52 * card_decks_qty * 0.25
+
+        self.__DEFAULT_SHOE = np.repeat(np.arange(len(self.__DEFAULT_RANK_COUNTS)), self.__DEFAULT_RANK_COUNTS)
+
+        self.__rank_counts = np.tile(self.__DEFAULT_RANK_COUNTS, (tables_qty, 1))
+        self.__cards_qty = self.__rank_counts.sum(axis=1)
+        self.__shoes = np.tile(self.__DEFAULT_SHOE, (tables_qty, 1))  # Shuffled by reset, dealt from cursors
+        self.__shoe_cursors = np.zeros(tables_qty, dtype=np.int64)
+
+        self.__player_hard_sum = np.zeros(tables_qty, dtype=np.int64)
+        self.__player_has_ace = np.zeros(tables_qty, dtype=bool)
+        self.__player_cards_qty = np.zeros(tables_qty, dtype=np.int64)
+
+        self.__dealer_hard_sum = np.zeros(tables_qty, dtype=np.int64)
+        self.__dealer_has_ace = np.zeros(tables_qty, dtype=bool)
+        self.__dealer_open_index = np.zeros(tables_qty, dtype=np.int64)
+        self.__dealer_hidden_index = np.zeros(tables_qty, dtype=np.int64)
+
+        self.__is_round_playing = np.zeros(tables_qty, dtype=bool)
+        self.__hit_successor_states: dict[int, dict[int, DefaultGameState | int | None]] = {}  # By table, rank index
+        self.__next_states: dict[int, DefaultGameState | int] = {}  # Taken from HIT successors, not computed again
+
+    @property
+    def available_actions(self) -> tuple[GameAction, ...]:
+        return self.__AVAILABLE_ACTIONS
+
+    @property
+    def tables_qty(self) -> int:
+        return self.__TABLES_QTY
+
+    def __get_tables(self, tables: np.ndarray | None) -> np.ndarray:
+        if tables is None:
+            return np.arange(self.__TABLES_QTY)
+        return np.asarray(tables, dtype=np.int64).reshape(-1)
+
+    def reset(self, tables: np.ndarray | None = None):
+        tables = self.__get_tables(tables)
+        for table in tables.tolist():
+            self.__hit_successor_states.pop(table, None)
+            self.__next_states.pop(table, None)
+        self.__rank_counts[tables] = self.__DEFAULT_RANK_COUNTS
+        self.__cards_qty[tables] = self.__DEFAULT_RANK_COUNTS.sum()
+        self.__shoes[tables] = self.__RNG.permuted(np.tile(self.__DEFAULT_SHOE, (len(tables), 1)), axis=1)
+        self.__shoe_cursors[tables] = 0
+        self.__start_new_round(tables)
+
+    def __draw(self, tables: np.ndarray) -> np.ndarray:
+        cards_remain = self.__cards_qty[tables]
+        if np.any(cards_remain == 0):
+            raise IndexError("All cards in the deck have already been used.")
+        rank_indices = self.__shoes[tables, self.__shoe_cursors[tables]]
+        self.__shoe_cursors[tables] += 1
+        self.__rank_counts[tables, rank_indices] -= 1
+        self.__cards_qty[tables] -= 1
+        return rank_indices
+
+    @staticmethod
+    def __get_best_sum(hard_sum: np.ndarray, has_ace: np.ndarray) -> np.ndarray:
+        return hard_sum + 10 * (has_ace & (hard_sum <= 11))
+
+    def __add_to_player(self, tables: np.ndarray, rank_indices: np.ndarray):
+        self.__player_hard_sum[tables] += self.__HARD_VALUES[rank_indices]
+        self.__player_has_ace[tables] |= rank_indices == self.__ACE_INDEX
+        self.__player_cards_qty[tables] += 1
+
+    def __add_to_dealer(self, tables: np.ndarray, rank_indices: np.ndarray):
+        self.__dealer_hard_sum[tables] += self.__HARD_VALUES[rank_indices]
+        self.__dealer_has_ace[tables] |= rank_indices == self.__ACE_INDEX
+
+    def __start_new_round(self, tables: np.ndarray):
+        if len(tables) == 0:
+            return
+        self.__player_hard_sum[tables] = 0
+        self.__player_has_ace[tables] = False
+        self.__player_cards_qty[tables] = 0
+        self.__add_to_player(tables, self.__draw(tables))
+        self.__add_to_player(tables, self.__draw(tables))
+
+        self.__dealer_hard_sum[tables] = 0
+        self.__dealer_has_ace[tables] = False
+        self.__dealer_open_index[tables] = self.__draw(tables)
+        self.__dealer_hidden_index[tables] = self.__draw(tables)
+        self.__add_to_dealer(tables, self.__dealer_open_index[tables])
+        self.__add_to_dealer(tables, self.__dealer_hidden_index[tables])
+
+    def __play_hit(self, tables: np.ndarray, hit_successor_states: dict[int, dict[int, DefaultGameState | int | None]]
+                   ) -> tuple[np.ndarray, np.ndarray]:
+        rank_indices = self.__draw(tables)
+        self.__add_to_player(tables, rank_indices)
+        player_sum = self.__get_best_sum(self.__player_hard_sum[tables], self.__player_has_ace[tables])
+        results = np.full(len(tables), GameActionResult.WAIT_ACTION.value, dtype=np.int8)
+        results[player_sum > 21] = GameActionResult.BUST.value
+        results[player_sum == 21] = GameActionResult.BLACKJACK.value
+        for table, rank_index, is_playing in zip(tables.tolist(), rank_indices.tolist(), (player_sum < 21).tolist()):
+            if is_playing and table in hit_successor_states:
+                self.__next_states[table] = hit_successor_states[table][rank_index]
+        return results, player_sum >= 21
+
+    def __play_stand(self, tables: np.ndarray) -> np.ndarray:
+        drawing_tables = tables
+        while len(drawing_tables) > 0:
+            hard_sum = self.__dealer_hard_sum[drawing_tables]
+            is_soft = self.__dealer_has_ace[drawing_tables] & (hard_sum <= 11)
+            dealer_sum = hard_sum + 10 * is_soft
+            need_card = (dealer_sum < 17) | (self.__DEALER_HIT_ON_SOFT_17 & (dealer_sum == 17) & is_soft)
+            drawing_tables = drawing_tables[need_card]
+            if len(drawing_tables) > 0:
+                self.__add_to_dealer(drawing_tables, self.__draw(drawing_tables))
+
+        dealer_sum = self.__get_best_sum(self.__dealer_hard_sum[tables], self.__dealer_has_ace[tables])
+        player_sum = self.__get_best_sum(self.__player_hard_sum[tables], self.__player_has_ace[tables])
+        results = np.full(len(tables), GameActionResult.LOSS.value, dtype=np.int8)
+        results[dealer_sum == player_sum] = GameActionResult.PUSH.value
+        results[(dealer_sum > 21) | (dealer_sum < player_sum)] = GameActionResult.WINS.value
+        return results
+
+    def play(self, game_actions: Sequence[GameAction], tables: np.ndarray | None = None) -> np.ndarray:
+        tables = self.__get_tables(tables)
+        if len(game_actions) != len(tables):
+            raise ValueError("QTY of GameAction must be equal to QTY of tables")
+        is_hit = np.zeros(len(tables), dtype=bool)
+        for index, game_action in enumerate(game_actions):
+            if game_action == GameAction.HIT:
+                is_hit[index] = True
+            elif game_action != GameAction.STAND:
+                raise ValueError(f"Invalid GameAction, available only: {self.__AVAILABLE_ACTIONS}")
+
+        hit_successor_states = self.__hit_successor_states
+        self.__hit_successor_states = {}
+        for table in tables.tolist():
+            self.__next_states.pop(table, None)
+
+        results = np.empty(len(tables), dtype=np.int8)
+        is_round_over = np.ones(len(tables), dtype=bool)
+        results[is_hit], is_round_over[is_hit] = self.__play_hit(tables[is_hit], hit_successor_states)
+        results[~is_hit] = self.__play_stand(tables[~is_hit])
+
+        self.__is_round_playing[tables] = ~is_round_over
+        self.__start_new_round(tables[is_round_over])
+        return results
+
+    @property
+    def is_terminated(self) -> np.ndarray:
+        return ~self.__is_round_playing & (self.__cards_qty < self.__MIN_CARDS_QTY)
+
+    def get_states(self, tables: np.ndarray | None = None) -> list[DefaultGameState] | list[int]:
+        tables = self.__get_tables(tables)
+        is_computed = np.array([table not in self.__next_states for table in tables.tolist()], dtype=bool)
+        computed_states = iter(self.__get_states(
+            tables[is_computed], DefaultGameState.pack_fields if self.__PACKED_STATES else DefaultGameState,
+        ))
+        return [
+            next(computed_states) if is_table_computed else self.__next_states[table]
+            for table, is_table_computed in zip(tables.tolist(), is_computed.tolist())
+        ]
+
+    @property
+    def supports_hit_successors(self) -> bool:
+        return True
+
+    def get_hit_successors(self, tables: np.ndarray | None = None) -> list[list[HitSuccessor]]:
+        tables = self.__get_tables(tables)
+        successors = _calculate_hit_successors(
+            self.__get_unseen_rank_counts(tables), self.__player_hard_sum[tables], self.__player_has_ace[tables],
+            self.__player_cards_qty[tables], self.__dealer_open_index[tables], self.__get_open_ranks(tables),
+            self.__DEALER_HIT_ON_SOFT_17,
+            DefaultGameState.pack_fields if self.__PACKED_STATES else DefaultGameState,
         )
+        self.__hit_successor_states = {
+            table: {rank_index: successor.state for rank_index, successor in table_successors.items()}
+            for table, table_successors in zip(tables.tolist(), successors)
+        }
+        return [list(table_successors.values()) for table_successors in successors]
+
+    def __get_unseen_rank_counts(self, tables: np.ndarray) -> np.ndarray:  # Remaining decks with dealer hidden cards
+        rank_counts = self.__rank_counts[tables]
+        rank_counts[np.arange(len(tables)), self.__dealer_hidden_index[tables]] += 1
+        return rank_counts
+
+    def __get_open_ranks(self, tables: np.ndarray) -> np.ndarray:
+        open_index = self.__dealer_open_index[tables]
+        return np.where(  # First ace of two becomes hard (same as in CardHand)
+            (open_index == self.__ACE_INDEX) & (self.__dealer_hidden_index[tables] == self.__ACE_INDEX),
+            1, self.__SOFT_VALUES[open_index],
+        )
+
+    def __get_states(self, tables: np.ndarray, make_state: Callable[..., DefaultGameState | int]) -> list:
+        return _calculate_states(
+            self.__get_unseen_rank_counts(tables), self.__player_hard_sum[tables], self.__player_has_ace[tables],
+            self.__player_cards_qty[tables], self.__dealer_open_index[tables], self.__get_open_ranks(tables),
+            self.__DEALER_HIT_ON_SOFT_17, make_state,
+        )
+
+    def get_state_features(self, tables: np.ndarray | None = None) -> np.ndarray:  # shape: (tables, 7)
+        states = self.__get_states(self.__get_tables(tables), DefaultGameState)
+        return np.array(states, dtype=np.float64).reshape(-1, len(DefaultGameState._fields))
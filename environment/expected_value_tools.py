@@ -0,0 +1,177 @@
+from environment.cache_tools import create_cache
+from environment.probability_tools import get_dealer_draw_patterns
+from functools import lru_cache
+from typing import NamedTuple, Sequence
+import numpy as np
+
+
+__ACE_INDEX = 9
+__HARD_VALUE_BY_INDEX = tuple(range(2, 11)) + (1,)
+__DEALER_OUTCOMES_QTY = 6  # Final sums 17-21, bust
+__BUST_OUTCOME = 5
+# Of 'probability_tools.DealerFinalSumDistribution' fields: natural is 21, 'DefaultGame' compares it as any other 21
+__OUTCOME_BY_DISTRIBUTION_FIELD = (0, 1, 2, 3, 4, 4, __BUST_OUTCOME)
+
+__STAND_EXPECTED_VALUES_CACHE = create_cache("expected_value_tools.stand_expected_values")
+__HIT_EXPECTED_VALUES_CACHE = create_cache("expected_value_tools.hit_expected_values")
+
+
+class ExpectedValues(NamedTuple):
+    stand: float
+    hit: float
+
+
+@lru_cache
+def __get_dealer_draw_patterns(open_card_index: int, hit_on_soft_17: bool) -> tuple[int, np.ndarray, ...]:
+    # Patterns of 'probability_tools.get_dealer_draw_patterns', the same dealer model
+    drawn, orders_qtys, outcomes = get_dealer_draw_patterns(open_card_index, hit_on_soft_17)
+    outcomes = np.array(__OUTCOME_BY_DISTRIBUTION_FIELD)[outcomes]
+    patterns = dict(zip(map(tuple, drawn.tolist()), orders_qtys.tolist()))
+    outcomes = dict(zip(patterns, outcomes.tolist()))
+
+    # Multisets are sorted by qty of drawn ranks (descending) and kept as indices of (rank, drawn qty) in
+    # a flattened falling factorials table: i-th drawn rank of every multiset is a prefix of i-th indices row
+    sorted_patterns = sorted(patterns, key=lambda multiset: -np.count_nonzero(multiset))
+    drawn = np.array(sorted_patterns, dtype=np.int64)
+    max_rank_drawn_qty = int(drawn.max())
+    drawn_ranks_qty = np.count_nonzero(drawn, axis=1)
+    falling_factorial_indices = np.zeros((drawn_ranks_qty.max(), len(drawn)), dtype=np.int64)
+    for row, multiset in enumerate(drawn):
+        ranks = np.flatnonzero(multiset)
+        falling_factorial_indices[:len(ranks), row] = ranks * (max_rank_drawn_qty + 1) + multiset[ranks]
+    return (
+        max_rank_drawn_qty,
+        falling_factorial_indices,
+        np.array([np.count_nonzero(drawn_ranks_qty > i) for i in range(len(falling_factorial_indices))]),
+        np.array([patterns[multiset] for multiset in sorted_patterns], dtype=np.float64),
+        drawn.sum(axis=1),
+        np.eye(__DEALER_OUTCOMES_QTY)[[outcomes[multiset] for multiset in sorted_patterns]].T.copy(),
+    )
+
+
+def __calculate_dealer_final_sum_probabilities(rank_counts: np.ndarray, open_card_index: int,
+                                               hit_on_soft_17: bool) -> np.ndarray:
+    # Probability of a drawn multiset: draw orders * product of falling factorials of rank counts /
+    # / falling factorial of cards qty by multiset size. Shapes are transposed: (multisets, compositions)
+    max_rank_drawn_qty, falling_factorial_indices, rows_qtys, orders_qty, drawn_qty, outcomes = \
+        __get_dealer_draw_patterns(open_card_index, hit_on_soft_17)
+    rank_counts = np.asarray(rank_counts, dtype=np.float64).T
+    factors = rank_counts[:, None, :] - np.arange(max_rank_drawn_qty)[:, None]  # shape: (ranks, drawn qty, rows)
+    falling_factorials = np.concatenate([
+        np.ones((len(rank_counts), 1, rank_counts.shape[1])), np.cumprod(np.maximum(factors, 0), axis=1),
+    ], axis=1).reshape(-1, rank_counts.shape[1])
+    cards_qty_factors = rank_counts.sum(axis=0) - np.arange(drawn_qty.max())[:, None]
+    cards_qty_falling_factorials = np.concatenate([
+        np.ones((1, rank_counts.shape[1])), np.cumprod(np.maximum(cards_qty_factors, 1), axis=0),
+    ], axis=0)
+    probabilities = orders_qty[:, None] / cards_qty_falling_factorials[drawn_qty]
+    for indices, rows_qty in zip(falling_factorial_indices, rows_qtys.tolist()):
+        probabilities[:rows_qty] *= falling_factorials[indices[:rows_qty]]
+    return (outcomes @ probabilities).T
+
+
+def calculate_dealer_final_sum_probabilities(rank_counts: np.ndarray, dealer_open_card_index: int,
+                                             hit_on_soft_17=False) -> np.ndarray:
+    # Probabilities of 'DefaultGame' dealer final sums 17-21 (natural in 21) and bust, shape: (compositions, 6),
+    # for compositions of cards the player doesn't see, as 'probability_tools.calculate_dealer_final_sum_distributions'
+    # gives them
+    return __calculate_dealer_final_sum_probabilities(
+        np.asarray(rank_counts).reshape(-1, len(__HARD_VALUE_BY_INDEX)), dealer_open_card_index, hit_on_soft_17,
+    )
+
+
+def __calculate_stand_expected_values(dealer_probabilities: np.ndarray) -> np.ndarray:
+    # Expected value of standing by player sum [0-21] for every row of dealer final sum probabilities
+    busting_probabilities = dealer_probabilities[:, __BUST_OUTCOME:]
+    final_sum_probabilities = dealer_probabilities[:, :__BUST_OUTCOME]
+    lower_probabilities = np.cumsum(final_sum_probabilities, axis=1) - final_sum_probabilities
+    higher_probabilities = final_sum_probabilities.sum(axis=1, keepdims=True) - lower_probabilities - final_sum_probabilities
+    return np.concatenate([
+        np.repeat(2 * busting_probabilities - 1, 17, axis=1),
+        busting_probabilities + lower_probabilities - higher_probabilities,
+    ], axis=1)
+
+
+def is_hit_dominant(player_cards_sum: int, player_has_soft_hand: bool) -> bool:
+    # Hand can't bust by next card and standing on it wins only if the dealer busts,
+    # which is on average as likely after removing one more random card
+    return player_cards_sum < 17 and (player_cards_sum <= 11 or player_has_soft_hand)
+
+
+def __collect_player_hands(rank_counts: tuple[int, ...], hard_sum: int, has_ace: bool,
+                           hands: dict, standing_rank_counts: set):
+    # Every hand reachable by hits in post-order: (value of ending cards, cards qty, [(card count, hand, stand sum)]),
+    # where stand sum is 0 if 'hit' is dominant there
+    memo_key = (rank_counts, hard_sum, has_ace)
+    if memo_key in hands:
+        return
+
+    ending_value = 0
+    next_hands = []
+    for index, card_count in enumerate(rank_counts):
+        if card_count == 0:
+            continue
+
+        new_hard_sum = hard_sum + __HARD_VALUE_BY_INDEX[index]
+        new_has_ace = has_ace or index == __ACE_INDEX
+        new_is_soft = new_has_ace and new_hard_sum <= 11
+        new_sum = new_hard_sum + 10 if new_is_soft else new_hard_sum
+        if new_sum > 21:
+            ending_value -= card_count
+            continue
+        if new_sum == 21:  # 'GameActionResult.BLACKJACK' ends the round
+            ending_value += card_count
+            continue
+
+        new_rank_counts = rank_counts[:index] + (card_count - 1,) + rank_counts[index + 1:]
+        if is_hit_dominant(new_sum, new_is_soft):
+            new_sum = 0
+        else:
+            standing_rank_counts.add(new_rank_counts)
+        __collect_player_hands(new_rank_counts, new_hard_sum, new_has_ace, hands, standing_rank_counts)
+        next_hands.append((card_count, (new_rank_counts, new_hard_sum, new_has_ace), new_sum))
+
+    hands[memo_key] = (ending_value, sum(rank_counts), next_hands)
+
+
+def calculate_expected_values(rank_counts: Sequence[int], player_cards_sum: int, player_has_soft_hand: bool,
+                              dealer_open_card_index: int, hit_on_soft_17=False) -> ExpectedValues:
+    # Exact expected values (win: 1, push: 0, loss: -1) of 'DefaultGame' actions with optimal play after 'hit'.
+    # 'rank_counts' are all cards the player doesn't see: the remaining deck with the dealer hidden card.
+    # Hard hand with an ace has hard sum over 11 and will never be soft again, so only sum and softness matter.
+    # Only the hand and the hands after one more card are cached: the next decision in the round is one of them
+    rank_counts = tuple(rank_counts)
+    root_key = (rank_counts, player_cards_sum - 10 if player_has_soft_hand else player_cards_sum, bool(player_has_soft_hand))
+    cache_suffix = (dealer_open_card_index, hit_on_soft_17)
+
+    root_stand_expected_values = __STAND_EXPECTED_VALUES_CACHE.get((rank_counts,) + cache_suffix)
+    root_hit_expected_value = __HIT_EXPECTED_VALUES_CACHE.get(root_key + cache_suffix)
+    if root_stand_expected_values is not None and root_hit_expected_value is not None:
+        return ExpectedValues(stand=root_stand_expected_values[player_cards_sum], hit=root_hit_expected_value)
+
+    hands = {}
+    standing_rank_counts = {rank_counts}
+    __collect_player_hands(*root_key, hands, standing_rank_counts)
+    standing_rank_counts = list(standing_rank_counts)
+    stand_expected_values = dict(zip(standing_rank_counts, map(tuple, __calculate_stand_expected_values(
+        __calculate_dealer_final_sum_probabilities(np.array(standing_rank_counts), dealer_open_card_index, hit_on_soft_17)
+    ).tolist())))
+
+    hit_expected_values = {}
+    for memo_key, (ending_value, cards_qty, next_hands) in hands.items():
+        total_value = ending_value
+        for card_count, next_hand, stand_sum in next_hands:
+            expected_value = hit_expected_values[next_hand]
+            if stand_sum:
+                expected_value = max(expected_value, stand_expected_values[next_hand[0]][stand_sum])
+            total_value += expected_value * card_count
+        hit_expected_values[memo_key] = total_value / cards_qty
+
+    for _, next_hand, _ in hands[root_key][2]:
+        __HIT_EXPECTED_VALUES_CACHE.put(next_hand + cache_suffix, hit_expected_values[next_hand])
+        if next_hand[0] in stand_expected_values:
+            __STAND_EXPECTED_VALUES_CACHE.put((next_hand[0],) + cache_suffix, stand_expected_values[next_hand[0]])
+    __HIT_EXPECTED_VALUES_CACHE.put(root_key + cache_suffix, hit_expected_values[root_key])
+    __STAND_EXPECTED_VALUES_CACHE.put((rank_counts,) + cache_suffix, stand_expected_values[rank_counts])
+
+    return ExpectedValues(stand=stand_expected_values[rank_counts][player_cards_sum], hit=hit_expected_values[root_key])
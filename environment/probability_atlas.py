@@ -0,0 +1,218 @@
+import os
+import struct
+from typing import Iterable
+import numpy as np
+from progress.bar import Bar
+
+
+class ProbabilityAtlas:
+    # Memory-mapped open addressing hash table: exact rank composition (with dealer hidden card, without open card)
+    # -> dealer busting probability rounded to 0.01 for every dealer open card and both 'hit_on_soft_17' rules,
+    # the same value as the live computation gives. The atlas keeps the compositions of fresh shoes of the decks qtys
+    # without up to 'depth' cards (the first rounds of every shoe); other compositions are calculated live.
+    # Dealer cards sum less than 17 and player busting probabilities aren't kept: they are sums over the next card
+    # ranks, cheaper than a lookup
+    __MAGIC = b"TBJHATLS"
+    __VERSION = 3
+    __HEADER = struct.Struct("<8sIIQQI")  # magic, version, capacity log2, records qty, max probe length, depth
+    __HEADER_SIZE = 64
+    __HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+    __UINT64_MASK = 2 ** 64 - 1
+    __RANKS_QTY = 10
+    __CARDS_PER_DECK = np.array([4] * 8 + [16, 4], dtype=np.int64)  # By rank index
+    __RANK_BITS = np.array([6] * 8 + [8, 6], dtype=np.int64)  # Of rank counts in keys, up to 15 decks
+    __RANK_SHIFTS = np.cumsum(__RANK_BITS) - __RANK_BITS
+    __MAX_DECKS_QTY = 15
+    __MISSING = 255
+
+    def __init__(self, filename: str):
+        with open(filename, 'rb') as f:
+            magic, version, capacity_log2, records_qty, max_probe_length, depth = self.__HEADER.unpack(
+                f.read(self.__HEADER.size)
+            )
+        if magic != self.__MAGIC or version != self.__VERSION:
+            raise ValueError(f"Error loading ProbabilityAtlas from {filename}")
+        self.__CAPACITY_LOG2 = capacity_log2
+        self.__RECORDS_QTY = records_qty
+        self.__MAX_PROBE_LENGTH = max_probe_length
+        self.__DEPTH = depth
+
+        capacity = 2 ** capacity_log2
+        self.__KEYS = np.memmap(filename, dtype=np.uint64, mode='r', offset=self.__HEADER_SIZE, shape=(capacity,))
+        self.__VALUES = np.memmap(
+            filename, dtype=np.uint8, mode='r', offset=self.__HEADER_SIZE + capacity * 8,
+            shape=(capacity, 2, self.__RANKS_QTY),
+        )
+
+    def __len__(self) -> int:
+        return self.__RECORDS_QTY
+
+    @property
+    def depth(self) -> int:  # Max qty of cards out of a fresh shoe in the kept compositions
+        return self.__DEPTH
+
+    @classmethod
+    def __pack_rank_counts(cls, rank_counts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # Keys of the compositions in range of the key bits (non-empty, so keys are never 0) and their indices
+        rank_counts = np.asarray(rank_counts, dtype=np.int64)
+        in_range = np.all((rank_counts >= 0) & (rank_counts < 2 ** cls.__RANK_BITS), axis=1)
+        in_range &= rank_counts.sum(axis=1) > 0
+        rows = np.flatnonzero(in_range)
+        keys = (rank_counts[rows].astype(np.uint64) << cls.__RANK_SHIFTS.astype(np.uint64)).sum(axis=1, dtype=np.uint64)
+        return keys, rows
+
+    @classmethod
+    def __get_slot(cls, key: int, capacity_log2: int) -> int:
+        return ((key * cls.__HASH_MULTIPLIER) & cls.__UINT64_MASK) >> (64 - capacity_log2)
+
+    @classmethod
+    def __get_slots(cls, keys: np.ndarray, capacity_log2: int) -> np.ndarray:
+        return (keys * np.uint64(cls.__HASH_MULTIPLIER)) >> np.uint64(64 - capacity_log2)
+
+    def get_dealer_busting_probability(self, rank_counts: Iterable[int], open_card_index: int,
+                                       hit_on_soft_17: bool) -> float | None:
+        keys, _ = self.__pack_rank_counts(np.array([tuple(rank_counts)], dtype=np.int64))
+        if len(keys) == 0:
+            return None
+        key = int(keys[0])
+        mask = 2 ** self.__CAPACITY_LOG2 - 1
+        slot = self.__get_slot(key, self.__CAPACITY_LOG2)
+        for _ in range(self.__MAX_PROBE_LENGTH):
+            slot_key = int(self.__KEYS[slot])
+            if slot_key == key:
+                value = int(self.__VALUES[slot, int(hit_on_soft_17), open_card_index])
+                return None if value == self.__MISSING else value / 100
+            if slot_key == 0:
+                return None
+            slot = (slot + 1) & mask
+        return None
+
+    def get_dealer_busting_probabilities(self, rank_counts: np.ndarray, open_cards_indices: np.ndarray,
+                                         hit_on_soft_17: bool) -> np.ndarray:  # NaN if not found
+        rank_counts = np.asarray(rank_counts, dtype=np.int64).reshape(-1, self.__RANKS_QTY)
+        open_cards_indices = np.asarray(open_cards_indices, dtype=np.int64).reshape(-1)
+        result = np.full(len(rank_counts), np.nan)
+        keys, rows = self.__pack_rank_counts(rank_counts)
+        slots = self.__get_slots(keys, self.__CAPACITY_LOG2)
+        mask = np.uint64(2 ** self.__CAPACITY_LOG2 - 1)
+        for _ in range(self.__MAX_PROBE_LENGTH):
+            if len(rows) == 0:
+                break
+            slot_keys = self.__KEYS[slots]
+            is_found = slot_keys == keys
+            values = self.__VALUES[slots[is_found], int(hit_on_soft_17), open_cards_indices[rows[is_found]]]
+            result[rows[is_found]] = np.where(values == self.__MISSING, np.nan, values / 100)
+            is_probing = ~is_found & (slot_keys != 0)
+            rows, keys, slots = rows[is_probing], keys[is_probing], (slots[is_probing] + np.uint64(1)) & mask
+        return result
+
+    @classmethod
+    def __count_compositions(cls, decks_qty: int, depth: int) -> int:
+        # Of a fresh shoe without up to 'depth' cards: polynomial product of out of shoe cards qtys by rank
+        counts = np.zeros(depth + 1, dtype=np.int64)
+        counts[0] = 1
+        for rank_cards_qty in (cls.__CARDS_PER_DECK * decks_qty).tolist():
+            counts = np.convolve(counts, np.ones(min(rank_cards_qty, depth) + 1, dtype=np.int64))[:depth + 1]
+        return int(counts.sum())
+
+    @classmethod
+    def __enumerate_compositions(cls, decks_qty: int, depth: int) -> np.ndarray:
+        # Rank counts of a fresh shoe without up to 'depth' cards
+        fresh_rank_counts = cls.__CARDS_PER_DECK * decks_qty
+        out_of_shoe = np.zeros((1, 0), dtype=np.int64)
+        for rank_cards_qty in fresh_rank_counts.tolist():
+            rank_out_of_shoe = np.arange(min(rank_cards_qty, depth) + 1)
+            out_of_shoe = np.concatenate([
+                np.repeat(out_of_shoe, len(rank_out_of_shoe), axis=0),
+                np.tile(rank_out_of_shoe, len(out_of_shoe))[:, None],
+            ], axis=1)
+            out_of_shoe = out_of_shoe[out_of_shoe.sum(axis=1) <= depth]
+        return fresh_rank_counts - out_of_shoe
+
+    @classmethod
+    def build(cls, filename: str, decks_qtys: Iterable[int] = range(1, 9), max_bytes: int = 64 * 2 ** 20,
+              chunk_size: int = 4096):
+        # The depth is the biggest one that fits into 'max_bytes' for all 'decks_qtys'
+        from .default_game import calculate_rounded_dealer_busting_probabilities  # Avoid circular import
+
+        decks_qtys = list(decks_qtys)
+        if not all(0 < decks_qty <= cls.__MAX_DECKS_QTY for decks_qty in decks_qtys):
+            raise ValueError(f"Decks qty must be in [1, {cls.__MAX_DECKS_QTY}]")
+        record_bytes = 8 + 2 * cls.__RANKS_QTY
+        depth = -1
+        while True:
+            records_qty = sum(cls.__count_compositions(decks_qty, depth + 1) for decks_qty in decks_qtys)
+            capacity_log2 = max(1, int(np.ceil(np.log2(records_qty / 0.7))))
+            if cls.__HEADER_SIZE + 2 ** capacity_log2 * record_bytes > max_bytes:
+                break
+            depth += 1
+        if depth < 0:
+            raise ValueError("ProbabilityAtlas doesn't fit into 'max_bytes'")
+
+        all_rank_counts = np.unique(np.concatenate([  # Shoes of different decks qtys may share compositions
+            cls.__enumerate_compositions(decks_qty, depth) for decks_qty in decks_qtys
+        ]), axis=0)
+        records_qty = len(all_rank_counts)
+        capacity_log2 = max(1, int(np.ceil(np.log2(records_qty / 0.7))))
+        capacity = 2 ** capacity_log2
+        keys = np.zeros(capacity, dtype=np.uint64)
+        values = np.full((capacity, 2, cls.__RANKS_QTY), cls.__MISSING, dtype=np.uint8)
+
+        progress_bar = Bar(
+            f'Build atlas of %(max)d compositions (depth {depth})',
+            max=records_qty, suffix='%(index)d/%(remaining)d %(percent).2f%% [%(avg)d - %(elapsed)d/%(eta)d]s'
+        )
+        max_probe_length = 1
+        mask = capacity - 1
+        slots = np.empty(records_qty, dtype=np.int64)
+        for row, key in enumerate(cls.__pack_rank_counts(all_rank_counts)[0].tolist()):
+            slot = cls.__get_slot(key, capacity_log2)
+            probe_length = 1
+            while keys[slot] != 0:
+                slot = (slot + 1) & mask
+                probe_length += 1
+            keys[slot] = key
+            slots[row] = slot
+            max_probe_length = max(max_probe_length, probe_length)
+
+        for start in range(0, records_qty, chunk_size):
+            chunk = all_rank_counts[start:start + chunk_size]
+            chunk_slots = slots[start:start + chunk_size]
+            for hit_on_soft_17 in (False, True):
+                for open_card_index in range(cls.__RANKS_QTY):
+                    values[chunk_slots, int(hit_on_soft_17), open_card_index] = np.rint(np.array(
+                        calculate_rounded_dealer_busting_probabilities(
+                            chunk, np.full(len(chunk), open_card_index), hit_on_soft_17,
+                        )
+                    ) * 100)
+            progress_bar.next(len(chunk))
+        progress_bar.finish()
+
+        temp_filename = f"{filename}.tmp"
+        with open(temp_filename, 'wb') as f:
+            f.write(cls.__HEADER.pack(
+                cls.__MAGIC, cls.__VERSION, capacity_log2, records_qty, max_probe_length, depth,
+            ).ljust(cls.__HEADER_SIZE, b"\0"))
+            f.write(keys.tobytes())
+            f.write(values.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_filename, filename)
+
+
+__active_atlas: ProbabilityAtlas | None = None
+
+
+def set_active_atlas(atlas: ProbabilityAtlas | None):
+    global __active_atlas
+    __active_atlas = atlas
+
+
+def get_active_atlas() -> ProbabilityAtlas | None:
+    return __active_atlas
+
+
+def load_active_atlas_if_exists(filename: str) -> ProbabilityAtlas | None:
+    if os.path.exists(filename):
+        set_active_atlas(ProbabilityAtlas(filename))
+    return get_active_atlas()
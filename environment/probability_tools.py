@@ -1,70 +1,242 @@
-from environment.base import Card, CardDeck, CardHand
+from environment.base import Card, AceCard, CardDeck, CardHand
+from environment.cache_tools import bounded_cache
 from functools import lru_cache
+from typing import Callable, NamedTuple
+import numpy as np
 
 
-@lru_cache
-def __calculate_hand_sum_over_by_next_card_probability(deck: CardDeck, hand: CardHand, over: int) -> float:
-    not_over_rank = over - sum(1 if card.rank == 11 else card.rank for card in hand)
-    return sum(1 for card in deck if (card.rank if card.rank != 11 else 1) > not_over_rank) / len(deck)
+__ACE_INDEX = 9
+__HARD_VALUE_BY_INDEX = tuple(range(2, 11)) + (1,)
+__SOFT_VALUE_BY_INDEX = tuple(range(2, 11)) + (11,)
+__DEALER_OUTCOMES_QTY = 7  # Final sums 17-21, natural, bust
+__NATURAL_OUTCOME = 5
+__BUST_OUTCOME = 6
 
 
-def calculate_player_busting_probability(deck: CardDeck, player: CardHand) -> float:
-    return __calculate_hand_sum_over_by_next_card_probability(deck, player, 21)
+class DealerFinalSumDistribution(NamedTuple):  # By 'DefaultGame' dealer rules
+    sum_17: float
+    sum_18: float
+    sum_19: float
+    sum_20: float
+    sum_21: float
+    natural: float  # 21 by open and hidden cards
+    bust: float
 
 
-@lru_cache
-def calculate_dealer_will_take_cards_probability(deck: CardDeck, dealer_open_card: Card, hit_on_soft_17=False):
-    if hit_on_soft_17:
-        return 1 - __calculate_hand_sum_over_by_next_card_probability(deck, CardHand(dealer_open_card), 17)
-    else:
-        not_over_rank = 17 - dealer_open_card.rank
-        return sum(1 for card in deck if card.rank < not_over_rank) / len(deck)
-
-
-@lru_cache
-def calculate_dealer_busting_probability(deck: CardDeck, open_card: Card, hit_on_soft_17=False) -> float:
-    total_bust = 0
-    total_possibilities = 0
+def __get_hard_value(card: Card) -> int:
+    return 1 if isinstance(card, AceCard) else card.rank
 
-    remaining_cards = deck.remaining_cards
-    for probable_hidden_card in set(remaining_cards):
-        probable_hidden_card_count = remaining_cards.count(probable_hidden_card)
-        probable_hand = CardHand(open_card, probable_hidden_card)
 
-        probable_deck_cards = remaining_cards.copy()
-        probable_deck_cards.remove(probable_hidden_card)
-        probable_deck = CardDeck.of(deck.init_decks_qty, probable_deck_cards)
+@bounded_cache("probability_tools.hand_sum_over_by_next_card_probability", max_size=2 ** 16)
+def __calculate_hand_sum_over_by_next_card_probability(rank_counts: tuple[int, ...], hand_hard_sum: int, over: int) -> float:
+    not_over_rank = over - hand_hard_sum
+    return sum(
+        count for count, value in zip(rank_counts, __HARD_VALUE_BY_INDEX) if value > not_over_rank
+    ) / sum(rank_counts)
 
-        bust, possibilities = __simulate_dealer(probable_deck, probable_hand, hit_on_soft_17)
 
-        total_bust += bust * probable_hidden_card_count
-        total_possibilities += possibilities * probable_hidden_card_count
-
-    return 0.0 if total_possibilities == 0 else total_bust / total_possibilities
+def calculate_player_busting_probability(deck: CardDeck, player: CardHand) -> float:
+    return __calculate_hand_sum_over_by_next_card_probability(
+        deck.rank_counts, player.hard_sum, 21,
+    )
 
 
-@lru_cache
-def __simulate_dealer(deck: CardDeck, hand: CardHand, hit_on_soft_17: bool) -> tuple[int, int]:
-    current_sum = sum(hand)
-    if current_sum >= 17 and not (hit_on_soft_17 and hand.is_soft):
-        return (1 if current_sum > 21 else 0), 1
+def calculate_dealer_will_take_cards_probability(deck: CardDeck, dealer_open_card: Card, hit_on_soft_17=False):
+    # Only the hidden card layer is needed, so the dealer tree isn't walked
+    rank_counts = deck.rank_counts
+    if hit_on_soft_17:
+        return 1 - __calculate_hand_sum_over_by_next_card_probability(
+            rank_counts, __get_hard_value(dealer_open_card), 17,
+        )
+    else:
+        not_over_rank = 17 - dealer_open_card.rank
+        return sum(
+            count for count, value in zip(rank_counts, __SOFT_VALUE_BY_INDEX) if value < not_over_rank
+        ) / sum(rank_counts)
 
-    total_bust = 0
-    total_possibilities = 0
 
-    for card in set(deck):
-        card_count = deck.count(card)
+# Dealer busting probability of 'DefaultGameState' is the ratio of weighted leaves of the legacy dealer tree, which
+# hits every soft sum with 'hit_on_soft_17'. It's kept as it was, so states of trained Q-Tables don't change, but it
+# isn't the probability of the dealer busting: that is 'bust' of 'calculate_dealer_final_sum_distribution'
 
-        new_hand = CardHand(*hand)
-        new_hand.add(card)
+def calculate_dealer_busting_probability(deck: CardDeck, open_card: Card, hit_on_soft_17=False) -> float:
+    not_busting, busting = __simulate_dealer(
+        deck.rank_counts, __get_hard_value(open_card), isinstance(open_card, AceCard), hit_on_soft_17,
+    )
+    possibilities = not_busting + busting
+    return busting / possibilities if possibilities else 0.0
+
+
+@bounded_cache("probability_tools.dealer_outcomes")
+def __simulate_dealer(rank_counts: tuple[int, ...], hard_sum: int, is_soft: bool,
+                      hit_on_soft_17: bool) -> tuple[int, int]:
+    return __walk_dealer_tree(rank_counts, hard_sum, is_soft, hit_on_soft_17, {})
+
+
+def __walk_dealer_tree(rank_counts: tuple[int, ...], hard_sum: int, is_soft: bool, hit_on_soft_17: bool,
+                       memo: dict[tuple[tuple[int, ...], int, bool], tuple[int, int]]) -> tuple[int, int]:
+    # Weighted leaves count by not busting and busting. Leaves are tallied in place by parent: they are the most
+    # of the tree
+    memo_key = (rank_counts, hard_sum, is_soft)
+    if memo_key in memo:
+        return memo[memo_key]
+
+    not_busting, busting = 0, 0
+    for index, card_count in enumerate(rank_counts):
+        if card_count == 0:
+            continue
+
+        new_hard_sum = hard_sum + __HARD_VALUE_BY_INDEX[index]
+        new_is_soft = (is_soft or index == __ACE_INDEX) and new_hard_sum <= 11
+        new_sum = new_hard_sum + 10 if new_is_soft else new_hard_sum
+        if new_sum >= 17 and not (hit_on_soft_17 and new_is_soft):
+            if new_sum > 21:
+                busting += card_count
+            else:
+                not_busting += card_count
+            continue
+
+        new_rank_counts = rank_counts[:index] + (card_count - 1,) + rank_counts[index + 1:]
+        outcomes = __walk_dealer_tree(new_rank_counts, new_hard_sum, new_is_soft, hit_on_soft_17, memo)
+        not_busting += outcomes[0] * card_count
+        busting += outcomes[1] * card_count
+
+    memo[memo_key] = (not_busting, busting)
+    return memo[memo_key]
+
+
+def __enumerate_dealer_draws(open_card_index: int, is_standing: Callable[[int, bool], bool],
+                             hidden_card_index: int | None = None) -> dict[tuple[int, ...], tuple[int, int]]:
+    # Every multiset of cards the dealer draws to the open card (the hidden card is the first of them) till
+    # 'is_standing' by sum and softness -> the number of draw orders leading to it and the final sum.
+    # With 'hidden_card_index' only the orders starting by the hidden card of it
+    open_hard_sum = __HARD_VALUE_BY_INDEX[open_card_index]
+    patterns: dict[tuple[int, ...], tuple[int, int]] = {}
+    drawn = [0] * len(__HARD_VALUE_BY_INDEX)
+    if hidden_card_index is not None:
+        drawn[hidden_card_index] = 1
+    frontier: dict[tuple[int, ...], int] = {tuple(drawn): 1}
+    while frontier:
+        next_frontier: dict[tuple[int, ...], int] = {}
+        for drawn, orders_qty in frontier.items():
+            hard_sum = open_hard_sum + sum(qty * value for qty, value in zip(drawn, __HARD_VALUE_BY_INDEX))
+            is_soft = (open_card_index == __ACE_INDEX or drawn[__ACE_INDEX] > 0) and hard_sum <= 11
+            current_sum = hard_sum + 10 if is_soft else hard_sum
+            if any(drawn) and is_standing(current_sum, is_soft):
+                patterns[drawn] = (orders_qty, current_sum)
+                continue
+            for index in range(len(drawn)):
+                next_drawn = drawn[:index] + (drawn[index] + 1,) + drawn[index + 1:]
+                next_frontier[next_drawn] = next_frontier.get(next_drawn, 0) + orders_qty
+        frontier = next_frontier
+    return patterns
 
-        new_deck_cards = deck.remaining_cards
-        new_deck_cards.remove(card)
-        new_deck = CardDeck.of(deck.init_decks_qty, new_deck_cards)
 
-        bust, possibilities = __simulate_dealer(new_deck, new_hand, hit_on_soft_17)
+@lru_cache
+def __get_legacy_dealer_draw_patterns(open_card_index: int, hit_on_soft_17: bool) -> tuple[np.ndarray, ...]:
+    # Drawn multisets, their draw orders qtys and busting flags of the legacy dealer tree
+    patterns = __enumerate_dealer_draws(
+        open_card_index, lambda current_sum, is_soft: current_sum >= 17 and not (hit_on_soft_17 and is_soft),
+    )
+    return (
+        np.array(list(patterns.keys()), dtype=np.int64),
+        np.array([orders_qty for orders_qty, _ in patterns.values()], dtype=np.float64),
+        np.array([current_sum > 21 for _, current_sum in patterns.values()]),
+    )
 
-        total_bust += bust * card_count
-        total_possibilities += possibilities * card_count
 
-    return total_bust, total_possibilities
+@lru_cache
+def get_dealer_draw_patterns(open_card_index: int, hit_on_soft_17: bool,
+                             hidden_card_index: int | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # The 'DefaultGame' dealer: stands on 17, but hits soft 17 with 'hit_on_soft_17'. Drawn multisets, their draw
+    # orders qtys and outcomes by 'DealerFinalSumDistribution' fields
+    patterns = __enumerate_dealer_draws(
+        open_card_index, lambda current_sum, is_soft: current_sum > 17 or (
+            current_sum == 17 and not (hit_on_soft_17 and is_soft)
+        ), hidden_card_index,
+    )
+    drawn = np.array(list(patterns.keys()), dtype=np.int64)
+    final_sums = np.array([current_sum for _, current_sum in patterns.values()], dtype=np.int64)
+    return (
+        drawn,
+        np.array([orders_qty for orders_qty, _ in patterns.values()], dtype=np.float64),
+        np.where(
+            final_sums > 21, __BUST_OUTCOME,
+            np.where((final_sums == 21) & (drawn.sum(axis=1) == 1), __NATURAL_OUTCOME, final_sums - 17),
+        ),
+    )
+
+
+def __calculate_draw_weights(rank_counts: np.ndarray, drawn: np.ndarray, orders_qty: np.ndarray) -> np.ndarray:
+    # (compositions, multisets) weights of drawing multisets: draw orders * product of falling factorials of rank
+    # counts, it doesn't depend on draw order
+    factors = rank_counts[:, :, None] - np.arange(drawn.max())  # shape: (rows, ranks, drawn qty)
+    falling_factorials = np.concatenate([
+        np.ones(factors.shape[:2] + (1,)), np.cumprod(np.maximum(factors, 0), axis=2, dtype=np.float64),
+    ], axis=2)
+    weights = np.broadcast_to(orders_qty, (len(rank_counts), len(orders_qty))).copy()
+    for index in range(drawn.shape[1]):
+        weights *= falling_factorials[:, index, drawn[:, index]]
+    return weights
+
+
+def calculate_dealer_final_sum_distributions(rank_counts: np.ndarray, open_cards_indices: np.ndarray,
+                                             hit_on_soft_17=False, hidden_card_index: int | None = None) -> np.ndarray:
+    # Probabilities of 'DealerFinalSumDistribution' fields for many compositions at once, shape: (compositions, 7).
+    # Probability of a drawn multiset is its weight / falling factorial of cards qty by multiset size.
+    # With 'hidden_card_index' they are conditioned on the hidden card of it (zeros without such cards)
+    rank_counts = np.asarray(rank_counts, dtype=np.int64).reshape(-1, len(__HARD_VALUE_BY_INDEX))
+    open_cards_indices = np.asarray(open_cards_indices, dtype=np.int64).reshape(-1)
+    result = np.zeros((len(rank_counts), __DEALER_OUTCOMES_QTY), dtype=np.float64)
+    for open_card_index in np.unique(open_cards_indices).tolist():
+        rows = np.flatnonzero(open_cards_indices == open_card_index)
+        drawn, orders_qty, outcomes = get_dealer_draw_patterns(open_card_index, hit_on_soft_17, hidden_card_index)
+        drawn_qty = drawn.sum(axis=1)
+        cards_qty_factors = rank_counts[rows].sum(axis=1, keepdims=True) - np.arange(drawn_qty.max())
+        cards_qty_falling_factorials = np.concatenate([
+            np.ones((len(rows), 1)), np.cumprod(np.maximum(cards_qty_factors, 1), axis=1, dtype=np.float64),
+        ], axis=1)
+        probabilities = __calculate_draw_weights(rank_counts[rows], drawn, orders_qty) / cards_qty_falling_factorials[
+            :, drawn_qty
+        ]
+        result[rows] = probabilities @ np.eye(__DEALER_OUTCOMES_QTY)[outcomes]
+    if hidden_card_index is not None:  # Probabilities above are joint with the hidden card
+        hidden_cards_qty = rank_counts[:, hidden_card_index]
+        result *= np.divide(
+            rank_counts.sum(axis=1), hidden_cards_qty, out=np.zeros(len(rank_counts)), where=hidden_cards_qty > 0,
+        )[:, None]
+    return result
+
+
+def calculate_dealer_final_sum_distribution(deck: CardDeck, open_card: Card,
+                                            hit_on_soft_17=False) -> DealerFinalSumDistribution:
+    return DealerFinalSumDistribution(*__calculate_dealer_final_sum_distribution(
+        deck.rank_counts, CardDeck.get_rank_index(open_card), hit_on_soft_17,
+    ))
+
+
+@bounded_cache("probability_tools.dealer_final_sum_distribution")
+def __calculate_dealer_final_sum_distribution(rank_counts: tuple[int, ...], open_card_index: int,
+                                              hit_on_soft_17: bool) -> tuple[float, ...]:
+    return tuple(calculate_dealer_final_sum_distributions(
+        np.array([rank_counts]), np.array([open_card_index]), hit_on_soft_17=hit_on_soft_17,
+    )[0].tolist())
+
+
+def calculate_dealer_busting_probabilities(rank_counts: np.ndarray, open_cards_indices: np.ndarray,
+                                           hit_on_soft_17=False) -> np.ndarray:
+    # Vectorized 'calculate_dealer_busting_probability' (up to float rounding) for many compositions at once:
+    # leaves of the legacy dealer tree are drawn multisets
+    rank_counts = np.asarray(rank_counts, dtype=np.int64).reshape(-1, len(__HARD_VALUE_BY_INDEX))
+    open_cards_indices = np.asarray(open_cards_indices, dtype=np.int64).reshape(-1)
+    result = np.zeros(len(rank_counts), dtype=np.float64)
+    for open_card_index in np.unique(open_cards_indices).tolist():
+        rows = np.flatnonzero(open_cards_indices == open_card_index)
+        drawn, orders_qty, is_busting = __get_legacy_dealer_draw_patterns(open_card_index, hit_on_soft_17)
+        weights = __calculate_draw_weights(rank_counts[rows], drawn, orders_qty)
+        possibilities = weights.sum(axis=1)
+        busting_weights = weights[:, is_busting].sum(axis=1)
+        result[rows] = np.divide(
+            busting_weights, possibilities, out=np.zeros_like(busting_weights), where=possibilities > 0,
+        )
+    return result
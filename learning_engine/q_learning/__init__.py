@@ -1,4 +1,6 @@
-from . import strategies, misc_tools
+from . import strategies, misc_tools, parallel, planning
 from .base import (
-    QValue, QTable, QLearnerRewardAfterAction, QLearner,
+    QValue, QTable, QLearnerRewardAfterAction, QLearner, ReplayBuffer,
 )
+from .parallel import ParallelQLearnerTrainer, ParallelTrainingStats
+from .planning import DefaultGameValueIterationPlanner
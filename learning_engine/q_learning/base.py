@@ -1,8 +1,15 @@
-from environment import GameEnvironment, GameState, GameAction, GameActionResult
+from environment import (
+    GameEnvironment, VectorizedGameEnvironment, GameState, GameAction, GameActionResult, HitSuccessor,
+)
+import copy
+import importlib
+import json
+import os
 import pickle
+import struct
+import zlib
 from abc import ABC, abstractmethod
-from collections import defaultdict
-from typing import Callable
+from typing import Callable, Iterator
 import numpy as np
 
 
@@ -13,21 +20,69 @@ class QValue(float):
     NEUTRAL = 0.0
 
 
-class QTable:
-    __DEFAULT_INIT: dict[tuple[GameAction, ...], Callable[[GameState], np.ndarray]] = {}
+class _SortedStatesIndex:
+    # Read-only state -> row index by sorted int keys (e.g. memory-mapped); states of 'state_type' are packed into keys
+    def __init__(self, keys: np.ndarray, state_type: type | None):
+        self.__KEYS = keys
+        self.__STATE_TYPE = state_type
 
-    @classmethod
-    def __get_default_init(cls, *available_actions: GameAction):
-        return cls.__DEFAULT_INIT.setdefault(available_actions, (
-            lambda: np.full(len(available_actions), QValue.NEUTRAL)
-        ))
+    def __get_key(self, state: GameState) -> int | None:
+        if self.__STATE_TYPE is None:
+            return state if isinstance(state, int) else None
+        if not isinstance(state, self.__STATE_TYPE):
+            return None
+        try:
+            return state.pack()
+        except ValueError:
+            return None
+
+    def get(self, state: GameState, default: int | None = None) -> int | None:
+        key = self.__get_key(state)
+        if key is None or not 0 <= key < 2 ** 63:
+            return default
+        row = int(np.searchsorted(self.__KEYS, key))
+        if row < len(self.__KEYS) and int(self.__KEYS[row]) == key:
+            return row
+        return default
+
+    def __contains__(self, state: GameState) -> bool:
+        return self.get(state) is not None
+
+    def __len__(self) -> int:
+        return len(self.__KEYS)
+
+    def __iter__(self) -> Iterator[GameState]:
+        keys = self.__KEYS.tolist()
+        return iter(keys if self.__STATE_TYPE is None else map(self.__STATE_TYPE.unpack, keys))
+
+    def keys(self) -> Iterator[GameState]:
+        return iter(self)
+
+    def get_states(self, start: int, end: int) -> list[GameState]:  # Of rows [start, end)
+        keys = self.__KEYS[start:end].tolist()
+        return keys if self.__STATE_TYPE is None else list(map(self.__STATE_TYPE.unpack, keys))
+
+    def values(self) -> Iterator[int]:
+        return iter(range(len(self.__KEYS)))
+
+    def items(self) -> Iterator[tuple[GameState, int]]:
+        return zip(self, range(len(self.__KEYS)))
+
+
+class QTable:
+    # State -> row index and one (rows, actions) array growing geometrically; reads of unseen states don't insert them
+    __INITIAL_CAPACITY = 1024
+    __GROWTH_FACTOR = 2
 
     def __init__(self, *available_actions: GameAction, _from: dict[GameState, dict[GameAction, QValue]] | None = None):
         if len(available_actions) < 2:
             raise ValueError("Q-Table must provide 2 or more GameAction")
         self.__available_actions = available_actions
 
-        self.__table: dict[GameState, np.ndarray] = defaultdict(self.__get_default_init(*self.__available_actions))
+        self.__state_to_row: dict[GameState, int] = {}
+        self.__row_to_state: list[GameState] = []
+        self.__values = np.full((self.__INITIAL_CAPACITY, len(available_actions)), QValue.NEUTRAL)
+        self.__is_changed = np.zeros(self.__INITIAL_CAPACITY, dtype=bool)  # Rows set since the last 'take_changes'
 
         self.__action_to_index: dict[GameAction, int] = {}
         self.__index_to_action: dict[int, GameAction] = {}
@@ -36,60 +91,406 @@ class QTable:
             self.__index_to_action[index] = action
 
         if _from:
+            self.__reserve(len(_from))
             for state, action_value in _from.items():
+                row = self.__add_row(state)
                 for action, value in action_value.items():
-                    self.set_q_value(state, action, value)
+                    self.__values[row, self.__action_to_index[action]] = float(value)
+
+    def __reserve(self, rows_qty: int):
+        capacity = len(self.__values)
+        if rows_qty <= capacity:
+            return
+        capacity = max(capacity, self.__INITIAL_CAPACITY)
+        while capacity < rows_qty:
+            capacity *= self.__GROWTH_FACTOR
+        values = np.full((capacity, len(self.__available_actions)), QValue.NEUTRAL)
+        values[:len(self.__values)] = self.__values
+        self.__values = values
+        is_changed = np.zeros(capacity, dtype=bool)
+        is_changed[:len(self.__is_changed)] = self.__is_changed
+        self.__is_changed = is_changed
+
+    def __check_writable(self):
+        # Values of memory-mapped tables are read-only maps of the file (or merged with the journal in memory,
+        # but still indexed by the file keys), so every mutator fails here rather than deep inside of numpy
+        if isinstance(self.__state_to_row, _SortedStatesIndex):
+            raise ValueError("Memory-mapped Q-Table is read-only, set values of its 'copy'")
+
+    def __add_row(self, state: GameState) -> int:
+        # Values grow before the row is indexed, so the index never refers beyond them (see 'snapshot')
+        self.__check_writable()
+        row = len(self.__state_to_row)
+        self.__reserve(row + 1)
+        self.__state_to_row[state] = row
+        self.__row_to_state.append(state)
+        return row
 
     @property
     def available_actions(self) -> tuple[GameAction, ...]:
         return self.__available_actions
 
-    def set_q_value(self, state: GameState, action: GameAction, value: QValue):
-        self.__table[state][self.__action_to_index[action]] = float(value)
+    def set_q_value(self, state: GameState, action: GameAction, value: QValue) -> bool:
+        # Returns whether the best action of the state has changed
+        self.__check_writable()
+        row = self.__state_to_row.get(state)
+        if row is None:
+            row = self.__add_row(state)
+        row_values = self.__values[row]
+        best_index = row_values.argmax()
+        row_values[self.__action_to_index[action]] = float(value)
+        self.__is_changed[row] = True  # After the value (see 'take_changes')
+        return bool(row_values.argmax() != best_index)
 
     def get_q_value(self, state: GameState, action: GameAction) -> QValue:
-        return QValue(self.__table[state][self.__action_to_index[action]])
+        row = self.__state_to_row.get(state)
+        if row is None:
+            return QValue(QValue.NEUTRAL)
+        return QValue(self.__values[row, self.__action_to_index[action]])
 
     def get_best_action(self, state: GameState) -> GameAction:
-        return self.__index_to_action[np.argmax(self.__table[state])]
+        row = self.__state_to_row.get(state)
+        if row is None:
+            return self.__index_to_action[0]  # All values are neutral
+        return self.__index_to_action[int(np.argmax(self.__values[row]))]
 
     def get_max_q_value(self, state: GameState) -> QValue:
-        return QValue(np.max(self.__table[state]))
+        row = self.__state_to_row.get(state)
+        if row is None:
+            return QValue(QValue.NEUTRAL)
+        return QValue(np.max(self.__values[row]))
+
+    # Row level access for vectorized updates. Row -1 stands for an unseen state and reads as neutral values
+
+    def get_action_index(self, action: GameAction) -> int:
+        return self.__action_to_index[action]
+
+    def get_row(self, state: GameState, add=False) -> int:
+        row = self.__state_to_row.get(state)
+        if row is None:
+            return self.__add_row(state) if add else -1
+        return row
+
+    def get_states(self, rows: np.ndarray) -> list[GameState]:
+        if isinstance(self.__state_to_row, _SortedStatesIndex):
+            return [self.__state_to_row.get_states(row, row + 1)[0] for row in np.asarray(rows).tolist()]
+        return [self.__row_to_state[row] for row in np.asarray(rows).tolist()]
+
+    def get_rows_values(self, rows: np.ndarray) -> np.ndarray:
+        values = self.__values[rows]
+        values[rows < 0] = QValue.NEUTRAL
+        return values
+
+    def add_to_q_values(self, rows: np.ndarray, action_indices: np.ndarray, deltas: np.ndarray) -> int:
+        # Repeated (row, action) pairs are summed up. Returns QTY of rows with changed best actions
+        self.__check_writable()
+        updated_rows = np.unique(rows)
+        best_indices = self.__values[updated_rows].argmax(axis=1)
+        np.add.at(self.__values, (rows, action_indices), deltas)
+        self.__is_changed[rows] = True  # After the values (see 'take_changes')
+        return int(np.count_nonzero(self.__values[updated_rows].argmax(axis=1) != best_indices))
 
     def __contains__(self, state: GameState) -> bool:
-        return state in self.__table
+        return state in self.__state_to_row
 
     def __len__(self) -> int:
-        return len(self.__table)
+        return len(self.__state_to_row)
 
     def to_dict(self) -> dict[GameState, dict[GameAction, QValue]]:
+        values = self.__values[:len(self.__state_to_row)].tolist()
         return {
             state: {
-                action: QValue(values[index])
+                action: QValue(values[row][index])
                 for action, index in self.__action_to_index.items()
             }
-            for state, values in self.__table.items()
+            for state, row in self.__state_to_row.items()
         }
 
+    def iterate_chunks(self, chunk_size: int) -> Iterator[tuple[list[GameState], np.ndarray]]:
+        # States and copies of their values by consecutive rows, in 'to_dict' order. Memory-mapped tables are read from
+        # disk chunk by chunk, so tables larger than memory can be streamed
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be greater than 0")
+        for start in range(0, len(self.__state_to_row), chunk_size):
+            end = min(start + chunk_size, len(self.__state_to_row))
+            if isinstance(self.__state_to_row, _SortedStatesIndex):
+                states = self.__state_to_row.get_states(start, end)
+            else:
+                states = self.__row_to_state[start:end]
+            yield states, self.__values[start:end].astype(np.float64)
+
     def copy(self) -> 'QTable':
         return QTable(*self.__available_actions, _from=self.to_dict())
 
-    def save(self, filename: str):
-        dict_to_save = {
-            "available_actions": self.__available_actions,
-            "q_table": self.to_dict(),
-        }
-        with open(filename, 'wb') as f:
-            pickle.dump(dict_to_save, f)
+    def snapshot(self) -> 'QTable':
+        # Cheap consistent copy, safe while one other thread (or the code interrupted by a signal handler) sets values:
+        # both copies are single C calls under GIL, and rows taken by the index copy already exist in the values
+        if isinstance(self.__state_to_row, _SortedStatesIndex):
+            return self  # Read-only
+        state_to_row = self.__state_to_row.copy()
+        q_table = QTable(*self.__available_actions)
+        q_table.__values = self.__values[:len(state_to_row)].copy()
+        q_table.__is_changed = np.zeros(len(state_to_row), dtype=bool)
+        q_table.__state_to_row = state_to_row
+        q_table.__row_to_state = list(state_to_row)
+        return q_table
+
+    def take_changes(self) -> tuple[list[GameState], np.ndarray]:
+        # States and values (states, actions) set since the previous call. Safe while one other thread sets values:
+        # flags are cleared before values are taken and set after values are written, so a change can be
+        # taken twice, but never lost
+        if isinstance(self.__state_to_row, _SortedStatesIndex):
+            return [], np.empty((0, len(self.__available_actions)))  # Read-only
+        is_changed = self.__is_changed
+        rows = np.flatnonzero(is_changed)
+        is_changed[rows] = False
+        return [self.__row_to_state[row] for row in rows.tolist()], self.__values[rows]
+
+    def map_states(self, function: Callable[[GameState], GameState]) -> 'QTable':
+        # E.g. 'DefaultGameState.pack' / 'DefaultGameState.unpack' to convert a table between state representations
+        return QTable(*self.__available_actions, _from={
+            function(state): action_value for state, action_value in self.to_dict().items()
+        })
+
+    # Binary format: header, JSON metadata (actions, type of packed states and journal id), zero padding up to 64 bytes
+    # alignment, sorted int64 keys, (states, actions) value matrix of float32 or float64. States must be ints or
+    # reversibly packed by 'pack' / 'unpack' of their type, otherwise the table is saved in legacy pickle format.
+    # Journal '<filename>.journal' of the base with the same id: header and appended blocks of changed rows
+    # (records qty, CRC32 of payload, int64 keys, float64 values), the latest record of a state wins
+    __MAGIC = b"TBJHQTBL"
+    __VERSION = 1
+    __HEADER = struct.Struct("<8sIIIIQ")  # magic, version, value itemsize, actions qty, metadata size, states qty
+    __ALIGNMENT = 64
+    __JOURNAL_MAGIC = b"TBJHJRNL"
+    __JOURNAL_HEADER = struct.Struct("<8sIQ")  # magic, version, journal id
+    __JOURNAL_BLOCK_HEADER = struct.Struct("<QI")  # records qty, CRC32 of keys and values
+
+    @staticmethod
+    def __pack(states: list[GameState]) -> tuple[np.ndarray, type | None] | None:
+        state_types = set(map(type, states))
+        if state_types <= {int}:
+            state_type, keys = None, states
+        elif len(state_types) == 1 and hasattr(state_type := state_types.pop(), "unpack"):
+            try:
+                keys = [state.pack() for state in states]
+            except ValueError:
+                return None
+            if any(state_type.unpack(key) != state for key, state in zip(keys, states)):
+                return None
+        else:
+            return None
+        if keys and not (min(keys) >= 0 and max(keys) < 2 ** 63):
+            return None
+        return np.array(keys, dtype=np.int64).reshape(-1), state_type
+
+    @staticmethod
+    def __get_type_name(state_type: type | None) -> str | None:
+        return None if state_type is None else f"{state_type.__module__}.{state_type.__qualname__}"
+
+    @staticmethod
+    def __get_journal_filename(filename: str) -> str:
+        return f"{filename}.journal"
+
+    @classmethod
+    def __read_header(cls, filename: str) -> tuple[dict, int, int, int, int] | None:
+        # Metadata, value itemsize, actions qty, states qty and keys offset of a binary file, None for a legacy one
+        with open(filename, 'rb') as f:
+            header = f.read(cls.__HEADER.size)
+            if header[:len(cls.__MAGIC)] != cls.__MAGIC:
+                return None
+            magic, version, itemsize, actions_qty, metadata_size, states_qty = cls.__HEADER.unpack(header)
+            metadata = json.loads(f.read(metadata_size))
+        if version != cls.__VERSION or itemsize not in (4, 8):
+            raise ValueError(f"Unsupported Q-Table format of {filename}")
+        keys_offset = -(-(cls.__HEADER.size + metadata_size) // cls.__ALIGNMENT) * cls.__ALIGNMENT
+        return metadata, itemsize, actions_qty, states_qty, keys_offset
+
+    @classmethod
+    def __read_journal(cls, filename: str, journal_id: int | None, actions_qty: int,
+                       with_blocks: bool) -> tuple[int, list[tuple[np.ndarray, np.ndarray]]] | None:
+        # Size of the valid part and blocks of the base journal, None if there is no journal of this base.
+        # A torn last block (by crash while appending) isn't a part of the journal; CRC is checked with blocks only
+        try:
+            f = open(cls.__get_journal_filename(filename), 'rb')
+        except FileNotFoundError:
+            return None
+        with f:
+            header = f.read(cls.__JOURNAL_HEADER.size)
+            if len(header) < cls.__JOURNAL_HEADER.size or journal_id is None:
+                return None
+            magic, version, header_journal_id = cls.__JOURNAL_HEADER.unpack(header)
+            if magic != cls.__JOURNAL_MAGIC or version != cls.__VERSION or header_journal_id != journal_id:
+                return None
+            file_size = os.fstat(f.fileno()).st_size
+            valid_size = f.tell()
+            blocks = []
+            while valid_size + cls.__JOURNAL_BLOCK_HEADER.size <= file_size:
+                records_qty, crc = cls.__JOURNAL_BLOCK_HEADER.unpack(f.read(cls.__JOURNAL_BLOCK_HEADER.size))
+                payload_size = records_qty * 8 * (1 + actions_qty)
+                block_end = valid_size + cls.__JOURNAL_BLOCK_HEADER.size + payload_size
+                if block_end > file_size:
+                    break
+                if with_blocks:
+                    payload = f.read(payload_size)
+                    if zlib.crc32(payload) != crc:
+                        break
+                    keys = np.frombuffer(payload, dtype=np.int64, count=records_qty)
+                    values = np.frombuffer(payload, dtype=np.float64, offset=8 * records_qty)
+                    blocks.append((keys, values.reshape(records_qty, actions_qty)))
+                else:
+                    f.seek(block_end)
+                valid_size = block_end
+        return valid_size, blocks
+
+    def save(self, filename: str, dtype: type = np.float64):
+        # Full base; the journal of the previous base is replaced by an empty one
+        states = list(self.__state_to_row.keys())
+        rows = np.fromiter(self.__state_to_row.values(), dtype=np.int64, count=len(states))
+        packed_states = self.__pack(states)
+        if packed_states is None:
+            dict_to_save = {
+                "available_actions": self.__available_actions,
+                "q_table": self.to_dict(),
+            }
+            temp_filename = f"{filename}.tmp"
+            with open(temp_filename, 'wb') as f:
+                pickle.dump(dict_to_save, f)
+                f.flush()
+                os.fsync(f.fileno())  # Before the replace, as journal records are, so a crash never leaves a torn file
+            os.replace(temp_filename, filename)
+            if os.path.exists(self.__get_journal_filename(filename)):
+                os.remove(self.__get_journal_filename(filename))
+            return
+
+        keys, state_type = packed_states
+        order = np.argsort(keys)
+        keys = keys[order]
+        values = self.__values[rows[order]].astype(dtype)
+        journal_id = int.from_bytes(os.urandom(8), 'little')
+        metadata = json.dumps({
+            "available_actions": [action.name for action in self.__available_actions],
+            "state_type": self.__get_type_name(state_type),
+            "journal_id": journal_id,
+        }).encode()
+        header = self.__HEADER.pack(
+            self.__MAGIC, self.__VERSION, values.itemsize, len(self.__available_actions), len(metadata), len(keys),
+        ) + metadata
+        temp_filename = f"{filename}.tmp"
+        with open(temp_filename, 'wb') as f:
+            f.write(header.ljust(-(-len(header) // self.__ALIGNMENT) * self.__ALIGNMENT, b"\0"))
+            f.write(keys.tobytes())
+            f.write(values.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_filename, filename)  # The old journal doesn't match the new base from this moment
+
+        journal_filename = self.__get_journal_filename(filename)
+        with open(f"{journal_filename}.tmp", 'wb') as f:
+            f.write(self.__JOURNAL_HEADER.pack(self.__JOURNAL_MAGIC, self.__VERSION, journal_id))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{journal_filename}.tmp", journal_filename)
+
+    def save_changes(self, filename: str, max_journal_ratio: float = 0.5):
+        # Appends values set since the previous 'take_changes' to the journal of the 'filename' base, safe while
+        # one other thread sets values. If there is no journal of a matching binary base or the journal would outgrow
+        # 'max_journal_ratio' of the base size, a snapshot is saved as the new base instead (compaction).
+        # If saving fails (e.g. the disk is full), the taken changes are left for the next call
+        states, values = self.take_changes()
+        try:
+            self.__save_taken_changes(filename, states, values, max_journal_ratio)
+        except BaseException:
+            self.__is_changed[[self.__state_to_row[state] for state in states]] = True
+            raise
+
+    def __save_taken_changes(self, filename: str, states: list[GameState], values: np.ndarray,
+                             max_journal_ratio: float):
+        packed_states = self.__pack(states)
+        try:
+            header = self.__read_header(filename)
+        except (OSError, ValueError, struct.error):
+            header = None
+        journal = None
+        if header is not None and packed_states is not None:
+            metadata, _, actions_qty, _, _ = header
+            keys, state_type = packed_states
+            if metadata["available_actions"] == [action.name for action in self.__available_actions] and (
+                len(states) == 0 or metadata["state_type"] == self.__get_type_name(state_type)
+            ):
+                journal = self.__read_journal(filename, metadata.get("journal_id"), actions_qty, with_blocks=False)
+        if journal is not None:
+            if len(states) == 0:
+                return
+            valid_size, _ = journal
+            payload = keys.tobytes() + np.ascontiguousarray(values, dtype=np.float64).tobytes()
+            if valid_size + self.__JOURNAL_BLOCK_HEADER.size + len(payload) <= max_journal_ratio * os.path.getsize(filename):
+                with open(self.__get_journal_filename(filename), 'r+b') as f:
+                    f.truncate(valid_size)
+                    f.seek(valid_size)
+                    f.write(self.__JOURNAL_BLOCK_HEADER.pack(len(keys), zlib.crc32(payload)))
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+                return
+        self.snapshot().save(filename)
 
     @classmethod
-    def load(cls, filename: str) -> 'QTable':
+    def load(cls, filename: str, memory_mapped=False) -> 'QTable':
+        # Legacy pickle files are converted on load (and saved in binary format by the next 'save').
+        # Memory-mapped tables are read-only and load in constant time if the journal is empty;
+        # journal records are merged in memory. Legacy files are always loaded to memory
         try:
-            with open(filename, 'rb') as f:
-                saved_dict = pickle.load(f)
+            header = cls.__read_header(filename)
+            if header is None:
+                with open(filename, 'rb') as f:
+                    saved_dict = pickle.load(f)
                 return QTable(*saved_dict["available_actions"], _from=saved_dict["q_table"])
-        except (pickle.PickleError, EOFError, FileNotFoundError):
+            metadata, itemsize, actions_qty, states_qty, keys_offset = header
+            available_actions = tuple(GameAction[name] for name in metadata["available_actions"])
+            state_type = None
+            if metadata["state_type"] is not None:
+                module_name, _, type_name = metadata["state_type"].rpartition(".")
+                state_type = getattr(importlib.import_module(module_name), type_name)
+        except (pickle.PickleError, EOFError, FileNotFoundError, struct.error, json.JSONDecodeError,
+                KeyError, AttributeError, ImportError):
+            raise ValueError(f"Error loading Q-Table from {filename}")
+
+        values_offset = keys_offset + 8 * states_qty
+        dtype = np.float32 if itemsize == 4 else np.float64
+        if len(available_actions) != actions_qty or os.path.getsize(filename) < values_offset + states_qty * actions_qty * itemsize:
             raise ValueError(f"Error loading Q-Table from {filename}")
+        if states_qty == 0:
+            keys, values = np.empty(0, dtype=np.int64), np.empty((0, actions_qty), dtype=dtype)
+        else:
+            keys = np.memmap(  # Plain ndarray views skip 'np.memmap' overhead on every lookup
+                filename, dtype=np.int64, mode='r', offset=keys_offset, shape=(states_qty,),
+            ).view(np.ndarray)
+            values = np.memmap(
+                filename, dtype=dtype, mode='r', offset=values_offset, shape=(states_qty, actions_qty),
+            ).view(np.ndarray)
+
+        journal = cls.__read_journal(filename, metadata.get("journal_id"), actions_qty, with_blocks=True)
+        if journal is not None and journal[1]:
+            keys = np.concatenate([keys] + [block_keys for block_keys, _ in journal[1]])
+            values = np.concatenate([values.astype(np.float64)] + [block_values for _, block_values in journal[1]])
+            _, reversed_indices = np.unique(keys[::-1], return_index=True)
+            latest = len(keys) - 1 - reversed_indices  # Sorted by key
+            keys, values = keys[latest], values[latest]
+            states_qty = len(keys)
+
+        q_table = QTable(*available_actions)
+        if states_qty == 0:
+            return q_table
+        if memory_mapped:
+            q_table.__state_to_row = _SortedStatesIndex(keys, state_type)
+            q_table.__values = values
+        else:
+            states = keys.tolist() if state_type is None else list(map(state_type.unpack, keys.tolist()))
+            q_table.__reserve(states_qty)
+            q_table.__values[:states_qty] = values
+            q_table.__state_to_row = dict(zip(states, range(states_qty)))
+            q_table.__row_to_state = states
+        return q_table
 
 
 class QLearnerRewardAfterAction(float):
@@ -98,8 +499,71 @@ class QLearnerRewardAfterAction(float):
     pass
 
 
+class ReplayBuffer:
+    # Preallocated ring buffer of transitions by Q-Table rows for vectorized TD updates by minibatches.
+    # Every transition is sampled 'replay_ratio' times on average. Next state without a row gets it when it's pushed
+    # as a state (usually by the next transition), until then it's read as neutral like by the one transition update
+    def __init__(self, capacity: int = 2 ** 16, batch_size: int = 256, replay_ratio: float = 1.0,
+                 seed: int | np.random.Generator | None = None):
+        if capacity < 1 or batch_size < 1:
+            raise ValueError("Capacity and batch size must be greater than 0")
+        if replay_ratio <= 0:
+            raise ValueError("Replay ratio must be greater than 0")
+        self.__CAPACITY = capacity
+        self.__BATCH_SIZE = batch_size
+        self.__REPLAY_RATIO = replay_ratio
+        self.__RNG = np.random.default_rng(seed)
+
+        self.__state_rows = np.empty(capacity, dtype=np.int64)
+        self.__action_indices = np.empty(capacity, dtype=np.int64)
+        self.__rewards = np.empty(capacity, dtype=np.float64)
+        self.__next_state_rows = np.empty(capacity, dtype=np.int64)
+        self.__pushed_qty = 0
+        self.__due_qty = 0.0  # Transitions to sample
+        self.__unresolved: dict[GameState, list[int]] = {}  # Next state -> push numbers of transitions waiting for its row
+
+    def __len__(self) -> int:
+        return min(self.__pushed_qty, self.__CAPACITY)
+
+    @property
+    def is_batch_due(self) -> bool:
+        return self.__due_qty >= self.__BATCH_SIZE
+
+    def push(self, q_table: QTable, state: GameState, action: GameAction, reward: float, next_state: GameState):
+        state_row = q_table.get_row(state, add=True)
+        oldest_kept = self.__pushed_qty - self.__CAPACITY
+        for push_number in self.__unresolved.pop(state, ()):
+            if push_number >= oldest_kept:
+                self.__next_state_rows[push_number % self.__CAPACITY] = state_row
+
+        next_state_row = q_table.get_row(next_state)
+        if next_state_row < 0:
+            self.__unresolved.setdefault(next_state, []).append(self.__pushed_qty)
+
+        slot = self.__pushed_qty % self.__CAPACITY
+        self.__state_rows[slot] = state_row
+        self.__action_indices[slot] = q_table.get_action_index(action)
+        self.__rewards[slot] = reward
+        self.__next_state_rows[slot] = next_state_row
+        self.__pushed_qty += 1
+        self.__due_qty += self.__REPLAY_RATIO
+        if slot == self.__CAPACITY - 1:  # Drop next states never pushed while their transitions were overwritten
+            oldest_kept = self.__pushed_qty - self.__CAPACITY
+            self.__unresolved = {
+                next_state: push_numbers for next_state, push_numbers in self.__unresolved.items()
+                if push_numbers[-1] >= oldest_kept
+            }
+
+    def sample(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        # State rows, action indices, rewards, next state rows
+        self.__due_qty = max(0.0, self.__due_qty - self.__BATCH_SIZE)
+        slots = self.__RNG.integers(0, len(self), self.__BATCH_SIZE)
+        return self.__state_rows[slots], self.__action_indices[slots], self.__rewards[slots], self.__next_state_rows[slots]
+
+
 class QLearner(ABC):
-    def __init__(self, game_environment: GameEnvironment, alpha: float, gamma: float, q_table: QTable | None = None):
+    def __init__(self, game_environment: GameEnvironment | VectorizedGameEnvironment, alpha: float, gamma: float,
+                 q_table: QTable | None = None, replay_buffer: ReplayBuffer | None = None, expected_hit_updates=False):
         if not 0 <= alpha <= 1:
             raise ValueError("Alpha must be in diapason [0-1]")
         self._ALPHA = alpha
@@ -109,6 +573,38 @@ class QLearner(ABC):
 
         self.Q_TABLE = q_table if q_table else QTable(*game_environment.available_actions)
         self._GAME_ENVIRONMENT = game_environment
+        self._REPLAY_BUFFER = replay_buffer
+        # HIT target by every next card from 'get_hit_successors' of the environment, not only by the drawn one
+        self._EXPECTED_HIT_UPDATES = expected_hit_updates
+        if replay_buffer is not None and expected_hit_updates:
+            raise ValueError("Experience replay doesn't support expected HIT updates")
+        self.__check_hit_successors_support(game_environment)
+        self._round_start_value = QValue.NEUTRAL  # Running mean of max Q of the first states of rounds
+        self._policy_changes_qty = 0
+        self.__changed_states: dict[GameState, None] | None = None  # Ordered set, see '_take_changed_states'
+
+    @property
+    def policy_changes_qty(self) -> int:  # Changes of greedy actions of states by updates of the learner
+        return self._policy_changes_qty
+
+    # Every update of the learner sets values by '_set_q_value' or '_add_to_q_values'
+
+    def _set_q_value(self, state: GameState, action: GameAction, value: QValue):
+        self._policy_changes_qty += self.Q_TABLE.set_q_value(state, action, value)
+        if self.__changed_states is not None:
+            self.__changed_states[state] = None
+
+    def _add_to_q_values(self, rows: np.ndarray, action_indices: np.ndarray, deltas: np.ndarray):
+        self._policy_changes_qty += self.Q_TABLE.add_to_q_values(rows, action_indices, deltas)
+        if self.__changed_states is not None:
+            self.__changed_states.update(dict.fromkeys(self.Q_TABLE.get_states(np.unique(rows))))
+
+    def _take_changed_states(self) -> list[GameState]:
+        # States set by updates since the previous call, for 'ParallelQLearnerTrainer' broadcasts. Tracked since
+        # the first call, the states are none then
+        changed_states = self.__changed_states
+        self.__changed_states = {}
+        return [] if changed_states is None else list(changed_states)
 
     @abstractmethod
     def _choose_action(self, state: GameState) -> GameAction:
@@ -118,20 +614,121 @@ class QLearner(ABC):
     def _get_reward_for_action_result(self, action_result: GameActionResult) -> QLearnerRewardAfterAction:
         pass
 
+    def __check_hit_successors_support(self, game_environment: GameEnvironment | VectorizedGameEnvironment):
+        if self._EXPECTED_HIT_UPDATES and not game_environment.supports_hit_successors:
+            raise ValueError(f"{type(game_environment).__name__} doesn't provide HIT successors")
+
+    def _spawn_actor(self, game_environment: GameEnvironment | VectorizedGameEnvironment, seed: int) -> 'QLearner':
+        # Copy of the learner playing own environment for 'ParallelQLearnerTrainer' actors
+        self.__check_hit_successors_support(game_environment)
+        actor = copy.copy(self)
+        actor._GAME_ENVIRONMENT = game_environment
+        actor._REPLAY_BUFFER = None  # Actors don't update Q-Table themselves
+        actor.__changed_states = None
+        return actor
+
+    def _process_transition(self, state: GameState, action: GameAction, action_result: GameActionResult,
+                            next_state: GameState, hit_successors: list[HitSuccessor] | None = None):
+        reward = self._get_reward_for_action_result(action_result)
+        if not self._EXPECTED_HIT_UPDATES:
+            self._update_q_table(state=state, action=action, reward=reward, next_state=next_state)
+            return
+        if action_result != GameActionResult.WAIT_ACTION:  # The next state starts a new round
+            self._round_start_value = QValue(self._round_start_value + self._ALPHA * (
+                self.Q_TABLE.get_max_q_value(next_state) - self._round_start_value
+            ))
+        if hit_successors is None:
+            self._update_q_table(state=state, action=action, reward=reward, next_state=next_state)
+        else:
+            self._update_q_table_by_hit_successors(state=state, action=action, hit_successors=hit_successors)
+
+    def _update_q_table_by_hit_successors(self, state: GameState, action: GameAction, hit_successors: list[HitSuccessor]):
+        # Expected target over every next card with max Q of successors. The round is over by some of them, so
+        # their next state is the first one of a new round and is valued by the running mean of such states
+        next_rows = np.array([
+            -1 if successor.state is None else self.Q_TABLE.get_row(successor.state) for successor in hit_successors
+        ])
+        next_values = self.Q_TABLE.get_rows_values(next_rows).max(axis=1)
+        target = 0.0
+        for (probability, result, next_state), next_value in zip(hit_successors, next_values.tolist()):
+            if next_state is None:
+                next_value = self._round_start_value
+            target += probability * (self._get_reward_for_action_result(result) + self._GAMMA * next_value)
+        current_q = self.Q_TABLE.get_q_value(state, action)
+        self._set_q_value(state, action, QValue(current_q + self._ALPHA * (target - current_q)))
+
     def _update_q_table(self, state: GameState, action: GameAction, reward: QLearnerRewardAfterAction, next_state: GameState):
+        if self._REPLAY_BUFFER is not None:
+            self._REPLAY_BUFFER.push(self.Q_TABLE, state, action, reward, next_state)
+            while self._REPLAY_BUFFER.is_batch_due:
+                self._update_q_table_by_batch(*self._REPLAY_BUFFER.sample())
+            return
         current_q = self.Q_TABLE.get_q_value(state, action)
         max_next_q = self.Q_TABLE.get_max_q_value(next_state)
         new_q = QValue(current_q + self._ALPHA * (reward + self._GAMMA * max_next_q - current_q))
-        self.Q_TABLE.set_q_value(state, action, new_q)
+        self._set_q_value(state, action, new_q)
+
+    def _update_q_table_by_batch(self, state_rows: np.ndarray, action_indices: np.ndarray, rewards: np.ndarray,
+                                 next_state_rows: np.ndarray):
+        # TD errors are taken by values before the batch. Repeated (state, action) pairs are updated once by their mean
+        # TD error and by 1 - (1 - alpha) ^ repeats of the way, as one by one updates towards the same target would do
+        actions_qty = len(self.Q_TABLE.available_actions)
+        current_q = self.Q_TABLE.get_rows_values(state_rows)[np.arange(len(state_rows)), action_indices]
+        max_next_q = self.Q_TABLE.get_rows_values(next_state_rows).max(axis=1)
+        td_errors = rewards + self._GAMMA * max_next_q - current_q
+        pairs, inverse, repeats = np.unique(
+            state_rows * actions_qty + action_indices, return_inverse=True, return_counts=True,
+        )
+        mean_td_errors = np.bincount(inverse, weights=td_errors, minlength=len(pairs)) / repeats
+        self._add_to_q_values(
+            pairs // actions_qty, pairs % actions_qty, (1 - (1 - self._ALPHA) ** repeats) * mean_td_errors,
+        )
+
+    def __train_vectorized(self, episodes: int):
+        tables_qty = self._GAME_ENVIRONMENT.tables_qty
+        started_episodes = min(episodes, tables_qty)
+        tables = np.arange(started_episodes)
+        self._GAME_ENVIRONMENT.reset(tables)
+        states = dict(zip(tables.tolist(), self._GAME_ENVIRONMENT.get_states(tables)))
+        while len(tables) > 0:
+            actions = [self._choose_action(states[table]) for table in tables.tolist()]
+            hit_successors = {}
+            if self._EXPECTED_HIT_UPDATES:
+                hit_tables = tables[[action == GameAction.HIT for action in actions]]
+                hit_successors = dict(zip(hit_tables.tolist(), self._GAME_ENVIRONMENT.get_hit_successors(hit_tables)))
+            action_results = self._GAME_ENVIRONMENT.play(actions, tables)
+            next_states = self._GAME_ENVIRONMENT.get_states(tables)
+            for table, action, action_result, next_state in zip(tables.tolist(), actions, action_results, next_states):
+                self._process_transition(
+                    state=states[table], action=action, action_result=GameActionResult(action_result),
+                    next_state=next_state, hit_successors=hit_successors.get(table),
+                )
+                states[table] = next_state
+
+            terminated = tables[self._GAME_ENVIRONMENT.is_terminated[tables]]
+            restarted = terminated[:max(0, episodes - started_episodes)]
+            started_episodes += len(restarted)
+            if len(restarted) > 0:
+                self._GAME_ENVIRONMENT.reset(restarted)
+                states.update(zip(restarted.tolist(), self._GAME_ENVIRONMENT.get_states(restarted)))
+            tables = np.setdiff1d(tables, terminated[len(restarted):], assume_unique=True)
 
     def train(self, episodes: int):
+        if isinstance(self._GAME_ENVIRONMENT, VectorizedGameEnvironment):
+            self.__train_vectorized(episodes)
+            return
         for _ in range(episodes):
             self._GAME_ENVIRONMENT.reset()
             state = self._GAME_ENVIRONMENT.state
             while not self._GAME_ENVIRONMENT.is_terminated:
                 action = self._choose_action(state)
+                hit_successors = None
+                if self._EXPECTED_HIT_UPDATES and action == GameAction.HIT:
+                    hit_successors = self._GAME_ENVIRONMENT.get_hit_successors()
                 action_result = self._GAME_ENVIRONMENT.play(action)
-                reward = self._get_reward_for_action_result(action_result)
                 next_state = self._GAME_ENVIRONMENT.state
-                self._update_q_table(state=state, action=action, reward=reward, next_state=next_state)
+                self._process_transition(
+                    state=state, action=action, action_result=action_result, next_state=next_state,
+                    hit_successors=hit_successors,
+                )
                 state = next_state
@@ -1 +1,2 @@
-from .q_table_tools import QTableStatesParser, QTableNarrower
+from .q_table_tools import QTableStatesParser, QTableNarrower, StreamingQTableNarrower
+from .checkpoint_tools import QTableCheckpointer
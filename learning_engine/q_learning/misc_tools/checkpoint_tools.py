@@ -0,0 +1,67 @@
+from ..base import QTable
+import logging
+import threading
+
+
+class QTableCheckpointer:
+    # Saves checkpoints of a Q-Table by a background writer, so training keeps stepping while a checkpoint is written.
+    # Requests only set a flag (safe from timers and signal handlers): all requests made while the writer is busy
+    # are coalesced into one next checkpoint. Journaled checkpoints append only changed values ('QTable.save_changes'),
+    # otherwise a full snapshot is saved every time
+    def __init__(self, q_table: QTable, filename: str, journaled=True, max_journal_ratio: float = 0.5):
+        self.__Q_TABLE = q_table
+        self.__FILENAME = filename
+        self.__JOURNALED = journaled
+        self.__MAX_JOURNAL_RATIO = max_journal_ratio
+
+        self.__CONDITION = threading.Condition(threading.RLock())  # Reentrant for a signal handler in a waiting thread
+        self.__is_requested = False
+        self.__is_writing = False
+        self.__is_closed = False
+        self.__saved_qty = 0
+
+        self.__WRITER = threading.Thread(target=self.__write_loop, name="Q-Table checkpoint writer", daemon=True)
+        self.__WRITER.start()
+
+    @property
+    def saved_qty(self) -> int:
+        return self.__saved_qty
+
+    def request(self):
+        with self.__CONDITION:
+            if self.__is_closed:
+                raise ValueError("QTableCheckpointer is closed")
+            self.__is_requested = True
+            self.__CONDITION.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        # Wait for requested checkpoints to be written, False on timeout
+        with self.__CONDITION:
+            return self.__CONDITION.wait_for(lambda: not self.__is_requested and not self.__is_writing, timeout)
+
+    def close(self, timeout: float | None = None):
+        with self.__CONDITION:
+            self.__is_closed = True
+            self.__CONDITION.notify_all()
+        self.__WRITER.join(timeout)
+
+    def __write_loop(self):
+        while True:
+            with self.__CONDITION:
+                self.__CONDITION.wait_for(lambda: self.__is_requested or self.__is_closed)
+                if not self.__is_requested:
+                    return
+                self.__is_requested = False
+                self.__is_writing = True
+            try:
+                if self.__JOURNALED:
+                    self.__Q_TABLE.save_changes(self.__FILENAME, max_journal_ratio=self.__MAX_JOURNAL_RATIO)
+                else:
+                    self.__Q_TABLE.snapshot().save(self.__FILENAME)  # 'QTable.save' replaces the file atomically
+                self.__saved_qty += 1
+            except Exception:
+                logging.error(f"Error saving Q-Table checkpoint to {self.__FILENAME}", exc_info=True)
+            finally:
+                with self.__CONDITION:
+                    self.__is_writing = False
+                    self.__CONDITION.notify_all()
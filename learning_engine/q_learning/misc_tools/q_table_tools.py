@@ -1,108 +1,472 @@
 from ..base import QValue, QTable
 from environment import GameState, GameAction
+from environment.cache_tools import BoundedCache, CacheStats
 from abc import ABC, abstractmethod
-from statistics import mode, median
-from typing import Callable
+from typing import Callable, Hashable
+import functools
+import multiprocessing
+import os
+import pickle
+import tempfile
+import numpy as np
 from progress.bar import Bar
 
 
+class _GridIndex:
+    # Uniform grid over points with a few points per cell: cells are visited by Chebyshev rings around the cell of
+    # a target point, while points of the next ring can be closer by L1 distance than the found ones
+    __POINTS_PER_CELL = 8
+    __SCAN_MAX_QTY = 512  # Points of smaller indexes are just scanned
+    __TOLERANCE = 1e-9  # Of cell bounds by rounding of coordinates
+    __RINGS_OFFSETS: dict[tuple[int, int], np.ndarray] = {}  # By dimensions and ring
+
+    def __init__(self, points: np.ndarray):
+        self.__POINTS = points
+        if len(points) <= self.__SCAN_MAX_QTY:
+            return
+        self.__ORIGIN = points.min(axis=0)
+        self.__EXTENT = points.max(axis=0) - self.__ORIGIN
+        cells_per_dimension = max(1, round((len(points) / self.__POINTS_PER_CELL) ** (1 / points.shape[1])))
+        self.__CELL_SIZE = max(float(self.__EXTENT.max()) / cells_per_dimension, self.__TOLERANCE)
+        self.__SHAPE = np.minimum(np.floor(self.__EXTENT / self.__CELL_SIZE).astype(np.int64) + 1, cells_per_dimension)
+        cell_indices = self.__get_cells(points)
+        flat_cells = np.ravel_multi_index(cell_indices.T, self.__SHAPE)
+        self.__ORDER = np.argsort(flat_cells, kind="stable")  # Points of a cell are neighbours, by index inside of it
+        self.__BOUNDS = np.searchsorted(flat_cells[self.__ORDER], np.arange(np.prod(self.__SHAPE) + 1))
+
+    def __len__(self) -> int:
+        return len(self.__POINTS)
+
+    def __get_cells(self, points: np.ndarray) -> np.ndarray:
+        return np.minimum(np.floor((points - self.__ORIGIN) / self.__CELL_SIZE).astype(np.int64), self.__SHAPE - 1)
+
+    @classmethod
+    def __get_ring_offsets(cls, dimensions: int, ring: int) -> np.ndarray:
+        offsets = cls.__RINGS_OFFSETS.get((dimensions, ring))
+        if offsets is None:
+            cube = np.indices((2 * ring + 1,) * dimensions).reshape(dimensions, -1).T - ring
+            offsets = cls.__RINGS_OFFSETS[(dimensions, ring)] = cube[np.abs(cube).max(axis=1) == ring]
+        return offsets
+
+    def calculate_distances(self, target: np.ndarray, indices: np.ndarray | slice = slice(None)) -> np.ndarray:
+        return np.abs(self.__POINTS[indices] - target).sum(axis=1)
+
+    def query(self, target: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        # Indices and distances of the 'k' nearest points, by distance, then by index
+        if len(self.__POINTS) <= self.__SCAN_MAX_QTY:
+            distances = self.calculate_distances(target)
+            nearest = np.lexsort((np.arange(len(distances)), distances))[:k]
+            return nearest, distances[nearest]
+        # L1 distances to the points from out of their bounding box are by the distance to the closest point of the box
+        box_target = np.clip(target, self.__ORIGIN, self.__ORIGIN + self.__EXTENT)
+        box_distance = float(np.abs(target - box_target).sum())
+        target_cell = self.__get_cells(box_target)
+        last_ring = int(np.maximum(target_cell, self.__SHAPE - 1 - target_cell).max())
+        indices = np.empty(0, dtype=np.int64)
+        distances = np.empty(0)
+        for ring in range(last_ring + 1):
+            cells = target_cell + self.__get_ring_offsets(len(target), ring)
+            cells = cells[((cells >= 0) & (cells < self.__SHAPE)).all(axis=1)]
+            if len(cells) > 0:
+                flat_cells = np.ravel_multi_index(cells.T, self.__SHAPE)
+                starts, sizes = self.__BOUNDS[flat_cells], self.__BOUNDS[flat_cells + 1] - self.__BOUNDS[flat_cells]
+                ring_points = self.__ORDER[np.repeat(starts - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())]
+                indices = np.concatenate((indices, ring_points))
+                distances = np.concatenate((distances, self.calculate_distances(target, ring_points)))
+                if len(indices) > k:
+                    nearest = np.lexsort((indices, distances))[:k]
+                    indices, distances = indices[nearest], distances[nearest]
+            if len(indices) == k:  # Points of the next ring are out of the cube of cells of the closer rings
+                cube_low = self.__ORIGIN + (target_cell - ring) * self.__CELL_SIZE
+                cube_high = self.__ORIGIN + (target_cell + ring + 1) * self.__CELL_SIZE
+                bound = box_distance + min((box_target - cube_low).min(), (cube_high - box_target).min())
+                if distances.max() < bound - self.__TOLERANCE:
+                    break
+        nearest = np.lexsort((indices, distances))
+        return indices[nearest], distances[nearest]
+
+
 class QTableStatesParser(ABC):
-    def __init__(self, q_table: QTable):
+    # States are close by L1 distance of their coordinates inside of a bucket, states of other buckets are unreachable.
+    # Nearest states are searched by a uniform grid index per bucket, results are kept by bounded caches
+    def __init__(self, q_table: QTable, cache_max_size: int | None = 2 ** 14,
+                 cache_max_bytes: int | None = 64 * 2 ** 20):
         self._ORIGIN_STATES = list(q_table.to_dict().keys())
-        self.__states_with_distance_cache: dict[GameState, dict[GameState, float]] = {}
+        self.__indexes: dict[Hashable, tuple[list[GameState], _GridIndex]] = {}  # Built by the first query
+        name = f"{type(self).__name__} {id(self):x}"
+        self.__CLOSE_STATES_CACHE = BoundedCache(f"{name} close states", cache_max_size, cache_max_bytes)
+        self.__DISTANCES_CACHE = BoundedCache(f"{name} states with distance", cache_max_size, cache_max_bytes)
 
     @abstractmethod
-    def _calculate_distances(self, target_state: GameState) -> dict[GameState, float]:
+    def _get_bucket(self, state: GameState) -> Hashable:
+        pass
+
+    @abstractmethod
+    def _get_coordinates(self, state: GameState) -> tuple[float, ...]:
         pass
 
+    def __get_index(self, target_state: GameState) -> tuple[list[GameState], _GridIndex]:
+        if not self.__indexes and self._ORIGIN_STATES:
+            buckets: dict[Hashable, list[GameState]] = {}
+            for state in self._ORIGIN_STATES:
+                buckets.setdefault(self._get_bucket(state), []).append(state)
+            self.__indexes = {
+                bucket: (states, _GridIndex(np.array(list(map(self._get_coordinates, states)), dtype=np.float64)))
+                for bucket, states in buckets.items()
+            }
+        return self.__indexes[self._get_bucket(target_state)]
+
+    def _calculate_distances(self, target_state: GameState) -> dict[GameState, float]:
+        states, index = self.__get_index(target_state)
+        distances = index.calculate_distances(np.array(self._get_coordinates(target_state), dtype=np.float64))
+        return dict(zip(states, distances.tolist()))
+
     def get_states_with_distance(self, target_state: GameState) -> dict[GameState, float]:
-        if target_state not in self.__states_with_distance_cache:
-            self.__states_with_distance_cache[target_state] = self._calculate_distances(target_state)
-        return self.__states_with_distance_cache[target_state]
+        states_with_distance = self.__DISTANCES_CACHE.get(target_state)
+        if states_with_distance is None:
+            states_with_distance = self._calculate_distances(target_state)
+            self.__DISTANCES_CACHE.put(target_state, states_with_distance)
+        return states_with_distance
 
     def find_close_states(self, target_state: GameState, n: int) -> list[GameState]:
         if n <= 0:
             raise ValueError("Argument 'n' must be positive")
-        states_with_distance = self.get_states_with_distance(target_state)
-        states = sorted(states_with_distance, key=states_with_distance.get)
-        return states if n > len(states) else states[:n]
+        close_states = self.__CLOSE_STATES_CACHE.get((target_state, n))
+        if close_states is None:
+            states, index = self.__get_index(target_state)
+            target = np.array(self._get_coordinates(target_state), dtype=np.float64)
+            indices, _ = index.query(target, min(n, len(index)))
+            close_states = tuple(states[i] for i in indices.tolist())
+            self.__CLOSE_STATES_CACHE.put((target_state, n), close_states)
+        return list(close_states)
 
     def find_closest_state(self, target_state: GameState) -> GameState:
-        states_with_distance = self.get_states_with_distance(target_state)
-        return min(states_with_distance, key=states_with_distance.get)
+        return self.find_close_states(target_state, 1)[0]
+
+    @property
+    def caches_stats(self) -> list[CacheStats]:
+        return [self.__CLOSE_STATES_CACHE.stats, self.__DISTANCES_CACHE.stats]
 
 
 class QTableNarrower:
+    # Origin states are grouped by narrowed states once: group ids follow the first origin state of every narrowed one
+    # and origin rows are sorted by groups (by origin order inside of them). Values are reduced for all groups at once
+    _SHOW_PROGRESS = True
+
     def __init__(self, q_table: QTable):
         self._ORIGIN = q_table.to_dict()
         self._AVAILABLE_ACTIONS = q_table.available_actions
 
-        self.__STATES_TO_NARROW_DOWN: dict[GameState, dict[GameAction, list[QValue]]] = {}
+        self.__ORIGIN_VALUES = np.array(
+            [list(action_values.values()) for action_values in self._ORIGIN.values()], dtype=np.float64,
+        ).reshape(-1, len(self._AVAILABLE_ACTIONS))
+        self.__groups: tuple[list[GameState], np.ndarray, np.ndarray] | None = None  # Built by the first narrowing
 
     @abstractmethod
     def _export_old_state_to_new(self, old_state: GameState) -> GameState:
         pass
 
-    def __compute_states_to_narrow_down_if_clean(self):
-        if self.__STATES_TO_NARROW_DOWN:
-            return
-        for old_state, old_action_values in self._ORIGIN.items():
-            new_state = self._export_old_state_to_new(old_state)
-            if new_state not in self.__STATES_TO_NARROW_DOWN:
-                self.__STATES_TO_NARROW_DOWN[new_state] = {act: [] for act in self._AVAILABLE_ACTIONS}
-            for act, val in old_action_values.items():
-                self.__STATES_TO_NARROW_DOWN[new_state][act].append(val)
+    def __get_groups(self) -> tuple[list[GameState], np.ndarray, np.ndarray]:
+        # Narrowed states, sorted group ids of origin states and origin rows in the same order
+        if self.__groups is None:
+            new_state_to_group: dict[GameState, int] = {}
+            group_ids = np.fromiter(
+                (new_state_to_group.setdefault(self._export_old_state_to_new(old_state), len(new_state_to_group))
+                 for old_state in self._ORIGIN),
+                dtype=np.int64, count=len(self._ORIGIN),
+            )
+            rows = np.argsort(group_ids, kind="stable")
+            self.__groups = list(new_state_to_group), group_ids[rows], rows
+        return self.__groups
+
+    def __get_action_values(self, action_index: int, ignore_neutral: bool) -> tuple[np.ndarray, np.ndarray]:
+        # Sorted group ids and values of the action
+        _, group_ids, rows = self.__get_groups()
+        values = self.__ORIGIN_VALUES[rows, action_index]
+        if ignore_neutral:
+            is_kept = values != QValue.NEUTRAL
+            return group_ids[is_kept], values[is_kept]
+        return group_ids, values
+
+    def __to_q_table(self, narrowed_states: list[GameState], values: np.ndarray) -> QTable:
+        return QTable(*self._AVAILABLE_ACTIONS, _from={
+            state: {action: QValue(value) for action, value in zip(self._AVAILABLE_ACTIONS, state_values)}
+            for state, state_values in zip(narrowed_states, values.tolist())
+        })
 
     def _narrow_down(self, mapper: Callable[[GameState, GameAction, list[QValue]], QValue], ignore_neutral: bool) -> QTable:
-        self.__compute_states_to_narrow_down_if_clean()
-        progress_bar = Bar(
-            'Narrow down %(max)d states', max=len(self.__STATES_TO_NARROW_DOWN),
-            suffix='%(index)d/%(remaining)d %(percent).2f%% [%(avg)d - %(elapsed)d/%(eta)d]s'
-        )
-        narrowed_q_table = {}
-        for narrowed_state, old_action_values in self.__STATES_TO_NARROW_DOWN.items():
-            new_q_values = {}
-            for action, values in old_action_values.items():
-                while ignore_neutral and QValue.NEUTRAL in values:
-                    values.remove(QValue.NEUTRAL)
-                new_q_values[action] = mapper(narrowed_state, action, values) if len(values) > 0 else QValue.NEUTRAL
-            narrowed_q_table[narrowed_state] = new_q_values
-            progress_bar.next()
-        progress_bar.finish()
-        return QTable(*self._AVAILABLE_ACTIONS, _from=narrowed_q_table)
+        # By a Python mapper of values lists, reductions of this class don't need it
+        narrowed_states, _, _ = self.__get_groups()
+        narrowed_values = np.full((len(narrowed_states), len(self._AVAILABLE_ACTIONS)), QValue.NEUTRAL)
+        for action_index, action in enumerate(self._AVAILABLE_ACTIONS):
+            group_ids, values = self.__get_action_values(action_index, ignore_neutral)
+            bounds = np.searchsorted(group_ids, np.arange(len(narrowed_states) + 1)).tolist()
+            values = values.tolist()
+            for group, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+                if start < end:
+                    narrowed_values[group, action_index] = mapper(narrowed_states[group], action, values[start:end])
+        return self.__to_q_table(narrowed_states, narrowed_values)
+
+    def __reduce(self, reduction: Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray],
+                 ignore_neutral: bool) -> QTable:
+        # 'reduction' takes sorted group ids, their values and values qty by groups, returns values of the groups having
+        # them; groups without values stay neutral
+        narrowed_states, _, _ = self.__get_groups()
+        narrowed_values = np.full((len(narrowed_states), len(self._AVAILABLE_ACTIONS)), QValue.NEUTRAL)
+        for action_index in range(len(self._AVAILABLE_ACTIONS)):
+            group_ids, values = self.__get_action_values(action_index, ignore_neutral)
+            counts = np.bincount(group_ids, minlength=len(narrowed_states))
+            narrowed_values[counts > 0, action_index] = reduction(group_ids, values, counts)
+        return self.__to_q_table(narrowed_states, narrowed_values)
+
+    @staticmethod
+    def __get_starts(counts: np.ndarray) -> np.ndarray:  # Of the groups having values
+        return (np.cumsum(counts) - counts)[counts > 0]
+
+    @staticmethod
+    def __sort_by_groups_and_values(group_ids: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        order = np.lexsort((values, group_ids))  # Stable: equal values of a group by origin order
+        return order, values[order]
 
     def average(self, ignore_neutral=True) -> QTable:
-        return self._narrow_down(lambda s, a, values: QValue(sum(values) / len(values)), ignore_neutral)
+        def reduction(group_ids: np.ndarray, values: np.ndarray, counts: np.ndarray) -> np.ndarray:
+            # Sums by 'bincount' are accumulated one by one in order, as 'sum' does
+            return np.bincount(group_ids, weights=values, minlength=len(counts))[counts > 0] / counts[counts > 0]
+
+        return self.__reduce(reduction, ignore_neutral)
 
     def max(self, ignore_neutral=True) -> QTable:
-        return self._narrow_down(lambda s, a, values: QValue(max(values)), ignore_neutral)
+        return self.__reduce(
+            lambda group_ids, values, counts: np.maximum.reduceat(values, self.__get_starts(counts)), ignore_neutral,
+        )
 
     def moda(self, ignore_neutral=True) -> QTable:
-        return self._narrow_down(lambda s, a, values: QValue(mode(values)), ignore_neutral)
+        def reduction(group_ids: np.ndarray, values: np.ndarray, counts: np.ndarray) -> np.ndarray:
+            # The most common value of a group, the first one by origin order of equally common (as 'statistics.mode')
+            order, sorted_values = self.__sort_by_groups_and_values(group_ids, values)
+            sorted_group_ids = group_ids[order]
+            is_run_start = np.ones(len(values), dtype=bool)
+            is_run_start[1:] = sorted_group_ids[1:] != sorted_group_ids[:-1]
+            is_run_start[1:] |= sorted_values[1:] != sorted_values[:-1]
+            run_starts = np.flatnonzero(is_run_start)
+            run_counts = np.diff(np.append(run_starts, len(values)))
+            run_group_ids = sorted_group_ids[run_starts]
+            runs = np.lexsort((order[run_starts], -run_counts, run_group_ids))
+            is_group_first = np.ones(len(runs), dtype=bool)
+            is_group_first[1:] = run_group_ids[runs[1:]] != run_group_ids[runs[:-1]]
+            return sorted_values[run_starts[runs[is_group_first]]]
+
+        return self.__reduce(reduction, ignore_neutral)
 
     def median(self, ignore_neutral=True) -> QTable:
-        return self._narrow_down(lambda s, a, values: QValue(median(values)), ignore_neutral)
+        def reduction(group_ids: np.ndarray, values: np.ndarray, counts: np.ndarray) -> np.ndarray:
+            _, sorted_values = self.__sort_by_groups_and_values(group_ids, values)
+            starts, counts = self.__get_starts(counts), counts[counts > 0]
+            low = sorted_values[starts + (counts - 1) // 2]
+            high = sorted_values[starts + counts // 2]
+            return np.where(counts % 2 == 1, low, (low + high) / 2)
+
+        return self.__reduce(reduction, ignore_neutral)
 
     def weight_average_by_distance(self, distance_calculator: Callable[[GameState], dict[GameState, float]], ignore_neutral=True) -> QTable:
-        def mapper(narrowed_state: GameState, action: GameAction, v) -> QValue:
-            weights = {
-                state: 1.0 / (distance + 1e-5)
-                for state, distance in distance_calculator(narrowed_state).items()
-                if distance < 0.01
-            }
-            total_weight = sum(weights.values())
+        # Of the origin states closer than 0.01 to a narrowed state, not only of its group. Distances are taken once per
+        # narrowed state; actions without values in the group itself stay neutral
+        narrowed_states, _, _ = self.__get_groups()
+        has_values = np.stack([
+            np.bincount(self.__get_action_values(action_index, ignore_neutral)[0], minlength=len(narrowed_states)) > 0
+            for action_index in range(len(self._AVAILABLE_ACTIONS))
+        ], axis=1)
+        origin_rows = {state: row for row, state in enumerate(self._ORIGIN)}
+        close_groups, close_rows, close_distances = [], [], []
+        progress_bar = Bar(
+            'Narrow down %(max)d states', max=len(narrowed_states),
+            suffix='%(index)d/%(remaining)d %(percent).2f%% [%(avg)d - %(elapsed)d/%(eta)d]s'
+        ) if self._SHOW_PROGRESS else None
+        for group, narrowed_state in enumerate(narrowed_states):
+            if progress_bar:
+                progress_bar.next()
+            if not has_values[group].any():
+                continue
+            for state, distance in distance_calculator(narrowed_state).items():
+                if distance < 0.01:
+                    close_groups.append(group)
+                    close_rows.append(origin_rows[state])
+                    close_distances.append(distance)
+        # Sums by 'bincount' are accumulated one by one in order, as the loop over the close states would do
+        close_groups = np.array(close_groups, dtype=np.int64)
+        values = self.__ORIGIN_VALUES[np.array(close_rows, dtype=np.int64)].reshape(-1, len(self._AVAILABLE_ACTIONS))
+        weights = 1.0 / (np.array(close_distances, dtype=np.float64) + 1e-5)
+        weights /= np.bincount(close_groups, weights=weights, minlength=len(narrowed_states))[close_groups]
+        narrowed_values = np.full((len(narrowed_states), len(self._AVAILABLE_ACTIONS)), QValue.NEUTRAL)
+        for action_index in range(len(self._AVAILABLE_ACTIONS)):
+            is_kept = values[:, action_index] != QValue.NEUTRAL if ignore_neutral else slice(None)
+            weighted_sum = np.bincount(
+                close_groups[is_kept], weights=values[is_kept, action_index] * weights[is_kept],
+                minlength=len(narrowed_states),
+            )
+            total_action_weight = np.bincount(
+                close_groups[is_kept], weights=weights[is_kept], minlength=len(narrowed_states),
+            )
+            is_weighted = has_values[:, action_index] & (total_action_weight > 0)
+            narrowed_values[is_weighted, action_index] = weighted_sum[is_weighted] / total_action_weight[is_weighted]
+        if progress_bar:
+            progress_bar.finish()
+        return self.__to_q_table(narrowed_states, narrowed_values)
+
+
+class _PartitionNarrower(QTableNarrower):
+    # Narrows a partition of 'StreamingQTableNarrower' by narrowed states exported in the main process
+    _SHOW_PROGRESS = False  # Partitions are reported by the main process
+
+    def __init__(self, q_table: QTable, old_state_to_new: dict[GameState, GameState]):
+        super().__init__(q_table)
+        self.__OLD_STATE_TO_NEW = old_state_to_new
+
+    def _export_old_state_to_new(self, old_state: GameState) -> GameState:
+        return self.__OLD_STATE_TO_NEW[old_state]
+
+
+def _narrow_down_partition(filename: str, available_actions: tuple[GameAction, ...], reduction_name: str,
+                           ignore_neutral: bool, parser_type: Callable[[QTable], QTableStatesParser] | None,
+                           ) -> tuple[np.ndarray, list[GameState], np.ndarray]:
+    # Positions of the first origin states of narrowed states, narrowed states and their values
+    positions, old_states, new_states, values = [], [], [], []
+    with open(filename, 'rb') as f:
+        while True:
+            try:
+                chunk_positions, chunk_old_states, chunk_new_states, chunk_values = pickle.load(f)
+            except EOFError:
+                break
+            positions.extend(chunk_positions.tolist())
+            old_states.extend(chunk_old_states)
+            new_states.extend(chunk_new_states)
+            values.extend(chunk_values.tolist())
+    q_table = QTable(*available_actions, _from={
+        state: dict(zip(available_actions, state_values)) for state, state_values in zip(old_states, values)
+    })
+    narrower = _PartitionNarrower(q_table, dict(zip(old_states, new_states)))
+    if parser_type is None:
+        narrowed_q_table = getattr(narrower, reduction_name)(ignore_neutral=ignore_neutral)
+    else:
+        narrowed_q_table = narrower.weight_average_by_distance(
+            parser_type(q_table).get_states_with_distance, ignore_neutral=ignore_neutral,
+        )
+    first_positions: dict[GameState, int] = {}
+    for position, new_state in zip(positions, new_states):
+        first_positions.setdefault(new_state, position)
+    # Partitions aren't empty, so the narrowed table is read by one chunk
+    narrowed_states, narrowed_values = next(narrowed_q_table.iterate_chunks(len(narrowed_q_table)))
+    positions = np.array([first_positions[new_state] for new_state in narrowed_states], dtype=np.int64)
+    return positions, narrowed_states, narrowed_values
+
+
+class StreamingQTableNarrower(ABC):
+    # 'QTableNarrower' for tables larger than memory (e.g. memory-mapped by 'QTable.load'). The origin table is streamed
+    # by chunks, rows are hash partitioned by narrowed states to temporary files, partitions are narrowed down by a
+    # process pool and merged by first origin states of the narrowed ones, so results equal 'QTableNarrower' ones.
+    # Memory of a process is bounded by the chunk size and the partition size (about a chunk by default); the narrowed
+    # table itself is built in memory
+    def __init__(self, q_table: QTable, workers_qty: int | None = None, chunk_size: int = 2 ** 16,
+                 partitions_qty: int | None = None, directory: str | None = None):
+        # Partition files are kept in a temporary directory inside of 'directory' (the system one by default)
+        workers_qty = (os.cpu_count() or 1) if workers_qty is None else workers_qty
+        if workers_qty < 1:
+            raise ValueError("QTY of workers must be greater than 0")
+        if chunk_size < 1 or partitions_qty is not None and partitions_qty < 1:
+            raise ValueError("Chunk size and QTY of partitions must be greater than 0")
+        self.__Q_TABLE = q_table
+        self.__WORKERS_QTY = workers_qty
+        self.__CHUNK_SIZE = chunk_size
+        self.__PARTITIONS_QTY = partitions_qty or max(1, -(-len(q_table) // chunk_size))
+        self.__DIRECTORY = directory
 
-            weighted_sum = 0.0
-            total_action_weight = 0.0
+    @abstractmethod
+    def _export_old_state_to_new(self, old_state: GameState) -> GameState:
+        pass
 
-            for state, weight in weights.items():
-                origin_value = self._ORIGIN[state][action]
-                if ignore_neutral and origin_value == QValue.NEUTRAL:
+    def __partition(self, directory: str, get_partition_key: Callable[[GameState], Hashable]) -> list[str]:
+        # Partition files having rows. Keys are hashed by this process only, so salted hashes of strings are consistent
+        filenames = [os.path.join(directory, f"partition_{index}.pickle") for index in range(self.__PARTITIONS_QTY)]
+        is_written = np.zeros(self.__PARTITIONS_QTY, dtype=bool)
+        progress_bar = Bar(
+            'Partition %(max)d chunks', max=-(-len(self.__Q_TABLE) // self.__CHUNK_SIZE),
+            suffix='%(index)d/%(remaining)d %(percent).2f%% [%(avg)d - %(elapsed)d/%(eta)d]s'
+        )
+        position = 0
+        for old_states, values in self.__Q_TABLE.iterate_chunks(self.__CHUNK_SIZE):
+            progress_bar.next()
+            new_states = list(map(self._export_old_state_to_new, old_states))
+            partitions = np.fromiter(
+                (hash(get_partition_key(new_state)) for new_state in new_states), dtype=np.int64, count=len(new_states),
+            ) % self.__PARTITIONS_QTY
+            rows = np.argsort(partitions, kind="stable")  # Origin order inside of partitions
+            bounds = np.searchsorted(partitions[rows], np.arange(self.__PARTITIONS_QTY + 1)).tolist()
+            for partition, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+                if start == end:
                     continue
-                weight = weight / total_weight
-                weighted_sum += origin_value * weight
-                total_action_weight += weight
+                partition_rows = rows[start:end]
+                partition_rows_list = partition_rows.tolist()
+                with open(filenames[partition], 'ab') as f:
+                    pickle.dump((
+                        partition_rows + position,
+                        [old_states[row] for row in partition_rows_list],
+                        [new_states[row] for row in partition_rows_list],
+                        values[partition_rows],
+                    ), f, protocol=pickle.HIGHEST_PROTOCOL)
+                is_written[partition] = True
+            position += len(old_states)
+        progress_bar.finish()
+        return [filenames[partition] for partition in np.flatnonzero(is_written).tolist()]
 
-            return QValue(weighted_sum / total_action_weight) if total_action_weight > 0 else QValue.NEUTRAL
+    def __narrow_down(self, reduction_name: str, ignore_neutral: bool,
+                      parser_type: Callable[[QTable], QTableStatesParser] | None = None) -> QTable:
+        available_actions = self.__Q_TABLE.available_actions
+        if parser_type is None:
+            get_partition_key: Callable[[GameState], Hashable] = lambda new_state: new_state
+        else:  # Close states of a narrowed one are in its bucket, so buckets are not split
+            get_partition_key = parser_type(QTable(*available_actions))._get_bucket
+        first_positions, narrowed_states, narrowed_values = [], [], []
+        with tempfile.TemporaryDirectory(prefix="q_table_narrower_", dir=self.__DIRECTORY) as directory:
+            filenames = self.__partition(directory, get_partition_key)
+            progress_bar = Bar(
+                'Narrow down %(max)d partitions', max=len(filenames),
+                suffix='%(index)d/%(remaining)d %(percent).2f%% [%(avg)d - %(elapsed)d/%(eta)d]s'
+            )
+            context = multiprocessing.get_context()
+            narrow_down_partition = functools.partial(
+                _narrow_down_partition, available_actions=available_actions, reduction_name=reduction_name,
+                ignore_neutral=ignore_neutral, parser_type=parser_type,
+            )
+            with context.Pool(max(1, min(self.__WORKERS_QTY, len(filenames)))) as pool:
+                for partition_first_positions, partition_states, partition_values in pool.imap_unordered(
+                        narrow_down_partition, filenames):
+                    progress_bar.next()
+                    first_positions.append(partition_first_positions)
+                    narrowed_states.extend(partition_states)
+                    narrowed_values.append(partition_values)
+            progress_bar.finish()
+        if not narrowed_states:
+            return QTable(*available_actions)
+        order = np.argsort(np.concatenate(first_positions)).tolist()  # Origin order, as 'QTableNarrower' keeps
+        narrowed_values = np.concatenate(narrowed_values).tolist()
+        return QTable(*available_actions, _from={
+            narrowed_states[row]: {action: QValue(value) for action, value in zip(available_actions, narrowed_values[row])}
+            for row in order
+        })
+
+    def average(self, ignore_neutral=True) -> QTable:
+        return self.__narrow_down("average", ignore_neutral)
+
+    def max(self, ignore_neutral=True) -> QTable:
+        return self.__narrow_down("max", ignore_neutral)
+
+    def moda(self, ignore_neutral=True) -> QTable:
+        return self.__narrow_down("moda", ignore_neutral)
+
+    def median(self, ignore_neutral=True) -> QTable:
+        return self.__narrow_down("median", ignore_neutral)
 
-        return self._narrow_down(mapper, ignore_neutral)
+    def weight_average_by_distance(self, parser_type: Callable[[QTable], QTableStatesParser], ignore_neutral=True) -> QTable:
+        # Distances are calculated by a parser of every partition (not by a distance calculator of the whole table),
+        # partitions keep buckets of the parser whole. Narrowed states must be in the buckets of their origin states
+        return self.__narrow_down("weight_average_by_distance", ignore_neutral, parser_type)
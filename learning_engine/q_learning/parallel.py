@@ -0,0 +1,256 @@
+from .base import QLearner
+from environment import GameEnvironment, VectorizedGameEnvironment, GameState, GameAction, GameActionResult, HitSuccessor
+from environment import cache_tools
+from environment.cache_tools import CacheStats
+import multiprocessing
+import queue
+import signal
+import time
+from typing import Callable, NamedTuple
+import numpy as np
+
+
+class ParallelTrainingStats(NamedTuple):
+    episodes_qty: int
+    transitions_qty: int
+    elapsed_seconds: float
+    transitions_per_second: float
+    policy_version: int  # Policy updates broadcast by the learner
+    mean_staleness: float  # Policy versions an actor was behind the learner by, per transition
+    max_staleness: int
+    policy_changes_qty: int  # Greedy actions changed by the learner, fewer of them by every call as policy stabilizes
+
+
+class _TransitionsStreamer:
+    # Takes place of actor transitions processing: transitions are sent to the learner by batches,
+    # policy updates from the learner are applied to the actor Q-Table between batches
+    def __init__(self, actor: QLearner, actor_index: int, transitions_queue: multiprocessing.Queue,
+                 policy_queue: multiprocessing.Queue, batch_size: int, policy_version: int):
+        self.__ACTOR = actor
+        self.__ACTOR_INDEX = actor_index
+        self.__TRANSITIONS_QUEUE = transitions_queue
+        self.__POLICY_QUEUE = policy_queue
+        self.__BATCH_SIZE = batch_size
+        self.__policy_version = policy_version  # Of the actor Q-Table
+        self.__batch: list[tuple[GameState, GameAction, GameActionResult, GameState, list[HitSuccessor] | None]] = []
+
+    def __call__(self, state: GameState, action: GameAction, action_result: GameActionResult, next_state: GameState,
+                 hit_successors: list[HitSuccessor] | None = None):
+        self.__batch.append((state, action, action_result, next_state, hit_successors))
+        if len(self.__batch) >= self.__BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.__batch:
+            self.__TRANSITIONS_QUEUE.put((self.__ACTOR_INDEX, self.__policy_version, self.__batch))
+            self.__batch = []
+        self.__apply_policy_updates()
+
+    def wait_for_policy(self, policy_version: int):
+        # Applies policy updates, waiting for the ones up to 'policy_version'
+        while self.__policy_version < policy_version:
+            self.__apply_policy_update(*self.__POLICY_QUEUE.get())
+        self.__apply_policy_updates()
+
+    def __apply_policy_updates(self):
+        while True:
+            try:
+                policy_version, changed_values = self.__POLICY_QUEUE.get_nowait()
+            except queue.Empty:
+                return
+            self.__apply_policy_update(policy_version, changed_values)
+
+    def __apply_policy_update(self, policy_version: int, changed_values: list[tuple[GameState, tuple[float, ...]]]):
+        available_actions = self.__ACTOR.Q_TABLE.available_actions
+        for state, values in changed_values:
+            for action, value in zip(available_actions, values):
+                self.__ACTOR.Q_TABLE.set_q_value(state, action, value)
+        self.__policy_version = policy_version
+
+
+def _run_actor(actor: QLearner, actor_index: int, quotas_queue: multiprocessing.Queue,
+               transitions_queue: multiprocessing.Queue, policy_queue: multiprocessing.Queue, batch_size: int,
+               policy_version: int):
+    # Plays episode quotas until None. Signal handlers of the learner process (e.g. checkpoints of its Q-Table) must not
+    # run in actors: the learner stops them itself, so interrupts and user signals are ignored, termination is default
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    streamer = _TransitionsStreamer(actor, actor_index, transitions_queue, policy_queue, batch_size, policy_version)
+    actor._process_transition = streamer  # Transitions are streamed to the learner instead of local updates
+    while (quota := quotas_queue.get()) is not None:
+        episodes, policy_version = quota
+        streamer.wait_for_policy(policy_version)  # A quota starts by the policy of its request
+        actor.train(episodes)
+        streamer.flush()
+        transitions_queue.put((actor_index, None, cache_tools.get_caches_stats()))  # The quota is done
+
+
+class _Actor(NamedTuple):
+    process: multiprocessing.Process
+    quotas_queue: multiprocessing.Queue
+    policy_queue: multiprocessing.Queue
+
+
+class ParallelQLearnerTrainer:
+    # Actor processes play own environments (by 'environment_factory' with independent seeds) under the current policy
+    # and stream transitions to the learner in this process. The learner applies them by '_process_transition' and
+    # broadcasts values of the states updated since the previous broadcast (by transitions, replay or planning alike)
+    # every 'broadcast_interval' transitions and at the end of every 'train', so actor Q-Tables follow the learner one
+    # with some staleness. Actors are started by the first 'train' and play episode quotas of the next calls (keeping
+    # their caches warm) until 'close'.
+    # Use packed states to cut transfer costs
+    __RESULT_TIMEOUT = 1.0  # seconds to wait for transitions before actors are checked for failures
+    __CLOSE_TIMEOUT = 10.0  # seconds to wait for actors to finish before they are terminated
+
+    def __init__(self, learner: QLearner,
+                 environment_factory: Callable[[int], GameEnvironment | VectorizedGameEnvironment], workers_qty: int,
+                 seed: int | None = None, batch_size: int = 256, broadcast_interval: int = 2 ** 14):
+        if workers_qty < 1:
+            raise ValueError("QTY of workers must be greater than 0")
+        if batch_size < 1 or broadcast_interval < 1:
+            raise ValueError("Batch size and broadcast interval must be greater than 0")
+        self.__LEARNER = learner
+        self.__ENVIRONMENT_FACTORY = environment_factory
+        self.__WORKERS_QTY = workers_qty
+        self.__SEED_SEQUENCE = np.random.SeedSequence(seed)
+        self.__BATCH_SIZE = batch_size
+        self.__BROADCAST_INTERVAL = broadcast_interval
+
+        self.__actors: list[_Actor] = []
+        self.__transitions_queue: multiprocessing.Queue | None = None
+        self.__actors_caches_stats: list[list[CacheStats]] = [[] for _ in range(workers_qty)]
+        self.__transitions_since_broadcast = 0
+
+        self.__policy_version = 0
+        self.__episodes_qty = 0
+        self.__transitions_qty = 0
+        self.__elapsed_seconds = 0.0
+        self.__staleness_sum = 0
+        self.__max_staleness = 0
+        self.__policy_changes_qty = 0
+
+    @property
+    def stats(self) -> ParallelTrainingStats:  # Of all 'train' calls
+        return ParallelTrainingStats(
+            episodes_qty=self.__episodes_qty,
+            transitions_qty=self.__transitions_qty,
+            elapsed_seconds=self.__elapsed_seconds,
+            transitions_per_second=self.__transitions_qty / self.__elapsed_seconds if self.__elapsed_seconds else 0.0,
+            policy_version=self.__policy_version,
+            mean_staleness=self.__staleness_sum / self.__transitions_qty if self.__transitions_qty else 0.0,
+            max_staleness=self.__max_staleness,
+            policy_changes_qty=self.__policy_changes_qty,
+        )
+
+    @property
+    def actors_caches_stats(self) -> list[list[CacheStats]]:  # Of every actor by the end of its latest quota
+        return [list(caches_stats) for caches_stats in self.__actors_caches_stats]
+
+    def __start_actors(self):
+        context = multiprocessing.get_context()
+        self.__transitions_queue = context.Queue(maxsize=4 * self.__WORKERS_QTY)  # Actors wait for a busy learner
+        for index, seed_sequence in enumerate(self.__SEED_SEQUENCE.spawn(self.__WORKERS_QTY)):
+            environment_seed, actor_seed = (int(child.generate_state(1)[0]) for child in seed_sequence.spawn(2))
+            actor = self.__LEARNER._spawn_actor(self.__ENVIRONMENT_FACTORY(environment_seed), actor_seed)
+            quotas_queue, policy_queue = context.Queue(), context.Queue()
+            self.__actors.append(_Actor(context.Process(
+                target=_run_actor, name=f"Q-Learner actor {index}", daemon=True,
+                args=(actor, index, quotas_queue, self.__transitions_queue, policy_queue, self.__BATCH_SIZE,
+                      self.__policy_version),
+            ), quotas_queue, policy_queue))
+        self.__LEARNER._take_changed_states()  # Actors start by the current policy
+        self.__transitions_since_broadcast = 0
+        for actor in self.__actors:
+            actor.process.start()
+
+    def __stop_actors(self, terminate: bool, timeout: float | None = None):
+        if not terminate:
+            for actor in self.__actors:
+                if actor.process.is_alive():
+                    actor.quotas_queue.put(None)
+        for actor in self.__actors:
+            if actor.process.pid is None:  # Not started
+                continue
+            if terminate:
+                actor.process.terminate()
+            actor.process.join(timeout)
+            if actor.process.is_alive():
+                actor.process.terminate()
+                actor.process.join()
+        for actor in self.__actors:  # Quotas and updates not taken by stopped actors aren't needed
+            for actor_queue in (actor.quotas_queue, actor.policy_queue):
+                actor_queue.cancel_join_thread()
+                actor_queue.close()
+        if self.__transitions_queue is not None:
+            self.__transitions_queue.close()
+        self.__actors, self.__transitions_queue = [], None
+
+    def close(self, timeout: float | None = __CLOSE_TIMEOUT):
+        # Stops actors after their current quotas; the next 'train' starts new ones
+        self.__stop_actors(terminate=False, timeout=timeout)
+
+    def __broadcast(self):
+        self.__transitions_since_broadcast = 0
+        changed_states = self.__LEARNER._take_changed_states()
+        if not changed_states:
+            return
+        available_actions = self.__LEARNER.Q_TABLE.available_actions
+        changed_values = [
+            (state, tuple(float(self.__LEARNER.Q_TABLE.get_q_value(state, action)) for action in available_actions))
+            for state in changed_states
+        ]
+        self.__policy_version += 1
+        for actor in self.__actors:
+            actor.policy_queue.put((self.__policy_version, changed_values))
+
+    def train(self, episodes: int) -> ParallelTrainingStats:
+        # On any failure (or interruption) actors are terminated, so the next call starts new ones
+        start = time.perf_counter()
+        learner_policy_changes_qty = self.__LEARNER.policy_changes_qty
+        try:
+            if not self.__actors:
+                self.__start_actors()
+            busy_actors = set()
+            for index, actor in enumerate(self.__actors):
+                actor_episodes = episodes // self.__WORKERS_QTY + int(index < episodes % self.__WORKERS_QTY)
+                if actor_episodes > 0:
+                    actor.quotas_queue.put((actor_episodes, self.__policy_version))
+                    busy_actors.add(index)
+
+            while busy_actors:
+                try:
+                    actor_index, policy_version, transitions = self.__transitions_queue.get(
+                        timeout=self.__RESULT_TIMEOUT,
+                    )
+                except queue.Empty:
+                    for index in busy_actors:
+                        if not self.__actors[index].process.is_alive():
+                            exitcode = self.__actors[index].process.exitcode
+                            raise RuntimeError(f"Actor {index} failed with exit code {exitcode}")
+                    continue
+                if policy_version is None:  # The quota is done, caches stats are sent instead of transitions
+                    busy_actors.discard(actor_index)
+                    self.__actors_caches_stats[actor_index] = transitions
+                    continue
+
+                staleness = self.__policy_version - policy_version
+                self.__staleness_sum += staleness * len(transitions)
+                self.__max_staleness = max(self.__max_staleness, staleness)
+                self.__transitions_qty += len(transitions)
+                for transition in transitions:
+                    self.__LEARNER._process_transition(*transition)
+
+                self.__transitions_since_broadcast += len(transitions)
+                if self.__transitions_since_broadcast >= self.__BROADCAST_INTERVAL:
+                    self.__broadcast()
+            self.__broadcast()  # Next quotas start by the latest policy
+            self.__episodes_qty += episodes
+        except BaseException:
+            self.__stop_actors(terminate=True)
+            raise
+        finally:
+            self.__elapsed_seconds += time.perf_counter() - start
+            self.__policy_changes_qty += self.__LEARNER.policy_changes_qty - learner_policy_changes_qty
+        return self.stats
@@ -0,0 +1,319 @@
+from .base import QValue, QTable, QLearnerRewardAfterAction
+from environment import GameAction, GameActionResult
+from environment.base import CardDeck
+from environment.default_game import DefaultGameState
+from environment.expected_value_tools import calculate_dealer_final_sum_probabilities
+from environment.probability_tools import (
+    calculate_dealer_busting_probability, calculate_dealer_busting_probabilities,
+    calculate_dealer_final_sum_distributions,
+)
+import numpy as np
+
+
+class DefaultGameValueIterationPlanner:
+    # Q* of 'DefaultGame' by value iteration over quantized states, without sampling the game.
+    # Rounds are planned from pre-round shoe compositions: the fresh shoe and 'compositions_qty' - 1 random shoes
+    # dealt down to a uniform depth in the playable range. For every composition all player hands reachable by hits,
+    # with every dealer open card, are enumerated with exact probabilities; the hidden card is a part of unseen cards,
+    # so hit cards and the dealer outcome are drawn from them as if it wasn't dealt yet (but conditioned on whether
+    # it's an ace under an open ace, which states show). Transitions and rewards of
+    # quantized states are averaged over such hands weighted by the probability to reach them by hits only.
+    # Round is over after STAND and after HIT to bust or 21 (rewards like 'QLearnerRewardAfterAction' of
+    # 'EpsilonGreedyQLearner'), 'gamma' discounts only further actions in the round.
+    __RANKS_QTY = 10
+    __ACE_INDEX = 9
+    __HARD_VALUES = np.array(list(range(2, 11)) + [1], dtype=np.int64)
+    __SOFT_VALUES = np.array(list(range(2, 11)) + [11], dtype=np.int64)
+    __DEALER_SUMS = np.array([17, 18, 19, 20, 21, 22])  # Outcomes of 'calculate_dealer_final_sum_probabilities'
+
+    def __init__(self, card_decks_qty: int, gamma: float, rewards: dict[GameActionResult, QLearnerRewardAfterAction],
+                 dealer_hit_on_soft_17: bool | None = False, compositions_qty: int = 16,
+                 seed: int | np.random.Generator | None = None, packed_states=False):
+        if card_decks_qty < 1:
+            raise ValueError("QTY of decks must be greater than 0")
+        if not 0 <= gamma <= 1:
+            raise ValueError("Gamma must be in diapason [0-1]")
+        if compositions_qty < 1:
+            raise ValueError("QTY of compositions must be greater than 0")
+        self.__CARD_DECKS_QTY = card_decks_qty
+        self.__GAMMA = gamma
+        self.__REWARDS = {}
+        for action_result in GameActionResult:
+            try:
+                self.__REWARDS[action_result] = float(rewards[action_result])
+            except KeyError:
+                raise ValueError(f"You forget to set AgentReward for {action_result}")
+        self.__DEALER_HIT_ON_SOFT_17 = bool(dealer_hit_on_soft_17)
+        self.__COMPOSITIONS_QTY = compositions_qty
+        self.__RNG = np.random.default_rng(seed)
+        self.__PACKED_STATES = packed_states  # States of the result are 'DefaultGameState.pack' keys
+
+        self.__hands = self.__enumerate_hands()
+
+    @classmethod
+    def __enumerate_hands(cls) -> dict[str, np.ndarray]:
+        # Player hands (rank counts) by cards qty, from every 2 card hand by hits while the sum is under 21,
+        # with the next hand by every rank: index, or -1 for bust, -2 for 21
+        hands: dict[tuple[int, ...], int] = {}
+        frontier = set()
+        for first in range(cls.__RANKS_QTY):
+            for second in range(first, cls.__RANKS_QTY):
+                rank_counts = [0] * cls.__RANKS_QTY
+                rank_counts[first] += 1
+                rank_counts[second] += 1
+                frontier.add(tuple(rank_counts))
+        next_hands: list[list[tuple[int, ...] | int]] = []
+        while frontier:
+            next_frontier = set()
+            for rank_counts in sorted(frontier):
+                hands[rank_counts] = len(hands)
+                hard_sum = sum(count * value for count, value in zip(rank_counts, cls.__HARD_VALUES.tolist()))
+                has_ace = rank_counts[cls.__ACE_INDEX] > 0
+                row = []
+                for index in range(cls.__RANKS_QTY):
+                    new_hard_sum = hard_sum + int(cls.__HARD_VALUES[index])
+                    new_has_ace = has_ace or index == cls.__ACE_INDEX
+                    new_sum = new_hard_sum + 10 * (new_has_ace and new_hard_sum <= 11)
+                    if new_sum > 21:
+                        row.append(-1)
+                    elif new_sum == 21:
+                        row.append(-2)
+                    else:
+                        new_rank_counts = rank_counts[:index] + (rank_counts[index] + 1,) + rank_counts[index + 1:]
+                        row.append(new_rank_counts)
+                        next_frontier.add(new_rank_counts)
+                next_hands.append(row)
+            frontier = next_frontier
+
+        rank_counts = np.array(list(hands), dtype=np.int64)
+        hard_sum = rank_counts @ cls.__HARD_VALUES
+        is_soft = (rank_counts[:, cls.__ACE_INDEX] > 0) & (hard_sum <= 11)
+        return {
+            'rank_counts': rank_counts,
+            'cards_qty': rank_counts.sum(axis=1),
+            'hard_sum': hard_sum,
+            'is_soft': is_soft,
+            'best_sum': hard_sum + 10 * is_soft,
+            'next': np.array([[hands.get(hand, -3) if isinstance(hand, tuple) else hand for hand in row]
+                              for row in next_hands], dtype=np.int64),
+        }
+
+    def __sample_compositions(self) -> np.ndarray:
+        # Pre-round shoes: the fresh one and random ones dealt down to a uniform depth while the shoe is playable
+        full_rank_counts = np.array(CardDeck(self.__CARD_DECKS_QTY).rank_counts, dtype=np.int64)
+        max_dealt_qty = int(full_rank_counts.sum() - np.ceil(52 * self.__CARD_DECKS_QTY * 0.25))
+        compositions = [full_rank_counts]
+        for dealt_qty in self.__RNG.integers(1, max_dealt_qty + 1, self.__COMPOSITIONS_QTY - 1).tolist():
+            compositions.append(full_rank_counts - self.__RNG.multivariate_hypergeometric(full_rank_counts, dealt_qty))
+        return np.array(compositions)
+
+    def __round_probabilities(self, probabilities: np.ndarray) -> list[int]:  # In centi-units, as in state keys
+        return [round(DefaultGameState.round_probability(probability) * 100) for probability in probabilities.tolist()]
+
+    def __plan_composition(self, shoe_rank_counts: np.ndarray) -> tuple[np.ndarray, ...]:
+        # Nodes are (hand, dealer open card index) in rows of 'hands' by open card; returns state keys of reachable
+        # nodes with their weights, expected STAND and immediate HIT rewards, and HIT transitions between keys
+        hands = self.__hands
+        hands_qty = len(hands['rank_counts'])
+        unseen = shoe_rank_counts - hands['rank_counts'][:, None, :] - np.eye(self.__RANKS_QTY, dtype=np.int64)
+        unseen = unseen.reshape(-1, self.__RANKS_QTY)  # shape: (hands * open cards, ranks)
+        open_index = np.tile(np.arange(self.__RANKS_QTY), hands_qty)
+        hand_index = np.repeat(np.arange(hands_qty), self.__RANKS_QTY)
+        cards_qty = unseen.sum(axis=1)
+        is_possible = np.all(unseen >= 0, axis=1) & (cards_qty > 0)
+        unseen[~is_possible] = 0
+        hit_probabilities = unseen / np.maximum(cards_qty, 1)[:, None]
+
+        # Probability to be dealt the first 2 cards and the open card (any order), then to reach by hits
+        shoe_cards_qty = int(shoe_rank_counts.sum())
+        weights = np.zeros(len(unseen))
+        is_dealt = hands['cards_qty'][hand_index] == 2
+        dealt_rank_counts = hands['rank_counts'][hand_index[is_dealt]]
+        open_counts = dealt_rank_counts[np.arange(len(dealt_rank_counts)), open_index[is_dealt]]
+        falling_factorials = np.prod(
+            np.where(dealt_rank_counts == 2, shoe_rank_counts * (shoe_rank_counts - 1), shoe_rank_counts ** dealt_rank_counts),
+            axis=1,
+        ) * (shoe_rank_counts[open_index[is_dealt]] - open_counts)
+        orders_qty = np.where(dealt_rank_counts.max(axis=1) == 2, 1, 2)
+        weights[is_dealt] = np.maximum(orders_qty * falling_factorials, 0) / (
+            shoe_cards_qty * (shoe_cards_qty - 1) * (shoe_cards_qty - 2)
+        )
+        weights[~is_possible] = 0
+        next_hands = hands['next'][hand_index]  # shape: (nodes, ranks)
+        is_next_playing = next_hands >= 0
+        next_nodes = np.where(is_next_playing, next_hands * self.__RANKS_QTY + open_index[:, None], next_hands)
+        for cards_qty_level in range(2, int(hands['cards_qty'].max())):
+            parents = np.flatnonzero((hands['cards_qty'][hand_index] == cards_qty_level) & (weights > 0))
+            parents_next = next_nodes[parents]
+            has_next = parents_next >= 0
+            np.add.at(
+                weights, parents_next[has_next],
+                (weights[parents][:, None] * hit_probabilities[parents])[has_next],
+            )
+
+        nodes = np.flatnonzero(weights > 0)
+        unseen, open_index, hand_index, cards_qty = unseen[nodes], open_index[nodes], hand_index[nodes], cards_qty[nodes]
+
+        # State fields the same way as 'VectorizedDefaultGame' computes them
+        hard_sum = hands['hard_sum'][hand_index]
+        player_busting_probability = (unseen * (self.__HARD_VALUES > (21 - hard_sum)[:, None])).sum(axis=1) / cards_qty
+        dealer_busting_probability = calculate_dealer_busting_probabilities(
+            unseen, open_index, hit_on_soft_17=self.__DEALER_HIT_ON_SOFT_17,
+        )
+        scaled_probability = dealer_busting_probability * 100
+        is_on_rounding_border = np.abs(scaled_probability - np.floor(scaled_probability) - 0.5) < 1e-9
+        for index in np.flatnonzero(is_on_rounding_border).tolist():  # Float sum may be on wrong side
+            dealer_busting_probability[index] = calculate_dealer_busting_probability(
+                CardDeck.of_rank_counts(self.__CARD_DECKS_QTY, unseen[index].tolist()),
+                CardDeck.get_card_by_rank_index(int(open_index[index])), hit_on_soft_17=self.__DEALER_HIT_ON_SOFT_17,
+            )
+        common_key = (
+            hands['cards_qty'][hand_index]
+            | hands['best_sum'][hand_index] << 5
+            | hands['is_soft'][hand_index].astype(np.int64) << 10
+            | np.array(self.__round_probabilities(player_busting_probability), dtype=np.int64) << 11
+            | np.array(self.__round_probabilities(dealer_busting_probability), dtype=np.int64) << 29
+        )
+
+        def get_keys(rows: np.ndarray, open_rank: np.ndarray) -> np.ndarray:
+            if self.__DEALER_HIT_ON_SOFT_17:
+                dealer_cards_sum_less_than_17_probability = 1 - (
+                    unseen[rows] * (self.__HARD_VALUES > (17 - self.__HARD_VALUES[open_index[rows]])[:, None])
+                ).sum(axis=1) / cards_qty[rows]
+            else:
+                dealer_cards_sum_less_than_17_probability = (
+                    unseen[rows] * (self.__SOFT_VALUES < (17 - open_rank)[:, None])
+                ).sum(axis=1) / cards_qty[rows]
+            return common_key[rows] | open_rank << 18 | np.array(
+                self.__round_probabilities(dealer_cards_sum_less_than_17_probability), dtype=np.int64,
+            ) << 22
+
+        # Standing player sum against the dealer final sum (bust is 22). State dealer busting probability is a ratio
+        # of dealer tree leaves, so the outcome is taken by real probabilities
+        dealer_probabilities = np.empty((len(nodes), len(self.__DEALER_SUMS)))
+        for index in np.unique(open_index).tolist():
+            is_open = open_index == index
+            dealer_probabilities[is_open] = calculate_dealer_final_sum_probabilities(
+                unseen[is_open], index, hit_on_soft_17=self.__DEALER_HIT_ON_SOFT_17,
+            )
+        hit_probabilities = hit_probabilities[nodes]
+        node_weights = weights[nodes]
+
+        # Two dealer aces make the open one hard: 'dealer_open_card' is 1 (see 'DefaultGame.state'). Open ace nodes
+        # are split by the hidden card into such states and the ones of the open ace (11): weights by the hidden card
+        # probability, hit cards and the dealer outcome conditioned on it. The hidden ace stays in the state fields
+        all_rows = np.arange(len(nodes))
+        aces_rows = np.flatnonzero((open_index == self.__ACE_INDEX) & (unseen[:, self.__ACE_INDEX] > 0))
+        aces_qty, aces_cards_qty = unseen[aces_rows, self.__ACE_INDEX], cards_qty[aces_rows]
+        aces_weights = node_weights[aces_rows] * aces_qty / aces_cards_qty
+        aces_hit_probabilities = (unseen[aces_rows] - np.eye(self.__RANKS_QTY, dtype=np.int64)[self.__ACE_INDEX]) / \
+            np.maximum(aces_cards_qty - 1, 1)[:, None]
+        aces_dealer_probabilities = calculate_dealer_final_sum_distributions(
+            unseen[aces_rows], np.full(len(aces_rows), self.__ACE_INDEX), hit_on_soft_17=self.__DEALER_HIT_ON_SOFT_17,
+            hidden_card_index=self.__ACE_INDEX,
+        )
+        aces_dealer_probabilities = np.concatenate([  # Natural is 21 as in 'calculate_dealer_final_sum_probabilities'
+            aces_dealer_probabilities[:, :4], aces_dealer_probabilities[:, 4:6].sum(axis=1, keepdims=True),
+            aces_dealer_probabilities[:, 6:],
+        ], axis=1)
+        # Without the hidden ace it's any of not aces, and hit cards are any of the other unseen cards
+        not_aces_qty = aces_cards_qty - aces_qty
+        hidden_ace_probabilities = (aces_qty / aces_cards_qty)[:, None]
+        node_weights[aces_rows] -= aces_weights
+        hit_probabilities[aces_rows] = unseen[aces_rows] * (
+            not_aces_qty[:, None] - (np.arange(self.__RANKS_QTY) != self.__ACE_INDEX)
+        ) / np.maximum(not_aces_qty * (aces_cards_qty - 1), 1)[:, None]
+        dealer_probabilities[aces_rows] = np.divide(
+            dealer_probabilities[aces_rows] - hidden_ace_probabilities * aces_dealer_probabilities,
+            1 - hidden_ace_probabilities, out=np.zeros_like(aces_dealer_probabilities),
+            where=not_aces_qty[:, None] > 0,
+        )
+        all_rows = all_rows[node_weights > 0]
+        keys = get_keys(all_rows, self.__SOFT_VALUES[open_index[all_rows]])
+        aces_keys = get_keys(aces_rows, np.ones(len(aces_rows), dtype=np.int64))
+
+        player_sum = hands['best_sum'][hand_index][:, None]
+        node_next = next_nodes[nodes]
+        results = []
+        for rows, rows_keys, rows_weights, rows_hit_probabilities, rows_dealer_probabilities in (
+            (all_rows, keys, node_weights[all_rows], hit_probabilities[all_rows], dealer_probabilities[all_rows]),
+            (aces_rows, aces_keys, aces_weights, aces_hit_probabilities, aces_dealer_probabilities),
+        ):
+            stand_rewards = (rows_dealer_probabilities * np.select(
+                [(self.__DEALER_SUMS > 21) | (self.__DEALER_SUMS < player_sum[rows]),
+                 self.__DEALER_SUMS == player_sum[rows]],
+                [self.__REWARDS[GameActionResult.WINS], self.__REWARDS[GameActionResult.PUSH]],
+                self.__REWARDS[GameActionResult.LOSS],
+            )).sum(axis=1)
+            rows_next = node_next[rows]
+            hit_rewards = (rows_hit_probabilities * np.select(
+                [rows_next == -1, rows_next == -2],
+                [self.__REWARDS[GameActionResult.BUST], self.__REWARDS[GameActionResult.BLACKJACK]],
+                self.__REWARDS[GameActionResult.WAIT_ACTION],
+            )).sum(axis=1)
+            node_keys = np.full(len(weights), -1, dtype=np.int64)
+            node_keys[nodes[rows]] = rows_keys
+            sources, ranks = np.nonzero((rows_next >= 0) & (rows_hit_probabilities > 0))
+            results.append((
+                rows_keys, rows_weights, rows_weights * stand_rewards, rows_weights * hit_rewards,
+                rows_keys[sources], node_keys[rows_next[sources, ranks]],
+                rows_weights[sources] * rows_hit_probabilities[sources, ranks],
+            ))
+        return tuple(np.concatenate(arrays) for arrays in zip(*results))
+
+    @staticmethod
+    def __sum_by_keys(keys: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # Unique key columns (shape: (key parts, n)) in lexicographic order with summed values (shape: (values, n))
+        order = np.lexsort(keys[::-1])
+        keys = keys[:, order]
+        is_first = np.ones(keys.shape[1], dtype=bool)
+        is_first[1:] = np.any(keys[:, 1:] != keys[:, :-1], axis=0)
+        groups = np.cumsum(is_first) - 1
+        return keys[:, is_first], np.stack([
+            np.bincount(groups, weights=row[order], minlength=int(np.count_nonzero(is_first))) for row in values
+        ])
+
+    def plan(self, tolerance: float = 1e-12, max_iterations: int = 1000) -> QTable:
+        # Compositions are summed up one by one, so memory is bounded by distinct states and transitions
+        if max_iterations < 1:
+            raise ValueError("Max iterations must be greater than 0")
+        states_keys, states_sums = np.empty((1, 0), dtype=np.int64), np.empty((3, 0))
+        transitions_keys, transitions_weights = np.empty((2, 0), dtype=np.int64), np.empty((1, 0))
+        for composition in self.__sample_compositions():
+            keys, weights, stand_rewards, hit_rewards, sources, targets, weighted_probabilities = \
+                self.__plan_composition(composition)
+            states_keys, states_sums = self.__sum_by_keys(
+                np.concatenate([states_keys, keys[None]], axis=1),
+                np.concatenate([states_sums, np.stack([weights, stand_rewards, hit_rewards])], axis=1),
+            )
+            transitions_keys, transitions_weights = self.__sum_by_keys(
+                np.concatenate([transitions_keys, np.stack([sources, targets])], axis=1),
+                np.concatenate([transitions_weights, weighted_probabilities[None]], axis=1),
+            )
+
+        states_keys = states_keys[0]
+        states_weights, stand_q, hit_rewards = states_sums
+        stand_q = stand_q / states_weights
+        hit_rewards = hit_rewards / states_weights
+        sources = np.searchsorted(states_keys, transitions_keys[0])
+        targets = np.searchsorted(states_keys, transitions_keys[1])
+        probabilities = transitions_weights[0] / states_weights[sources]
+
+        # HIT only adds cards, so transitions are acyclic and iterations stop by the longest hand
+        values = np.maximum(stand_q, hit_rewards)
+        for _ in range(max_iterations):
+            hit_q = hit_rewards + self.__GAMMA * np.bincount(
+                sources, weights=probabilities * values[targets], minlength=len(states_keys),
+            )
+            new_values = np.maximum(stand_q, hit_q)
+            is_converged = np.max(np.abs(new_values - values), initial=0.0) <= tolerance
+            values = new_values
+            if is_converged:
+                break
+
+        q_table = QTable(GameAction.STAND, GameAction.HIT)
+        for key, stand_value, hit_value in zip(states_keys.tolist(), stand_q.tolist(), hit_q.tolist()):
+            state = key if self.__PACKED_STATES else DefaultGameState.unpack(key)
+            q_table.set_q_value(state, GameAction.STAND, QValue(stand_value))
+            q_table.set_q_value(state, GameAction.HIT, QValue(hit_value))
+        return q_table
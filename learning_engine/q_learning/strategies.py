@@ -1,27 +1,157 @@
-from .base import QLearner, QTable, QLearnerRewardAfterAction
-from environment import GameEnvironment, GameState, GameAction, GameActionResult
-import random
+from .base import QValue, QLearner, QTable, QLearnerRewardAfterAction, ReplayBuffer
+from environment import (
+    GameEnvironment, VectorizedGameEnvironment, GameState, GameAction, GameActionResult, HitSuccessor,
+)
+from collections import OrderedDict
+import heapq
+import numpy as np
 
 
 class EpsilonGreedyQLearner(QLearner):
-    def __init__(self, game_environment: GameEnvironment, alpha: float, gamma: float, epsilon: float,
-                 rewards: dict[GameActionResult, QLearnerRewardAfterAction], q_table: QTable | None = None):
+    def __init__(self, game_environment: GameEnvironment | VectorizedGameEnvironment, alpha: float, gamma: float,
+                 epsilon: float, rewards: dict[GameActionResult, QLearnerRewardAfterAction], q_table: QTable | None = None,
+                 seed: int | np.random.Generator | None = None, replay_buffer: ReplayBuffer | None = None,
+                 expected_hit_updates=False):
         if not 0 <= epsilon <= 1:
             raise ValueError("Epsilon must be in diapason [0-1]")
         self._EPSILON = epsilon
+        self._RNG = np.random.default_rng(seed)
         self._REWARDS = {}
         for action_result in GameActionResult:
             try:
                 self._REWARDS[action_result] = rewards[action_result]
             except KeyError:
                 raise ValueError(f"You forget to set AgentReward for {action_result}")
-        super().__init__(game_environment, alpha, gamma, q_table)
+        super().__init__(game_environment, alpha, gamma, q_table, replay_buffer, expected_hit_updates)
 
     def _choose_action(self, state: GameState) -> GameAction:
-        if state not in self.Q_TABLE or random.random() < self._EPSILON:
-            return GameAction.get_by_random(*self._GAME_ENVIRONMENT.available_actions)
+        if state not in self.Q_TABLE or self._RNG.random() < self._EPSILON:
+            return GameAction.get_by_random(*self._GAME_ENVIRONMENT.available_actions, rng=self._RNG)
         else:
             return self.Q_TABLE.get_best_action(state)
 
     def _get_reward_for_action_result(self, action_result: GameActionResult) -> QLearnerRewardAfterAction:
         return self._REWARDS[action_result]
+
+    def _spawn_actor(self, game_environment: GameEnvironment | VectorizedGameEnvironment, seed: int) -> 'QLearner':
+        actor = super()._spawn_actor(game_environment, seed)
+        actor._RNG = np.random.default_rng(seed)
+        return actor
+
+
+class PrioritizedSweepingQLearner(EpsilonGreedyQLearner):
+    # Learns a model of the environment: counts of (action result, next state) outcomes by (state, action) and
+    # predecessor pairs by state. Every real transition updates the model and backs up its pair by the expected target
+    # over the model outcomes, then 'planning_steps' pairs with the greatest TD errors are taken from the priority queue
+    # and backed up the same way. Predecessors of a state are queued when its max Q changes, so updates go to the states
+    # still changing, not to converged ones. Round ending outcomes are valued by running mean of round first states.
+    # The model is bounded: least recently used pairs and states are evicted beyond 'model_max_size' entries
+    # (evicted pairs aren't backed up until seen again), and only 'max_predecessors' latest predecessors of a state
+    # are kept
+    def __init__(self, game_environment: GameEnvironment | VectorizedGameEnvironment, alpha: float, gamma: float,
+                 epsilon: float, rewards: dict[GameActionResult, QLearnerRewardAfterAction], q_table: QTable | None = None,
+                 seed: int | np.random.Generator | None = None, planning_steps: int = 5,
+                 priority_threshold: float = 1e-4, model_max_size: int | None = 2 ** 18, max_predecessors: int = 64):
+        if planning_steps < 0:
+            raise ValueError("QTY of planning steps must not be negative")
+        if priority_threshold < 0:
+            raise ValueError("Priority threshold must not be negative")
+        if max_predecessors < 1:
+            raise ValueError("Max predecessors must be greater than 0")
+        if model_max_size is not None and model_max_size < 1:
+            raise ValueError("Max size of model must be greater than 0")
+        super().__init__(game_environment, alpha, gamma, epsilon, rewards, q_table, seed)
+        self._PLANNING_STEPS = planning_steps
+        self._PRIORITY_THRESHOLD = priority_threshold
+        self._MAX_PREDECESSORS = max_predecessors
+        self._MODEL_MAX_SIZE = model_max_size
+        # Both from the least recently used entry, see '__get_model_entry'.
+        # (state, action) -> {(action result, next state): count}, next state of the round ending outcomes is None
+        self.__outcomes: OrderedDict[tuple[GameState, GameAction], dict] = OrderedDict()
+        # State -> {(state, action): None}, ordered sets from the earliest predecessor
+        self.__predecessors: OrderedDict[GameState, dict] = OrderedDict()
+        self.__queue: list[tuple[float, int, GameState, GameAction]] = []  # Heap by negative priority
+        # Priorities of queued pairs, queue entries of other priorities are stale
+        self.__priorities: dict[tuple[GameState, GameAction], float] = {}
+        self.__pushed_qty = 0
+
+    @property
+    def queued_qty(self) -> int:
+        return len(self.__priorities)
+
+    @property
+    def model_sizes(self) -> tuple[int, int]:  # QTY of pairs with outcomes and of states with predecessors
+        return len(self.__outcomes), len(self.__predecessors)
+
+    def _spawn_actor(self, game_environment: GameEnvironment | VectorizedGameEnvironment, seed: int) -> 'QLearner':
+        actor = super()._spawn_actor(game_environment, seed)
+        actor.__outcomes = actor.__predecessors = None  # The model is used by the learner only
+        actor.__queue, actor.__priorities = [], {}
+        return actor
+
+    def _process_transition(self, state: GameState, action: GameAction, action_result: GameActionResult,
+                            next_state: GameState, hit_successors: list[HitSuccessor] | None = None):
+        if action_result == GameActionResult.WAIT_ACTION:
+            predecessors = self.__get_model_entry(self.__predecessors, next_state, add=True)
+            predecessors.pop((state, action), None)
+            predecessors[(state, action)] = None
+            if len(predecessors) > self._MAX_PREDECESSORS:
+                del predecessors[next(iter(predecessors))]
+        else:  # The next state starts a new round
+            self._round_start_value = QValue(self._round_start_value + self._ALPHA * (
+                self.Q_TABLE.get_max_q_value(next_state) - self._round_start_value
+            ))
+            next_state = None
+        outcomes = self.__get_model_entry(self.__outcomes, (state, action), add=True)
+        outcomes[(action_result, next_state)] = outcomes.get((action_result, next_state), 0) + 1
+
+        self.__back_up(state, action)
+        for _ in range(self._PLANNING_STEPS):
+            if not self.__priorities:
+                break
+            self.__back_up(*self.__pop())
+
+    def __get_model_entry(self, model: OrderedDict, key, add=False) -> dict | None:
+        entry = model.get(key)
+        if entry is not None:
+            model.move_to_end(key)
+        elif add:
+            entry = model[key] = {}
+            if self._MODEL_MAX_SIZE is not None and len(model) > self._MODEL_MAX_SIZE:
+                model.popitem(last=False)
+        return entry
+
+    def __get_expected_target(self, state: GameState, action: GameAction) -> float | None:
+        outcomes = self.__get_model_entry(self.__outcomes, (state, action))
+        if outcomes is None:  # Evicted from the model
+            return None
+        target = 0.0
+        for (action_result, next_state), count in outcomes.items():
+            next_value = self._round_start_value if next_state is None else self.Q_TABLE.get_max_q_value(next_state)
+            target += count * (self._get_reward_for_action_result(action_result) + self._GAMMA * next_value)
+        return target / sum(outcomes.values())
+
+    def __back_up(self, state: GameState, action: GameAction):
+        self.__priorities.pop((state, action), None)
+        target = self.__get_expected_target(state, action)
+        if target is None:
+            return
+        max_q = self.Q_TABLE.get_max_q_value(state)
+        self._set_q_value(state, action, QValue(target))
+        if self.Q_TABLE.get_max_q_value(state) == max_q:
+            return
+        for predecessor in self.__get_model_entry(self.__predecessors, state) or ():
+            target = self.__get_expected_target(*predecessor)
+            if target is None:
+                continue
+            priority = abs(target - self.Q_TABLE.get_q_value(*predecessor))
+            if priority > self._PRIORITY_THRESHOLD and priority > self.__priorities.get(predecessor, 0.0):
+                self.__priorities[predecessor] = priority
+                self.__pushed_qty += 1
+                heapq.heappush(self.__queue, (-priority, self.__pushed_qty, *predecessor))
+
+    def __pop(self) -> tuple[GameState, GameAction]:
+        while True:
+            negative_priority, _, state, action = heapq.heappop(self.__queue)
+            if self.__priorities.get((state, action)) == -negative_priority:
+                return state, action
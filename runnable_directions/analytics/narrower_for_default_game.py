@@ -2,7 +2,7 @@ from agent.for_default_game import QTableStatesParser4DefaultGame
 from environment import GameState
 from environment.default_game import DefaultGameState
 from learning_engine.q_learning import QTable
-from learning_engine.q_learning.misc_tools import QTableNarrower
+from learning_engine.q_learning.misc_tools import QTableNarrower, StreamingQTableNarrower
 from enum import Enum
 from typing import Callable
 
@@ -31,21 +31,25 @@ class DefaultGameStateWithNarrowedProbability(GameState):
     dealer_busting_probability: ProbabilityCategory
 
 
+def narrow_down_probabilities(old_state: DefaultGameState) -> DefaultGameStateWithNarrowedProbability:
+    return DefaultGameStateWithNarrowedProbability(
+        player_cards_qty=old_state.player_cards_qty,
+        player_cards_sum=old_state.player_cards_sum,
+        player_has_soft_hand=old_state.player_has_soft_hand,
+        player_busting_probability=ProbabilityCategory.from_probability(old_state.player_busting_probability),
+        dealer_open_card=old_state.dealer_open_card,
+        dealer_cards_sum_less_than_17_probability=ProbabilityCategory.from_probability(old_state.dealer_cards_sum_less_than_17_probability),
+        dealer_busting_probability=ProbabilityCategory.from_probability(old_state.dealer_busting_probability),
+    )
+
+
 class QTableNarrower4DefaultGame(QTableNarrower):
     def __init__(self, q_table: QTable):
         super().__init__(q_table)
         self.__PARSER = QTableStatesParser4DefaultGame(q_table)
 
     def _export_old_state_to_new(self, old_state: DefaultGameState) -> DefaultGameStateWithNarrowedProbability:
-        return DefaultGameStateWithNarrowedProbability(
-            player_cards_qty=old_state.player_cards_qty,
-            player_cards_sum=old_state.player_cards_sum,
-            player_has_soft_hand=old_state.player_has_soft_hand,
-            player_busting_probability=ProbabilityCategory.from_probability(old_state.player_busting_probability),
-            dealer_open_card=old_state.dealer_open_card,
-            dealer_cards_sum_less_than_17_probability=ProbabilityCategory.from_probability(old_state.dealer_cards_sum_less_than_17_probability),
-            dealer_busting_probability=ProbabilityCategory.from_probability(old_state.dealer_busting_probability),
-        )
+        return narrow_down_probabilities(old_state)
 
     def weight_average_by_distance(
             self,
@@ -57,3 +61,15 @@ class QTableNarrower4DefaultGame(QTableNarrower):
         return super().weight_average_by_distance(
             distance_calculator=distance_calculator, ignore_neutral=ignore_neutral
         )
+
+
+class StreamingQTableNarrower4DefaultGame(StreamingQTableNarrower):  # For tables larger than memory
+    def _export_old_state_to_new(self, old_state: DefaultGameState) -> DefaultGameStateWithNarrowedProbability:
+        return narrow_down_probabilities(old_state)
+
+    def weight_average_by_distance(
+            self,
+            parser_type: Callable[[QTable], QTableStatesParser4DefaultGame] = QTableStatesParser4DefaultGame,
+            ignore_neutral=True
+    ) -> QTable:
+        return super().weight_average_by_distance(parser_type=parser_type, ignore_neutral=ignore_neutral)
@@ -0,0 +1,11 @@
+from environment.probability_atlas import ProbabilityAtlas
+
+
+PROBABILITY_ATLAS_FILEPATH = "probability_atlas.tbja"
+DECKS_QTYS = range(1, 9)
+MAX_BYTES = 64 * 2 ** 20
+
+
+if __name__ == "__main__":
+    ProbabilityAtlas.build(PROBABILITY_ATLAS_FILEPATH, decks_qtys=DECKS_QTYS, max_bytes=MAX_BYTES)
+    print(f"Successfully build atlas of {len(ProbabilityAtlas(PROBABILITY_ATLAS_FILEPATH))} compositions")
@@ -0,0 +1,26 @@
+from environment import GameActionResult
+from learning_engine.q_learning import QLearnerRewardAfterAction
+from learning_engine.q_learning.planning import DefaultGameValueIterationPlanner
+
+
+Q_TABLE_FILEPATH = "planned_q_table.tbjh"  # Not the trained 'q_table.tbjh': copy it there to train from the plan
+COMPOSITIONS_QTY = 128  # Pre-round shoes to plan from: more cover more states
+PLANNER = DefaultGameValueIterationPlanner(
+    card_decks_qty=4,
+    gamma=0.9,
+    rewards={  # Same as in 'train_q_table.py'
+        GameActionResult.WAIT_ACTION: QLearnerRewardAfterAction(0.0),
+        GameActionResult.BLACKJACK: QLearnerRewardAfterAction(1.5),
+        GameActionResult.WINS: QLearnerRewardAfterAction(1.0),
+        GameActionResult.PUSH: QLearnerRewardAfterAction(0.5),
+        GameActionResult.LOSS: QLearnerRewardAfterAction(-1.0),
+        GameActionResult.BUST: QLearnerRewardAfterAction(-1.5),
+    },
+    compositions_qty=COMPOSITIONS_QTY,
+)
+
+
+if __name__ == "__main__":
+    q_table = PLANNER.plan()
+    q_table.save(Q_TABLE_FILEPATH)
+    print(f"Successfully planned Q-Table of {len(q_table)} states")
@@ -1,10 +1,14 @@
 from threading import Thread
 from agent import Agent
-from environment import GameEnvironment, GameActionResult
+from environment import GameEnvironment, VectorizedGameEnvironment, GameActionResult
+import numpy as np
 
 
 class GameSimulator:
-    def __init__(self, game_environment: GameEnvironment, agent: Agent):
+    __WIN_RESULTS = np.array([GameActionResult.WINS.value, GameActionResult.BLACKJACK.value])
+    __LOSS_RESULTS = np.array([GameActionResult.LOSS.value, GameActionResult.BUST.value])
+
+    def __init__(self, game_environment: GameEnvironment | VectorizedGameEnvironment, agent: Agent):
         self.__GAME_ENVIRONMENT = game_environment
         self.__AGENT = agent
 
@@ -17,7 +21,34 @@ class GameSimulator:
         elif result in (GameActionResult.LOSS, GameActionResult.BUST):
             self.__score -= 1
 
+    def __count_up_many(self, results: np.ndarray):
+        self.__score += int(np.isin(results, self.__WIN_RESULTS).sum()) - int(np.isin(results, self.__LOSS_RESULTS).sum())
+
+    def __run_vectorized(self, iterations: int):
+        episodes_left = -1 if iterations == -1 else max(iterations, 0) + 1
+        tables = np.arange(self.__GAME_ENVIRONMENT.tables_qty)
+        if episodes_left != -1:
+            tables = tables[:episodes_left]
+            episodes_left -= len(tables)
+        self.__GAME_ENVIRONMENT.reset(tables)
+        while len(tables) > 0:
+            states = self.__GAME_ENVIRONMENT.get_states(tables)
+            actions = self.__AGENT.decide_many(states)
+            results = self.__GAME_ENVIRONMENT.play(actions, tables)
+            self.__count_up_many(results)
+
+            terminated = tables[self.__GAME_ENVIRONMENT.is_terminated[tables]]
+            restarted = terminated if episodes_left == -1 else terminated[:episodes_left]
+            if episodes_left != -1:
+                episodes_left -= len(restarted)
+            if len(restarted) > 0:
+                self.__GAME_ENVIRONMENT.reset(restarted)
+            tables = np.setdiff1d(tables, terminated[len(restarted):], assume_unique=True)
+
     def __run(self, iterations: int):
+        if isinstance(self.__GAME_ENVIRONMENT, VectorizedGameEnvironment):
+            self.__run_vectorized(iterations)
+            return
         subtrahend = 0 if iterations == -1 else 1
         if iterations < 0:
             iterations = 0
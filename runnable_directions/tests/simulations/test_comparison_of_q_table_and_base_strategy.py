@@ -1,4 +1,7 @@
-from agent.for_default_game import AgentForDefaultGameByBasicStrategy, AgentForDefaultGameByQTable
+from agent.for_default_game import (
+    AgentForDefaultGameByBasicStrategy, AgentForDefaultGameByQTable, AgentForDefaultGameByExactEV,
+)
+from environment import probability_atlas
 from environment.default_game import DefaultGame
 from learning_engine.q_learning import QTable
 from runnable_directions.tests.simulations.game_simulator import GameSimulator
@@ -6,20 +9,33 @@ import time
 import os
 
 
+SEED = 0  # The same shoes for every agent
+
+
 if __name__ == "__main__":
+    probability_atlas.load_active_atlas_if_exists(os.path.join("..", "..", "probability_atlas.tbja"))
     sim_by_basic_strategy = GameSimulator(
-        game_environment=DefaultGame(4), agent=AgentForDefaultGameByBasicStrategy(),
+        game_environment=DefaultGame(4, seed=SEED), agent=AgentForDefaultGameByBasicStrategy(),
     )
     sim_by_q_table = GameSimulator(
-        game_environment=DefaultGame(4),
+        game_environment=DefaultGame(4, seed=SEED),
         agent=AgentForDefaultGameByQTable(QTable.load(os.path.join("..", "..", "q_table.tbjh"))),
     )
+    game_for_exact_ev = DefaultGame(4, seed=SEED)
+    sim_by_exact_ev = GameSimulator(
+        game_environment=game_for_exact_ev, agent=AgentForDefaultGameByExactEV(game_for_exact_ev),
+    )
     sim_by_basic_strategy.start()
     sim_by_q_table.start()
-    while sim_by_basic_strategy.is_running and sim_by_q_table.is_running:
-        sim_info = f"Q-Table: {sim_by_q_table.score}\tBasicStrategy: {sim_by_basic_strategy.score}"
+    sim_by_exact_ev.start()
+    while sim_by_basic_strategy.is_running and sim_by_q_table.is_running and sim_by_exact_ev.is_running:
+        sim_info = (
+            f"Q-Table: {sim_by_q_table.score}\tBasicStrategy: {sim_by_basic_strategy.score}"
+            f"\tExactEV: {sim_by_exact_ev.score}"
+        )
         print(sim_info, end="")
         time.sleep(1.5)
         print("\b"*len(sim_info), end="")
     sim_by_basic_strategy.stop()
     sim_by_q_table.stop()
+    sim_by_exact_ev.stop()
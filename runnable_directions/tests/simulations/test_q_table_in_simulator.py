@@ -1,4 +1,5 @@
 from agent.for_default_game import AgentForDefaultGameByQTable
+from environment import probability_atlas
 from environment.default_game import DefaultGame
 from learning_engine.q_learning import QTable
 from runnable_directions.tests.simulations.game_simulator import GameSimulator
@@ -7,9 +8,10 @@ import os
 
 
 if __name__ == "__main__":
+    probability_atlas.load_active_atlas_if_exists(os.path.join("..", "..", "probability_atlas.tbja"))
     with GameSimulator(
             game_environment=DefaultGame(4),
-            agent=AgentForDefaultGameByQTable(QTable.load(os.path.join("..", "..", "q_table.tbjh"))),
+            agent=AgentForDefaultGameByQTable(QTable.load(os.path.join("..", "..", "q_table.tbjh"))).compile(),
     ) as sim:
         while sim.is_running:
             sim_info = f"Score: {sim.score}"
@@ -0,0 +1,63 @@
+from environment import GameActionResult
+from environment.default_game import DefaultGame
+from learning_engine.q_learning import QValue, QLearnerRewardAfterAction, ReplayBuffer, ParallelQLearnerTrainer
+from learning_engine.q_learning.strategies import EpsilonGreedyQLearner, PrioritizedSweepingQLearner
+import multiprocessing
+
+
+REWARDS = {
+    GameActionResult.WAIT_ACTION: QLearnerRewardAfterAction(0.0),
+    GameActionResult.BLACKJACK: QLearnerRewardAfterAction(1.5),
+    GameActionResult.WINS: QLearnerRewardAfterAction(1.0),
+    GameActionResult.PUSH: QLearnerRewardAfterAction(0.5),
+    GameActionResult.LOSS: QLearnerRewardAfterAction(-1.0),
+    GameActionResult.BUST: QLearnerRewardAfterAction(-1.5),
+}
+
+
+def reporting_actor_class(learner_class: type) -> type:
+    # Actors report Q-Table values they start their quotas by
+    class ReportingActor(learner_class):
+        report_queue = None
+
+        def train(self, episodes: int):
+            self.report_queue.put(self.Q_TABLE.to_dict())
+            super().train(episodes)
+
+    return ReportingActor
+
+
+def assert_actor_follows_learner(learner):
+    learner.report_queue = multiprocessing.get_context("fork").Queue()
+    trainer = ParallelQLearnerTrainer(
+        learner, lambda seed: DefaultGame(card_decks_qty=1, seed=seed), workers_qty=1, seed=0,
+        batch_size=16, broadcast_interval=64,
+    )
+    try:
+        trainer.train(200)
+        learner.report_queue.get(timeout=60)
+        learner_values = learner.Q_TABLE.to_dict()
+        trainer.train(1)
+        actor_values = learner.report_queue.get(timeout=60)
+    finally:
+        trainer.close()
+    neutral_values = dict.fromkeys(learner.Q_TABLE.available_actions, QValue.NEUTRAL)
+    for state in learner_values.keys() | actor_values.keys():  # Unseen states are neutral
+        assert actor_values.get(state, neutral_values) == learner_values.get(state, neutral_values)
+
+
+def test_actor_follows_prioritized_sweeping_learner():
+    # Planning backs up other states than the ones of transitions
+    learner = reporting_actor_class(PrioritizedSweepingQLearner)(
+        DefaultGame(card_decks_qty=1, seed=0), alpha=0.1, gamma=0.9, epsilon=0.1, rewards=REWARDS, seed=0,
+    )
+    assert_actor_follows_learner(learner)
+
+
+def test_actor_follows_replaying_learner():
+    # Replay updates states of sampled transitions
+    learner = reporting_actor_class(EpsilonGreedyQLearner)(
+        DefaultGame(card_decks_qty=1, seed=0), alpha=0.1, gamma=0.9, epsilon=0.1, rewards=REWARDS, seed=0,
+        replay_buffer=ReplayBuffer(capacity=2 ** 10, batch_size=32, replay_ratio=2.0, seed=0),
+    )
+    assert_actor_follows_learner(learner)
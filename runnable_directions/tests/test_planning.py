@@ -0,0 +1,67 @@
+from environment import GameAction, GameActionResult
+from environment.base import CardDeck
+from environment.expected_value_tools import calculate_expected_values
+from learning_engine.q_learning import QLearnerRewardAfterAction, DefaultGameValueIterationPlanner
+from functools import lru_cache
+import pytest
+
+
+ACE_INDEX = 9
+HARD_VALUES = tuple(range(2, 11)) + (1,)
+REWARDS = {  # Expected values of 'expected_value_tools'
+    GameActionResult.WAIT_ACTION: QLearnerRewardAfterAction(0.0),
+    GameActionResult.BLACKJACK: QLearnerRewardAfterAction(1.0),
+    GameActionResult.WINS: QLearnerRewardAfterAction(1.0),
+    GameActionResult.PUSH: QLearnerRewardAfterAction(0.0),
+    GameActionResult.LOSS: QLearnerRewardAfterAction(-1.0),
+    GameActionResult.BUST: QLearnerRewardAfterAction(-1.0),
+}
+
+
+@lru_cache
+def calculate_dealer_final_sums(rank_counts: tuple[int, ...], hard_sum: int, has_ace: bool,
+                                hit_on_soft_17: bool) -> dict[int, float]:
+    # Dealer drawing card by card: final sum (22 is bust) -> probability
+    is_soft = has_ace and hard_sum <= 11
+    current_sum = hard_sum + 10 if is_soft else hard_sum
+    if current_sum > 17 or (current_sum == 17 and not (hit_on_soft_17 and is_soft)):
+        return {min(current_sum, 22): 1.0}
+    final_sums = {}
+    for index, count in enumerate(rank_counts):
+        if count == 0:
+            continue
+        next_rank_counts = rank_counts[:index] + (count - 1,) + rank_counts[index + 1:]
+        for final_sum, probability in calculate_dealer_final_sums(
+            next_rank_counts, hard_sum + HARD_VALUES[index], has_ace or index == ACE_INDEX, hit_on_soft_17,
+        ).items():
+            final_sums[final_sum] = final_sums.get(final_sum, 0.0) + probability * count / sum(rank_counts)
+    return final_sums
+
+
+@pytest.mark.parametrize("hit_on_soft_17", [False, True])
+def test_planner_splits_open_ace_by_hidden_ace(hit_on_soft_17):
+    # Hard 20 of 2 cards is only 10 and 10, so it's one hand for every dealer open card of the fresh shoe
+    q_table = DefaultGameValueIterationPlanner(
+        card_decks_qty=1, gamma=1.0, rewards=REWARDS, dealer_hit_on_soft_17=hit_on_soft_17, compositions_qty=1,
+    ).plan()
+    stand_values = {}
+    for state in q_table.to_dict():
+        if (state.player_cards_qty, state.player_cards_sum, state.player_has_soft_hand) == (2, 20, 0) \
+                and state.dealer_open_card in (1, 11):
+            assert state.dealer_open_card not in stand_values
+            stand_values[state.dealer_open_card] = q_table.get_q_value(state, GameAction.STAND)
+    unseen = list(CardDeck(1).rank_counts)  # With the hidden card
+    unseen[8] -= 2
+    unseen[ACE_INDEX] -= 1
+
+    # Two dealer aces are soft 12
+    dealer_rank_counts = unseen[:ACE_INDEX] + [unseen[ACE_INDEX] - 1]
+    dealer_final_sums = calculate_dealer_final_sums(tuple(dealer_rank_counts), 2, True, hit_on_soft_17)
+    assert stand_values[1] == pytest.approx(sum(
+        probability * (0 if final_sum == 20 else -1 if final_sum == 21 else 1)
+        for final_sum, probability in dealer_final_sums.items()
+    ))
+    hidden_ace_probability = unseen[ACE_INDEX] / sum(unseen)
+    assert hidden_ace_probability * stand_values[1] + (1 - hidden_ace_probability) * stand_values[11] == pytest.approx(
+        calculate_expected_values(unseen, 20, False, ACE_INDEX, hit_on_soft_17=hit_on_soft_17).stand
+    )
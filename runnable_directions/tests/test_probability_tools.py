@@ -0,0 +1,47 @@
+from environment.base import CardDeck
+from environment.expected_value_tools import calculate_dealer_final_sum_probabilities
+from environment.probability_tools import calculate_dealer_final_sum_distribution, calculate_dealer_final_sum_distributions
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("hit_on_soft_17", [False, True])
+def test_dealer_final_sum_distribution_agrees_with_expected_value_tools(hit_on_soft_17):
+    rng = np.random.default_rng(0)
+    rank_counts = np.array([
+        np.maximum(np.array(CardDeck(decks_qty).rank_counts) - rng.integers(0, 3 * decks_qty, 10), 0)
+        for decks_qty in (1, 1, 2, 6)
+    ])
+    for open_card_index in range(10):
+        distributions = calculate_dealer_final_sum_distributions(
+            rank_counts, np.full(len(rank_counts), open_card_index), hit_on_soft_17=hit_on_soft_17,
+        )
+        for row_rank_counts, distribution in zip(rank_counts, distributions):
+            assert calculate_dealer_final_sum_distribution(
+                CardDeck.of_rank_counts(6, row_rank_counts.tolist()), CardDeck.get_card_by_rank_index(open_card_index),
+                hit_on_soft_17=hit_on_soft_17,
+            ) == pytest.approx(distribution)
+        assert distributions.sum(axis=1) == pytest.approx(np.ones(len(rank_counts)))
+        # Natural is 21 for the expected values
+        natural_as_21 = np.concatenate([
+            distributions[:, :4], distributions[:, 4:6].sum(axis=1, keepdims=True), distributions[:, 6:],
+        ], axis=1)
+        assert calculate_dealer_final_sum_probabilities(
+            rank_counts, open_card_index, hit_on_soft_17=hit_on_soft_17,
+        ) == pytest.approx(natural_as_21)
+
+
+@pytest.mark.parametrize("hit_on_soft_17", [False, True])
+def test_dealer_final_sum_distributions_by_hidden_card_make_up_distribution(hit_on_soft_17):
+    rank_counts = np.array([CardDeck(1).rank_counts, [0, 1, 2, 0, 3, 1, 0, 2, 5, 1]])
+    cards_qty = rank_counts.sum(axis=1, keepdims=True)
+    for open_card_index in range(10):
+        open_cards_indices = np.full(len(rank_counts), open_card_index)
+        assert sum(
+            rank_counts[:, [hidden_card_index]] / cards_qty * calculate_dealer_final_sum_distributions(
+                rank_counts, open_cards_indices, hit_on_soft_17=hit_on_soft_17, hidden_card_index=hidden_card_index,
+            )
+            for hidden_card_index in range(10)
+        ) == pytest.approx(calculate_dealer_final_sum_distributions(
+            rank_counts, open_cards_indices, hit_on_soft_17=hit_on_soft_17,
+        ))
@@ -1,8 +1,10 @@
-from environment import GameActionResult
+from environment import GameActionResult, cache_tools, probability_atlas
 from environment.default_game import DefaultGame
-from learning_engine.q_learning import QTable, QLearnerRewardAfterAction
+from learning_engine.q_learning import QTable, QLearnerRewardAfterAction, ParallelQLearnerTrainer
+from learning_engine.q_learning.misc_tools import QTableCheckpointer
 from learning_engine.q_learning.strategies import EpsilonGreedyQLearner
 import logging
+import os
 import signal
 import sys
 import threading
@@ -24,6 +26,9 @@ def handle_exception(exc_type, exc_value, exc_traceback):
 sys.excepthook = handle_exception
 
 Q_TABLE_FILEPATH = "q_table.tbjh"
+PROBABILITY_ATLAS_FILEPATH = "probability_atlas.tbja"  # Build by 'build_probability_atlas.py'
+PROBABILITY_CACHES_MAX_SIZE = 2 ** 18  # entries per cache
+PROBABILITY_CACHES_MAX_BYTES = 128 * 2 ** 20  # bytes per cache
 LEARNER = EpsilonGreedyQLearner(
     game_environment=DefaultGame(card_decks_qty=4),
     alpha=0.15,
@@ -39,21 +44,23 @@ LEARNER = EpsilonGreedyQLearner(
     },
     q_table=QTable.load(Q_TABLE_FILEPATH),
 )
+TRAINING_WORKERS_QTY = max(1, (os.cpu_count() or 1) - 1)  # Actor processes; the learner runs in this one
+TRAINER = ParallelQLearnerTrainer(
+    LEARNER, lambda seed: DefaultGame(card_decks_qty=4, seed=seed), workers_qty=TRAINING_WORKERS_QTY,
+)
+CHECKPOINTER = QTableCheckpointer(LEARNER.Q_TABLE, Q_TABLE_FILEPATH)  # Journaled saves by background writer
 
 
 def save_by_signal(signum, frame):
-    global LEARNER
-    LEARNER.Q_TABLE.save(Q_TABLE_FILEPATH)
+    CHECKPOINTER.request()
 
 
 def save_and_exit_by_signal(signum, frame):
-    save_by_signal(signum, frame)
-    sys.exit(0)
+    sys.exit(0)  # Final checkpoint is saved by 'finally' below
 
 
 def save_by_timer():
-    global LEARNER
-    LEARNER.Q_TABLE.save(Q_TABLE_FILEPATH)
+    CHECKPOINTER.request()
     timer = threading.Timer(1800, save_by_timer)
     timer.name = "Save Q-Table by timer"
     timer.daemon = True
@@ -65,15 +72,30 @@ if __name__ == "__main__":
     signal.signal(signal.SIGTERM, save_and_exit_by_signal)  # systemctl stop
     # signal.signal(signal.SIGKILL, save_and_exit_by_signal)  # systemctl kill
     signal.signal(signal.SIGINT, save_and_exit_by_signal)  # Ctrl+C
+    probability_atlas.load_active_atlas_if_exists(PROBABILITY_ATLAS_FILEPATH)
+    cache_tools.configure_caches(max_size=PROBABILITY_CACHES_MAX_SIZE, max_bytes=PROBABILITY_CACHES_MAX_BYTES)
     save_by_timer()
     try:
-        train_iterations = 100
+        # Checkpoint (journal of changed values) after every 16 rounds of actors; actors keep running (and their
+        # probability caches warm) between rounds and start every round by the latest policy
+        train_iterations = 16 * TRAINING_WORKERS_QTY
         while True:
             try:
-                LEARNER.train(train_iterations)
-                LEARNER.Q_TABLE.save(Q_TABLE_FILEPATH)
-                logging.info(f"Successfully train {train_iterations} iterations")
+                policy_changes_qty = LEARNER.policy_changes_qty
+                TRAINER.train(train_iterations)
+                CHECKPOINTER.request()
+                logging.info(
+                    f"Successfully train {train_iterations} iterations, "  # Fewer changes as the policy stabilizes
+                    f"{LEARNER.policy_changes_qty - policy_changes_qty} greedy actions changed\n{TRAINER.stats}\n"
+                    + "\n".join(
+                        f"Actor {index} {cache_stats}"  # Probabilities are calculated by actors, not by this process
+                        for index, actor_caches_stats in enumerate(TRAINER.actors_caches_stats)
+                        for cache_stats in actor_caches_stats
+                    )
+                )
             except Exception as ex:
                 logging.error("Unexpected error", exc_info=True)
     finally:
-        LEARNER.Q_TABLE.save(Q_TABLE_FILEPATH)
+        TRAINER.close()
+        CHECKPOINTER.request()
+        CHECKPOINTER.close()
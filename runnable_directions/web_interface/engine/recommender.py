@@ -5,7 +5,7 @@ from learning_engine.q_learning import QTable
 import os
 
 
-Q_TABLE = QTable.load(os.path.join("..", "q_table.tbjh"))
+Q_TABLE = QTable.load(os.path.join("..", "q_table.tbjh"), memory_mapped=True)
 AGENT = AgentForDefaultGameByQTable(Q_TABLE)
 
 
@@ -1,6 +1,6 @@
 from environment import probability_tools as prob
 from environment.base import Card, CardHand, CardDeck
-from environment.default_game import DefaultGameState
+from environment.default_game import DefaultGameState, calculate_rounded_dealer_busting_probability
 from functools import lru_cache
 
 
@@ -22,7 +22,7 @@ def get_game_state(player: tuple[Card, ...], dealer_open: Card,
     cards_deck = CardDeck.of(decks_qty, __get_remaining_cards(*used_cards, decks_qty=decks_qty))
     return DefaultGameState(
         player_cards_qty=len(player_hand),
-        player_cards_sum=sum(player_hand),
+        player_cards_sum=player_hand.best_sum,
         player_has_soft_hand=int(player_hand.is_soft),
         dealer_open_card=dealer_open.rank,
         player_busting_probability=DefaultGameState.round_probability(
@@ -31,7 +31,7 @@ def get_game_state(player: tuple[Card, ...], dealer_open: Card,
         dealer_cards_sum_less_than_17_probability=DefaultGameState.round_probability(
             prob.calculate_dealer_will_take_cards_probability(cards_deck, dealer_open)
         ),
-        dealer_busting_probability=DefaultGameState.round_probability(
-            prob.calculate_dealer_busting_probability(cards_deck, dealer_open)
+        dealer_busting_probability=calculate_rounded_dealer_busting_probability(
+            cards_deck, dealer_open, hit_on_soft_17=False,
         ),
     )
@@ -1,9 +1,16 @@
 from engine import type_changer, states_creator, recommender
+from environment import probability_atlas
 from flask import Flask, render_template, request
 import logging
+import os
 import secrets
 
 
+PROBABILITY_ATLAS_FILEPATH = os.path.join(  # Build by 'build_probability_atlas.py'
+    os.path.dirname(os.path.abspath(__file__)), "..", "probability_atlas.tbja",
+)
+
+
 logging.basicConfig(
     level=logging.INFO, filename=f"FrontendWeb.log", encoding="UTF-8", datefmt="%Y-%m-%d %H:%M:%S",
     format="'%(name)s':\n%(levelname)s %(asctime)s --> %(message)s"
@@ -12,6 +19,7 @@ logging.basicConfig(
 
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(32)  # Must be constant in production
+probability_atlas.load_active_atlas_if_exists(PROBABILITY_ATLAS_FILEPATH)
 
 
 @app.errorhandler(Exception)